@@ -1,4 +1,3 @@
-from knox.auth import TokenAuthentication
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -6,10 +5,11 @@ from rest_framework.views import APIView
 
 from account.schema import UserSchema
 from account.serializers import UserSerializer, WriteUserSerializer
+from api.authentication import CachedTokenAuthentication
 
 
 class UserView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     schema = UserSchema()
 
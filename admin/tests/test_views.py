@@ -206,6 +206,25 @@ class ClientMarketshareViewTestCase(APIViewTestCase):
             }],
         })
 
+    def test_return_client_marketshare_with_affiliates(self):
+        current_year = datetime.utcnow().year
+        affiliate, affiliate_2, other_client = ClientFactory.create_batch(3)
+        self.client_1.set_children([affiliate.id])
+        affiliate.set_children([affiliate_2.id])
+        product = ProductFactory(manufacturer=self.manufacturer_1)
+        for client, cost in ((self.client_1, 100), (affiliate, 200), (affiliate_2, 300), (other_client, 400)):
+            RepCaseFactory(client=client, procedure_date=date(current_year, 5, 1),
+                           items=[ItemFactory(device=DeviceFactory(client=client, product=product), cost=cost)])
+
+        response = self.authorized_client.get(self.path, {'affiliates': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['marketshare'], [{
+            'spend': '600.00', 'units': 3, 'name': self.manufacturer_1.display_name, 'id': self.manufacturer_1.id,
+        }])
+
+        response = self.authorized_client.get(self.path)
+        self.assertEqual(response.data['marketshare'][0]['spend'], '100.00')
+
 
 class TodayCasesAPIViewTestCase(APIViewTestCase):
     def setUp(self):
@@ -391,6 +410,61 @@ class BulkAPIViewTestCase(APIViewTestCase):
             'expired': 1,       # yesterday
         })
 
+    def test_return_bulk_inventory_info_by_horizons_and_group(self):
+        today = datetime.utcnow().date()
+        manufacturer_1, manufacturer_2 = ManufacturerFactory.create_batch(2)
+        device_1 = DeviceFactory(client=self.client_1, product=ProductFactory(manufacturer=manufacturer_1))
+        device_2 = DeviceFactory(client=self.client_1, product=ProductFactory(manufacturer=manufacturer_2))
+        ItemFactory(device=device_1, purchase_type=BULK_PURCHASE, expired_date=today - timedelta(days=1))
+        ItemFactory.create_batch(2, device=device_1, purchase_type=BULK_PURCHASE, expired_date=today)
+        ItemFactory(device=device_1, purchase_type=BULK_PURCHASE, expired_date=today + timedelta(days=10))
+        ItemFactory(device=device_2, purchase_type=BULK_PURCHASE, expired_date=today + timedelta(days=80))
+        ItemFactory(device=device_2, purchase_type=BULK_PURCHASE, expired_date=today + timedelta(days=120))
+        ItemFactory(device=device_2, purchase_type=BULK_PURCHASE, expired_date=today + timedelta(days=5), is_used=True)
+        ItemFactory(device=device_2, purchase_type=CONSIGNMENT_PURCHASE, expired_date=today)
+
+        response = self.authorized_client.get(self.path)
+        self.assertDictEqual(response.data, {'available': 6, 'expired': 1, 'expiring30': 3, 'expiring60': 0})
+
+        response = self.authorized_client.get(self.path, {'horizons': '90,7,14,invalid'})
+        self.assertDictEqual(response.data, {'available': 6, 'expired': 1, 'expiring30': 3, 'expiring60': 0})
+
+        with self.assertNumQueries(2):
+            response = self.authorized_client.get(self.path, {'horizons': '90,7,14', 'group_by': 'manufacturer'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertCountEqual(response.data, [{
+            'id': manufacturer_1.id,
+            'name': manufacturer_1.name,
+            'available': 4,
+            'expired': 1,
+            'expiring7': 2,
+            'expiring14': 1,
+            'expiring90': 0,
+        }, {
+            'id': manufacturer_2.id,
+            'name': manufacturer_2.name,
+            'available': 2,
+            'expired': 0,
+            'expiring7': 0,
+            'expiring14': 0,
+            'expiring90': 1,
+        }])
+
+        response = self.authorized_client.get(self.path, {'horizons': '30', 'group_by': 'device'})
+        self.assertCountEqual(response.data, [{
+            'id': device_1.id,
+            'name': device_1.product.name,
+            'available': 4,
+            'expired': 1,
+            'expiring30': 3,
+        }, {
+            'id': device_2.id,
+            'name': device_2.product.name,
+            'available': 2,
+            'expired': 0,
+            'expiring30': 0,
+        }])
+
 
 class PhysiciansAPIViewTestCase(APIViewTestCase):
     def setUp(self):
@@ -1,23 +1,24 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 
-from knox.auth import TokenAuthentication
 from knox.views import LoginView
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from api.authentication import CredentialsAuthentication
+from api.authentication import CachedTokenAuthentication, CredentialsAuthentication
+from api.pagination import ListResponseMixin
 from api.schema import LoginSchema
 
-from device.serializers import MarketshareSerializer
-from hospital.constants import BULK_PURCHASE, RolePriority
+from device.serializers import FastMarketshareSerializer
+from hospital.constants import EXPIRY_GROUPS, EXPIRY_HORIZONS, EXPIRY_MAX_HORIZONS, RolePriority
 from hospital.models import Client, Item
 from hospital.permissions import HasAdminAccess, IsClientAdmin
 from hospital.serializers import PhysicianSerializer
 from order.models import Order
 from order.serializers import OrderSummarySerializer
-from tracker.serializers import RepcaseItemSerializer, SavingsSerializer
+from tracker.models import ItemRollup
+from tracker.serializers import FastRepcaseItemSerializer, FastSavingsSerializer
 
 
 class AdminLoginAPIView(LoginView):
@@ -31,9 +32,17 @@ class AdminLoginAPIView(LoginView):
 
 
 class AdminAPIView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated, IsClientAdmin)
 
+    def get_client_rollups(self, client):
+        """
+        Item rollups of the client, along with rollups of all its affiliates with ?affiliates=1.
+        """
+        if self.request.query_params.get('affiliates'):
+            return ItemRollup.objects.used_by_client_tree(client)
+        return ItemRollup.objects.used_by_client(client)
+
 
 class OrderSummaryBySpecialtyListAPIView(AdminAPIView):
     def get(self, request, client_id):
@@ -59,15 +68,15 @@ class ClientMarketshareAPIView(AdminAPIView):
     def get(self, request, client_id):
         client = get_object_or_404(Client, pk=client_id)
         year = datetime.utcnow().year
-        annual_marketshare = Item.objects.used_by_client(client).used_in_period(year).marketshare()
+        annual_marketshare = self.get_client_rollups(client).used_in_period(year).marketshare()
 
         return Response({
             'name': f'{year} Year to Date',
-            'marketshare': MarketshareSerializer(annual_marketshare, many=True).data
+            'marketshare': FastMarketshareSerializer(annual_marketshare, many=True).data
         })
 
 
-class TodayCasesAPIView(AdminAPIView):
+class TodayCasesAPIView(ListResponseMixin, AdminAPIView):
     def get(self, request, client_id):
         """
         List today's cases at current client
@@ -80,7 +89,7 @@ class TodayCasesAPIView(AdminAPIView):
             'device__product__category',
             'device__product',
         )
-        return Response(RepcaseItemSerializer(items, many=True).data)
+        return self.list_response(items, FastRepcaseItemSerializer)
 
 
 class SavingsAPIView(AdminAPIView):
@@ -93,29 +102,41 @@ class SavingsAPIView(AdminAPIView):
         except ValueError:
             given_year = datetime.utcnow().year
         client = get_object_or_404(Client, pk=client_id)
-        items = Item.objects.used_by_client(client)
-        savings = items.savings_by_month(given_year)
-        return Response(SavingsSerializer(savings, many=True).data)
+        savings = self.get_client_rollups(client).savings_by_month(given_year)
+        return Response(FastSavingsSerializer(savings, many=True).data)
 
 
 class BulkAPIView(AdminAPIView):
     def get(self, request, client_id):
         """
-        Bulk inventory info for current user
+        Bulk inventory info for current user.
+        Items expiring are counted up to each of ?horizons=<days>,<days>,... and grouped by
+        ?group_by=manufacturer|category|device.
         """
         client = get_object_or_404(Client, pk=client_id)
-        unused_bulk_items = client.items.filter(is_used=False, purchase_type=BULK_PURCHASE)
+        unused_bulk_items = Item.objects.filter(device__client=client).unused_bulk()
+        horizons = self.get_horizons(request.query_params.get('horizons'))
         today = datetime.utcnow().date()
-        expiring60_date = today + timedelta(days=60)
-        expiring30_date = today + timedelta(days=30)
-        return Response({
-            'available': unused_bulk_items.count(),
-            'expiring60': unused_bulk_items.filter(expired_date__lt=expiring60_date,
-                                                   expired_date__gte=expiring30_date).count(),
-            'expiring30': unused_bulk_items.filter(expired_date__lt=expiring30_date,
-                                                   expired_date__gte=today).count(),
-            'expired': unused_bulk_items.filter(expired_date__lt=today).count(),
-        })
+        group = EXPIRY_GROUPS.get(request.query_params.get('group_by'))
+        if not group:
+            return Response(unused_bulk_items.expiry_buckets(horizons, today))
+
+        id_field, name_field = group
+        buckets = []
+        for bucket in unused_bulk_items.expiry_buckets(horizons, today, group_by=group):
+            id, name = bucket.pop(id_field), bucket.pop(name_field)
+            buckets.append(dict(id=id, name=name, **bucket))
+        return Response(buckets)
+
+    @staticmethod
+    def get_horizons(horizons):
+        try:
+            days = set(int(day) for day in horizons.split(','))
+        except (AttributeError, ValueError):
+            return EXPIRY_HORIZONS
+        if not days or len(days) > EXPIRY_MAX_HORIZONS or min(days) <= 0:
+            return EXPIRY_HORIZONS
+        return sorted(days)
 
 
 class PhysiciansAPIView(AdminAPIView):
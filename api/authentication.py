@@ -1,9 +1,20 @@
+import binascii
+from hmac import compare_digest
+
 from django.contrib.auth import authenticate
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from knox.auth import TokenAuthentication
+from knox.crypto import hash_token
+from knox.models import AuthToken
+from knox.settings import CONSTANTS
 
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import MethodNotAllowed, AuthenticationFailed
 
+from api.cache import get_cached_auth_token, cache_auth_token
+from api.models import AuthTokenUsage
+
 
 class CredentialsAuthentication(BaseAuthentication):
     """
@@ -37,3 +48,41 @@ class CredentialsAuthentication(BaseAuthentication):
             raise AuthenticationFailed(_('Invalid email/password.'))
 
         return user, None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Knox token authentication with verified tokens cached by digest,
+    so repeated requests skip both the token lookup and the token hashing.
+    """
+    def authenticate_credentials(self, token):
+        token = token.decode('utf-8')
+        cached_auth_token = get_cached_auth_token(token)
+        if cached_auth_token:
+            digest, user, expires = cached_auth_token
+            auth_token = AuthToken(digest=digest, token_key=token[:CONSTANTS.TOKEN_KEY_LENGTH], user=user,
+                                   expires=expires)
+            return self.validate_user(auth_token)
+
+        user, auth_token = self.verify_token(token)
+        cache_auth_token(token, auth_token)
+        AuthTokenUsage.objects.update_or_create(auth_token=auth_token, defaults={'last_used': timezone.now()})
+        return user, auth_token
+
+    def verify_token(self, token):
+        """
+        Verify the token against unexpired auth tokens sharing its key, expired ones are left to compaction.
+        """
+        now = timezone.now()
+        auth_tokens = AuthToken.objects.filter(token_key=token[:CONSTANTS.TOKEN_KEY_LENGTH]).select_related('user')
+        for auth_token in auth_tokens:
+            if auth_token.expires is not None and auth_token.expires < now:
+                continue
+            try:
+                digest = hash_token(token, auth_token.salt)
+            except (TypeError, binascii.Error):
+                raise AuthenticationFailed(_('Invalid token.'))
+            if compare_digest(digest, auth_token.digest):
+                return self.validate_user(auth_token)
+
+        raise AuthenticationFailed(_('Invalid token.'))
@@ -0,0 +1,61 @@
+from hashlib import sha256
+
+from django.core.cache import caches
+from django.utils import timezone
+
+from api.constants import AUTH_TOKEN_CACHE_ALIAS, AUTH_TOKEN_KEY_PREFIX, AUTH_TOKEN_PREFIX, \
+    AUTH_TOKEN_LOCAL_CACHE_TIMEOUT
+from neptune.utils import is_process_local_cache
+
+
+def get_auth_token_cache():
+    return caches[AUTH_TOKEN_CACHE_ALIAS]
+
+
+def get_auth_token_cache_timeout(cache):
+    """
+    Tokens revoked in another process are still accepted by a process-local cache until their entries expire,
+    so such a cache keeps them for AUTH_TOKEN_LOCAL_CACHE_TIMEOUT seconds at most.
+    """
+    if is_process_local_cache(cache):
+        return min(cache.default_timeout, AUTH_TOKEN_LOCAL_CACHE_TIMEOUT)
+    return cache.default_timeout
+
+
+def token_cache_key(token):
+    return f'{AUTH_TOKEN_KEY_PREFIX}:{sha256(token.encode()).hexdigest()}'
+
+
+def auth_token_cache_key(digest):
+    return f'{AUTH_TOKEN_PREFIX}:{digest}'
+
+
+def get_cached_auth_token(token):
+    """
+    Digest, user and expiry of a verified token, or None when it has to be verified against the database.
+    """
+    cache = get_auth_token_cache()
+    digest = cache.get(token_cache_key(token))
+    verified_token = digest and cache.get(auth_token_cache_key(digest))
+    if not verified_token:
+        return None
+
+    user, expires = verified_token
+    if expires is not None and expires < timezone.now():
+        return None
+    return digest, user, expires
+
+
+def cache_auth_token(token, auth_token):
+    cache = get_auth_token_cache()
+    timeout = get_auth_token_cache_timeout(cache)
+    if auth_token.expires is not None:
+        timeout = min(timeout, (auth_token.expires - timezone.now()).total_seconds())
+    cache.set_many({
+        token_cache_key(token): auth_token.digest,
+        auth_token_cache_key(auth_token.digest): (auth_token.user, auth_token.expires),
+    }, timeout)
+
+
+def invalidate_auth_tokens(*digests):
+    get_auth_token_cache().delete_many([auth_token_cache_key(digest) for digest in digests])
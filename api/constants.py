@@ -0,0 +1,6 @@
+AUTH_TOKEN_CACHE_ALIAS = 'auth-tokens'
+AUTH_TOKEN_KEY_PREFIX = 'auth-token-key'
+AUTH_TOKEN_PREFIX = 'auth-token'
+AUTH_TOKEN_LOCAL_CACHE_TIMEOUT = 10
+
+UNUSED_AUTH_TOKEN_DAYS = 90
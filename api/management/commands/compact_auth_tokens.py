@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from knox.models import AuthToken
+
+from api.constants import UNUSED_AUTH_TOKEN_DAYS
+
+
+class Command(BaseCommand):
+    help = 'Delete expired auth tokens and tokens unused for a number of days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=UNUSED_AUTH_TOKEN_DAYS,
+                            help='Delete tokens unused for this many days')
+        parser.add_argument('--vacuum', action='store_true', help='Vacuum and analyze the token table afterwards')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        unused_since = now - timedelta(days=options['days'])
+        auth_tokens = AuthToken.objects.filter(
+            Q(expires__lt=now) |
+            Q(usage__last_used__lt=unused_since) |
+            Q(usage__isnull=True, created__lt=unused_since)
+        )
+        deleted, deleted_by_model = auth_tokens.delete()
+        print(f'Deleted {deleted_by_model.get(AuthToken._meta.label, 0)} auth tokens')
+
+        if options['vacuum'] and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'VACUUM ANALYZE {AuthToken._meta.db_table}')
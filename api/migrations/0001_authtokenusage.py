@@ -0,0 +1,35 @@
+# Generated by Django 2.0.9 on 2026-10-18 07:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def fill_last_used(apps, schema_editor):
+    AuthToken = apps.get_model('knox', 'AuthToken')
+    AuthTokenUsage = apps.get_model('api', 'AuthTokenUsage')
+    now = timezone.now()
+    AuthTokenUsage.objects.bulk_create(
+        AuthTokenUsage(auth_token_id=digest, last_used=now)
+        for digest in AuthToken.objects.values_list('digest', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('knox', '0006_auto_20160818_0932'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthTokenUsage',
+            fields=[
+                ('auth_token', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usage', serialize=False, to='knox.AuthToken')),
+                ('last_used', models.DateTimeField(db_index=True, verbose_name='Last used')),
+            ],
+        ),
+        migrations.RunPython(fill_last_used, migrations.RunPython.noop),
+    ]
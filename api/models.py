@@ -0,0 +1,11 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class AuthTokenUsage(models.Model):
+    auth_token = models.OneToOneField('knox.AuthToken', on_delete=models.CASCADE, primary_key=True,
+                                      related_name='usage')
+    last_used = models.DateTimeField(_('Last used'), db_index=True)
+
+    def __str__(self):
+        return f'{self.auth_token_id[:8]} last used at {self.last_used}'
@@ -0,0 +1,55 @@
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination on the primary key, enabled by the page_size query parameter.
+    """
+    ordering = 'id'
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+def stream_json(queryset, serializer_class, chunk_size):
+    """
+    Render the queryset as a JSON array, serializing chunks fetched by primary key ranges.
+    """
+    yield '['
+    separator = ''
+    last_id = None
+    while True:
+        chunk_queryset = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        objects = list(chunk_queryset[:chunk_size])
+        for data in serializer_class(objects, many=True).data:
+            yield separator + json.dumps(data, cls=JSONEncoder)
+            separator = ','
+        if len(objects) < chunk_size:
+            break
+        last_id = objects[-1].id
+    yield ']'
+
+
+class ListResponseMixin(object):
+    """
+    List responses served in full, paginated by cursor with ?page_size= or streamed with ?stream=1.
+    """
+    pagination_class = KeysetPagination
+    stream_chunk_size = 500
+
+    def list_response(self, queryset, serializer_class):
+        queryset = queryset.order_by('id')
+        if self.request.query_params.get('stream'):
+            return StreamingHttpResponse(stream_json(queryset, serializer_class, self.stream_chunk_size),
+                                         content_type='application/json')
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        if page is None:
+            return Response(serializer_class(queryset, many=True).data)
+        return paginator.get_paginated_response(serializer_class(page, many=True).data)
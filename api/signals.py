@@ -0,0 +1,19 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from knox.models import AuthToken
+
+from api.cache import invalidate_auth_tokens
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=AuthToken)
+def invalidate_deleted_auth_token(sender, instance, **kwargs):
+    invalidate_auth_tokens(instance.digest)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_auth_tokens(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_auth_tokens(*instance.auth_token_set.values_list('digest', flat=True))
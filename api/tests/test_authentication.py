@@ -0,0 +1,58 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+from knox.models import AuthToken
+from rest_framework.exceptions import AuthenticationFailed
+
+from account.factories import UserFactory
+from api.authentication import CachedTokenAuthentication
+from api.cache import get_auth_token_cache
+from api.constants import AUTH_TOKEN_LOCAL_CACHE_TIMEOUT
+from api.models import AuthTokenUsage
+
+
+class CachedTokenAuthenticationTestCase(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.token = AuthToken.objects.create(self.user)
+        self.authentication = CachedTokenAuthentication()
+
+    def test_authenticate_credentials_caches_verified_token(self):
+        user, auth_token = self.authentication.authenticate_credentials(self.token.encode())
+        self.assertEqual(user, self.user)
+        self.assertEqual(AuthTokenUsage.objects.get().auth_token, auth_token)
+
+        with self.assertNumQueries(0):
+            cached_user, cached_auth_token = self.authentication.authenticate_credentials(self.token.encode())
+        self.assertEqual(cached_user, self.user)
+        self.assertEqual(cached_auth_token.digest, auth_token.digest)
+
+    def test_process_local_cache_keeps_verified_token_briefly(self):
+        cache = get_auth_token_cache()
+        with patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            self.authentication.authenticate_credentials(self.token.encode())
+        self.assertEqual(set_many.call_args[0][1], AUTH_TOKEN_LOCAL_CACHE_TIMEOUT)
+
+    def test_authenticate_credentials_after_token_deleted(self):
+        self.authentication.authenticate_credentials(self.token.encode())
+        self.user.auth_token_set.all().delete()
+        with self.assertRaisesMessage(AuthenticationFailed, 'Invalid token.'):
+            self.authentication.authenticate_credentials(self.token.encode())
+
+    def test_authenticate_credentials_after_user_deactivated(self):
+        self.authentication.authenticate_credentials(self.token.encode())
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaisesMessage(AuthenticationFailed, 'User inactive or deleted.'):
+            self.authentication.authenticate_credentials(self.token.encode())
+
+    def test_authenticate_credentials_skips_expired_token(self):
+        token = AuthToken.objects.create(self.user, expires=timedelta(seconds=-1))
+        with self.assertRaisesMessage(AuthenticationFailed, 'Invalid token.'):
+            self.authentication.authenticate_credentials(token.encode())
+
+        AuthToken.objects.filter(expires__isnull=False).update(expires=timezone.now() + timedelta(days=1))
+        user, auth_token = self.authentication.authenticate_credentials(token.encode())
+        self.assertEqual(user, self.user)
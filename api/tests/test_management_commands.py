@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from knox.models import AuthToken
+
+from account.factories import UserFactory
+from api.models import AuthTokenUsage
+
+
+class CompactAuthTokensCommandTestCase(TestCase):
+    def test_compact_auth_tokens(self):
+        user = UserFactory()
+        now = timezone.now()
+        for _ in range(5):
+            AuthToken.objects.create(user)
+        expired, unused, never_used, used, new = AuthToken.objects.order_by('salt')
+        AuthToken.objects.filter(pk=expired.pk).update(expires=now - timedelta(days=1))
+        AuthToken.objects.filter(pk=never_used.pk).update(created=now - timedelta(days=100))
+        AuthTokenUsage.objects.create(auth_token=unused, last_used=now - timedelta(days=91))
+        AuthTokenUsage.objects.create(auth_token=used, last_used=now - timedelta(days=89))
+
+        call_command('compact_auth_tokens')
+        self.assertCountEqual(AuthToken.objects.values_list('pk', flat=True), [used.pk, new.pk])
+
+        call_command('compact_auth_tokens', days=30)
+        self.assertCountEqual(AuthToken.objects.values_list('pk', flat=True), [new.pk])
@@ -1,6 +1,6 @@
 from knox.views import LoginView, LogoutView, LogoutAllView
 
-from api.authentication import CredentialsAuthentication
+from api.authentication import CachedTokenAuthentication, CredentialsAuthentication
 from api.schema import LoginSchema
 from hospital.permissions import HasPhysicianAccess
 
@@ -20,6 +20,7 @@ class LogoutAPIView(LogoutView):
     post:
     Log the user out of session of current token
     """
+    authentication_classes = (CachedTokenAuthentication,)
 
 
 class LogoutAllAPIView(LogoutAllView):
@@ -27,3 +28,4 @@ class LogoutAllAPIView(LogoutAllView):
     post:
     Log the user out of all sessions
     """
+    authentication_classes = (CachedTokenAuthentication,)
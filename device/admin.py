@@ -15,7 +15,7 @@ from easy_select2 import apply_select2
 from import_export.admin import ImportExportModelAdmin
 
 from device.forms import CategoryForm, ProductForm
-from device.models import Category, Specialty, Product, Manufacturer, Feature, CategoryFeature
+from device.models import Category, CategoryAncestor, Specialty, Product, Manufacturer, Feature, CategoryFeature
 from device.resources import ProductResource
 from hospital.constants import BULK_PURCHASE, CONSIGNMENT_PURCHASE
 from hospital.models import Device, Item
@@ -89,6 +89,7 @@ class CategoryAdmin(admin.ModelAdmin):
         children_ids = form.cleaned_data.get('sub_categories')
         if children_ids is not None:
             obj.sub_categories.set(Category.objects.filter(id__in=children_ids))
+            CategoryAncestor.rebuild([obj.id] + [int(child_id) for child_id in children_ids])
 
 
 class ClientPricesInline(admin.StackedInline):
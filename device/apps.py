@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class DeviceConfig(AppConfig):
     name = 'device'
+
+    def ready(self):
+        import device.signals  # noqa: F401
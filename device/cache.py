@@ -0,0 +1,80 @@
+from hashlib import md5
+
+from django.apps import apps
+from django.core.cache import caches
+
+from device.constants import CATALOG_CACHE_ALIAS, CATALOG_VERSION_KEY, CATALOG_HITS_KEY, CATALOG_MISSES_KEY
+
+
+def get_catalog_cache():
+    return caches[CATALOG_CACHE_ALIAS]
+
+
+def client_catalog_version_key(client_id):
+    return f'{CATALOG_VERSION_KEY}:client:{client_id}'
+
+
+def get_catalog_version_model():
+    return apps.get_model(app_label='device', model_name='catalogversion')
+
+
+def get_catalog_versions(client_id=None):
+    """
+    Global and client catalog versions, as timestamps of their last change, 0 before the first one.
+    """
+    version_keys = [CATALOG_VERSION_KEY]
+    if client_id is not None:
+        version_keys.append(client_catalog_version_key(client_id))
+    versions = get_catalog_version_model().get_many(version_keys)
+    return [versions[version_key].timestamp() if version_key in versions else 0 for version_key in version_keys]
+
+
+def get_catalog_etag(*scope, client_id=None):
+    versions = ':'.join(str(version) for version in get_catalog_versions(client_id))
+    return md5(':'.join(str(part) for part in scope + (client_id, versions)).encode()).hexdigest()
+
+
+def product_list_cache_key(client_id, category_id, sub_categories=False):
+    global_version, client_version = get_catalog_versions(client_id)
+    return f'catalog:{client_id}:{category_id}:{int(bool(sub_categories))}:products:{global_version}:{client_version}'
+
+
+def get_product_list(client_id, category_id, sub_categories, build_product_list):
+    """
+    Serialized product list of a category at a client, built by build_product_list on cache miss.
+    Returns (product list, whether it was served from cache).
+    """
+    cache = get_catalog_cache()
+    cache_key = product_list_cache_key(client_id, category_id, sub_categories)
+    product_list = cache.get(cache_key)
+    hit = product_list is not None
+    _increment(CATALOG_HITS_KEY if hit else CATALOG_MISSES_KEY)
+    if not hit:
+        product_list = build_product_list()
+        cache.set(cache_key, product_list, None)
+    return product_list, hit
+
+
+def invalidate_catalog(client_id=None):
+    """
+    Drop cached catalog responses of a client, or of all clients.
+    """
+    version_key = CATALOG_VERSION_KEY if client_id is None else client_catalog_version_key(client_id)
+    get_catalog_version_model().bump(version_key)
+
+
+def get_catalog_cache_stats():
+    counters = get_catalog_cache().get_many([CATALOG_HITS_KEY, CATALOG_MISSES_KEY])
+    return {
+        'hits': counters.get(CATALOG_HITS_KEY, 0),
+        'misses': counters.get(CATALOG_MISSES_KEY, 0),
+    }
+
+
+def _increment(counter_key):
+    cache = get_catalog_cache()
+    if not cache.add(counter_key, 1, None):
+        try:
+            cache.incr(counter_key)
+        except ValueError:
+            cache.set(counter_key, 1, None)
@@ -27,3 +27,26 @@ class ProductLevel(Enum):
 
 
 MAX_SUB_CATEGORIES_LEVEL = 5
+
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_VERSION_KEY = 'catalog-version'
+CATALOG_HITS_KEY = 'catalog-hits'
+CATALOG_MISSES_KEY = 'catalog-misses'
+
+CATALOG_CHANGE_CREATED = 1
+CATALOG_CHANGE_UPDATED = 2
+CATALOG_CHANGE_DELETED = 3
+CATALOG_CHANGE_ACTIONS = (
+    (CATALOG_CHANGE_CREATED, _('Created')),
+    (CATALOG_CHANGE_UPDATED, _('Updated')),
+    (CATALOG_CHANGE_DELETED, _('Deleted')),
+)
+
+CATALOG_CHANGE_MODELS = (
+    ('product', _('Product')),
+    ('feature', _('Feature')),
+    ('clientprice', _('Client price')),
+    ('discount', _('Discount')),
+)
+
+CATALOG_CHANGE_RETENTION_DAYS = 30
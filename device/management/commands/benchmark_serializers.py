@@ -0,0 +1,55 @@
+from decimal import Decimal
+from timeit import repeat
+
+from django.core.management import BaseCommand
+
+from device.models import CategoryFeature, Feature, Manufacturer, Product
+from device.serializers import FastProductSerializer, ProductSerializer
+from price.constants import ON_DOCTOR_ORDER, PERCENT_DISCOUNT, VALUE_DISCOUNT
+from price.models import ClientPrice, Discount
+
+
+class Command(BaseCommand):
+    help = 'Compare ProductSerializer and FastProductSerializer on in-memory prefetched products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        products = self.build_products(options['products'])
+        timings = {}
+        for serializer_class in (ProductSerializer, FastProductSerializer):
+            timings[serializer_class] = min(repeat(
+                lambda: serializer_class(products, many=True, context={'client_inventory_bulk_discounts': {}}).data,
+                number=1, repeat=options['repeat']
+            ))
+            print(f'{serializer_class.__name__}: {timings[serializer_class] * 1000:.1f}ms')
+        print(f'Speedup: {timings[ProductSerializer] / timings[FastProductSerializer]:.1f}x')
+
+    @staticmethod
+    def build_products(count):
+        manufacturers = [Manufacturer(id=index, name=f'Manufacturer {index}', short_name=f'M{index}')
+                         for index in range(1, 11)]
+        category_features = [CategoryFeature(id=index, name=f'Feature {index}') for index in range(1, 6)]
+        products = []
+        for index in range(1, count + 1):
+            product = Product(id=index, name=f'Product {index}', level=index % 3, model_number=f'MN-{index}',
+                              manufacturer=manufacturers[index % len(manufacturers)])
+            product.bulk = index % 4
+            product.features = [
+                Feature(id=index * 10 + feature_index, name=category_feature.name, value=str(feature_index),
+                        category_feature=category_feature)
+                for feature_index, category_feature in enumerate(category_features)
+            ]
+            client_price = ClientPrice(id=index, unit_cost=Decimal('1200.50'), system_cost=Decimal('3400.00'))
+            client_price.unit_discounts = [
+                Discount(id=index * 10 + 1, name='CCO', order=1, discount_type=VALUE_DISCOUNT, value=Decimal('50'),
+                         percent=Decimal('0'), apply_type=ON_DOCTOR_ORDER),
+                Discount(id=index * 10 + 2, name='Repless', order=2, discount_type=PERCENT_DISCOUNT,
+                         value=Decimal('0'), percent=Decimal('12.5'), apply_type=ON_DOCTOR_ORDER),
+            ]
+            client_price.system_discounts = client_price.unit_discounts[1:]
+            product.client_prices = [client_price]
+            products.append(product)
+        return products
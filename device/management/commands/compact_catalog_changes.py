@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from device.models import CatalogChange
+
+
+class Command(BaseCommand):
+    help = 'Delete catalog changes older than the retention period or superseded by a later change'
+
+    def handle(self, *args, **options):
+        deleted = CatalogChange.compact()
+        print(f'Deleted {deleted} catalog changes')
@@ -1,4 +1,5 @@
 from django.db.models import Count, Q, QuerySet, Prefetch
+from django.db.models.expressions import RawSQL
 
 from hospital.constants import BULK_PURCHASE
 from price.constants import ON_DOCTOR_ORDER, PRE_DOCTOR_ORDER, UNIT_COST, SYSTEM_COST
@@ -13,6 +14,21 @@ class ProductQuerySet(QuerySet):
                                                 device__item__purchase_type=BULK_PURCHASE)),
         )
 
+    def in_category_tree(self, category_ids):
+        from device.models import CategoryAncestor
+
+        sub_category_ids = CategoryAncestor.objects.filter(ancestor_id__in=category_ids).values('category_id')
+        return self.filter(Q(category_id__in=category_ids) | Q(category_id__in=sub_category_ids))
+
+    def prefetch_catalog(self, client):
+        """
+        Products with everything ProductSerializer needs for the physician catalog of a client.
+        """
+        return self.prefetch_price_with_discounts(client, discount_apply_types=[ON_DOCTOR_ORDER]) \
+            .prefetch_features() \
+            .select_related('manufacturer') \
+            .unused_bulk_items_count_by_client(client)
+
     def prefetch_features(self):
         from device.models import Feature
 
@@ -47,3 +63,37 @@ class ProductQuerySet(QuerySet):
                 ),
             )
         )
+
+
+class CatalogChangeQuerySet(QuerySet):
+    def for_client(self, client_id):
+        return self.filter(Q(client_id=client_id) | Q(client__isnull=True))
+
+    def bulk_create(self, objs, batch_size=None):
+        """
+        Log changes along with the id of the current transaction.
+        """
+        objs = list(objs)
+        for change in objs:
+            change.txid = RawSQL('txid_current()', [])
+        return super().bulk_create(objs, batch_size=batch_size)
+
+    def latest_actions(self, since=(0, 0)):
+        """
+        Last change action of every object changed since the (watermark, last change id) sync position,
+        by (model, object_id), along with the current sync position.
+        Changes of transactions ended between both watermarks are read, as well as changes logged after the last
+        change id by the current transaction or by transactions ended below the current watermark.
+        Changes of transactions still running are left for the next sync.
+        """
+        since_watermark, since_id = since
+        (watermark, last_id), own_txid = self.model.get_sync_position()
+        committed = Q(txid__lt=watermark)
+        if own_txid is not None:
+            committed |= Q(txid=own_txid)
+        changes = Q(txid__gte=since_watermark, txid__lt=watermark) | (Q(id__gt=since_id) & committed)
+
+        actions = {}
+        for model, object_id, action in self.filter(changes).order_by('id').values_list('model', 'object_id', 'action'):
+            actions[(model, object_id)] = action
+        return actions, (watermark, last_id)
@@ -0,0 +1,49 @@
+# Generated by Django 2.0.9 on 2026-10-18 07:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+MAX_SUB_CATEGORIES_LEVEL = 5
+
+
+def build_category_ancestors(apps, schema_editor):
+    Category = apps.get_model('device', 'Category')
+    CategoryAncestor = apps.get_model('device', 'CategoryAncestor')
+    parent_ids = dict(Category.objects.values_list('id', 'parent_id'))
+    category_ancestors = []
+    for category_id in parent_ids:
+        ancestor_ids = set()
+        ancestor_id = parent_ids.get(category_id)
+        depth = 1
+        while ancestor_id and depth <= MAX_SUB_CATEGORIES_LEVEL:
+            if ancestor_id not in ancestor_ids:
+                ancestor_ids.add(ancestor_id)
+                category_ancestors.append(CategoryAncestor(category_id=category_id, ancestor_id=ancestor_id,
+                                                           depth=depth))
+            ancestor_id = parent_ids.get(ancestor_id)
+            depth += 1
+    CategoryAncestor.objects.bulk_create(category_ancestors)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0024_auto_20180830_0357'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryAncestor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='device.Category')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='device.Category')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='categoryancestor',
+            unique_together={('category', 'ancestor')},
+        ),
+        migrations.RunPython(build_category_ancestors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.0.9 on 2026-10-18 07:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0039_item_saving'),
+        ('device', '0025_categoryancestor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(choices=[('product', 'Product'), ('feature', 'Feature'), ('clientprice', 'Client price'), ('discount', 'Discount')], max_length=32)),
+                ('object_id', models.PositiveIntegerField()),
+                ('action', models.PositiveSmallIntegerField(choices=[(1, 'Created'), (2, 'Updated'), (3, 'Deleted')])),
+                ('changed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='hospital.Client')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='catalogchange',
+            index=models.Index(fields=['client', 'id'], name='device_cata_client__8c14b6_idx'),
+        ),
+    ]
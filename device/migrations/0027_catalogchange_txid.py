@@ -0,0 +1,18 @@
+# Generated by Django 2.0.9 on 2026-10-18 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0026_catalogchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogchange',
+            name='txid',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+    ]
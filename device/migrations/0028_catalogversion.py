@@ -0,0 +1,20 @@
+# Generated by Django 2.0.9 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0027_catalogchange_txid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('changed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1,11 +1,16 @@
+from datetime import timedelta
 from functools import partial
+from time import time
 
-from django.db import models
+from django.db import connection, models
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
-from device.constants import ProductLevel, MAX_SUB_CATEGORIES_LEVEL
-from device.managers import ProductQuerySet
+from device.constants import ProductLevel, MAX_SUB_CATEGORIES_LEVEL, CATALOG_CHANGE_ACTIONS, CATALOG_CHANGE_MODELS, \
+    CATALOG_CHANGE_RETENTION_DAYS
+from device.managers import CatalogChangeQuerySet, ProductQuerySet
 from neptune.models import SharedImage
 from neptune.utils import make_imagefield_filepath
 
@@ -34,18 +39,24 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__original_parent_id = self.__dict__.get('parent_id')
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding or self.parent_id != self.__original_parent_id:
+            CategoryAncestor.rebuild([self.id])
+        self.__original_parent_id = self.parent_id
+
     @classmethod
     def get_all_parent_categories(cls, category_ids):
-        categories = Category.objects.filter(id__in=category_ids).all()
-        sub_categories_level = 0
-        all_parent_category_ids = []
-        parent_categories = cls.get_parent_categories(categories)
-        while (parent_categories.count() > 0) and (sub_categories_level < MAX_SUB_CATEGORIES_LEVEL):
-            sub_categories_level += 1
-            all_parent_category_ids += list(parent_categories.values_list('id', flat=True))
-            parent_categories = cls.get_parent_categories(parent_categories)
+        return cls.objects.filter(descendant_links__category_id__in=category_ids).distinct().all()
 
-        return cls.objects.filter(id__in=all_parent_category_ids).distinct().all()
+    @classmethod
+    def get_all_sub_categories(cls, category_ids):
+        return cls.objects.filter(ancestor_links__ancestor_id__in=category_ids).distinct().all()
 
     @classmethod
     def get_parent_categories(cls, categories):
@@ -53,6 +64,47 @@ class Category(models.Model):
         return cls.objects.filter(id__in=parent_ids).distinct().all()
 
 
+class CategoryAncestor(models.Model):
+    """
+    Closure of Category.parent up to MAX_SUB_CATEGORIES_LEVEL levels.
+    """
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='ancestor_links')
+    ancestor = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='descendant_links')
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ('category', 'ancestor')
+
+    @classmethod
+    def build_links(cls, parent_ids, category_ids):
+        for category_id in category_ids:
+            ancestor_ids = set()
+            ancestor_id = parent_ids.get(category_id)
+            depth = 1
+            while ancestor_id and depth <= MAX_SUB_CATEGORIES_LEVEL:
+                if ancestor_id not in ancestor_ids:
+                    ancestor_ids.add(ancestor_id)
+                    yield cls(category_id=category_id, ancestor_id=ancestor_id, depth=depth)
+                ancestor_id = parent_ids.get(ancestor_id)
+                depth += 1
+
+    @classmethod
+    def rebuild(cls, category_ids=None):
+        """
+        Rebuild ancestors of given categories and their sub categories, or of all categories.
+        """
+        parent_ids = dict(Category.objects.values_list('id', 'parent_id'))
+        if category_ids is None:
+            category_ids = set(parent_ids)
+            cls.objects.all().delete()
+        else:
+            category_ids = set(category_ids).union(
+                cls.objects.filter(ancestor_id__in=category_ids).values_list('category_id', flat=True)
+            ).intersection(parent_ids)
+            cls.objects.filter(category_id__in=category_ids).delete()
+        cls.objects.bulk_create(cls.build_links(parent_ids, category_ids))
+
+
 class Manufacturer(models.Model):
     name = models.CharField(_('Manufacturer'), max_length=255)
     short_name = models.CharField(_('Short name'), max_length=16, null=True, blank=True)
@@ -154,3 +206,115 @@ class Feature(models.Model):
                 category_feature.feature_set.exclude(id=self.id).update(shared_image=category_feature.shared_image)
             self.category_feature = category_feature
             super().save(*args, **kwargs)
+
+
+class CatalogChange(models.Model):
+    """
+    Append-only log of catalog changes, read by tablets syncing a client catalog incrementally.
+    Product and feature changes are global, client price and discount changes belong to a client.
+    Ids are allocated when changes are logged, and a transaction can commit after a later one, so changes are read
+    up to the watermark of the transactions still running, using the id of the transaction logging them.
+    """
+    id = models.BigAutoField(primary_key=True)
+    client = models.ForeignKey('hospital.Client', on_delete=models.CASCADE, null=True, blank=True)
+    model = models.CharField(max_length=32, choices=CATALOG_CHANGE_MODELS)
+    object_id = models.PositiveIntegerField()
+    action = models.PositiveSmallIntegerField(choices=CATALOG_CHANGE_ACTIONS)
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    txid = models.BigIntegerField(default=0, db_index=True)
+
+    objects = CatalogChangeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['client', 'id'])]
+
+    def __str__(self):
+        return f'{self.get_action_display()} {self.model} {self.object_id}'
+
+    @classmethod
+    def log(cls, model, object_ids, action, client_id=None):
+        cls.objects.bulk_create(
+            cls(client_id=client_id, model=model, object_id=object_id, action=action) for object_id in object_ids
+        )
+
+    @classmethod
+    def get_sync_position(cls):
+        """
+        (watermark, last change id) of the changes visible now, along with the id of the current transaction,
+        None unless it has written. Every other transaction below the watermark has ended, so no change can be
+        committed below it anymore.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT txid_current_if_assigned(), txid_snapshot_xmax(snapshot), '
+                'ARRAY(SELECT txid_snapshot_xip(snapshot)), '
+                f'(SELECT COALESCE(MAX(id), 0) FROM {cls._meta.db_table}) FROM txid_current_snapshot() snapshot'
+            )
+            own_txid, xmax, running_txids, last_id = cursor.fetchone()
+        if own_txid is not None:
+            xmax = max(xmax, own_txid + 1)
+        watermark = min([txid for txid in running_txids if txid != own_txid] + [xmax])
+        return (watermark, last_id), own_txid
+
+    @staticmethod
+    def make_sync_token(sync_position):
+        watermark, last_id = sync_position
+        return f'{watermark}.{last_id}.{int(time())}'
+
+    @staticmethod
+    def parse_sync_token(sync_token):
+        """
+        (watermark, last change id) the sync token was issued at, None when it is invalid or older than
+        the retained changes.
+        """
+        try:
+            watermark, last_id, issued_at = (int(part) for part in sync_token.split('.'))
+        except (AttributeError, ValueError):
+            return None
+        if issued_at < time() - timedelta(days=CATALOG_CHANGE_RETENTION_DAYS).total_seconds():
+            return None
+        return watermark, last_id
+
+    @classmethod
+    def compact(cls, days=CATALOG_CHANGE_RETENTION_DAYS):
+        """
+        Delete changes older than the retention period and changes superseded by a later change of the same object,
+        logged for the same client or globally.
+        """
+        expired_count, _ = cls.objects.filter(changed_at__lt=timezone.now() - timedelta(days=days)).delete()
+        later_changes = cls.objects.filter(Q(client_id=OuterRef('client_id')) | Q(client__isnull=True),
+                                           model=OuterRef('model'), object_id=OuterRef('object_id'),
+                                           id__gt=OuterRef('id'))
+        superseded_ids = cls.objects.annotate(superseded=Exists(later_changes)).filter(superseded=True) \
+            .values_list('id', flat=True)
+        superseded_count, _ = cls.objects.filter(id__in=list(superseded_ids)).delete()
+        return expired_count + superseded_count
+
+
+class CatalogVersion(models.Model):
+    """
+    Time of the last change of the whole catalog or of a client catalog, shared by every process.
+    Cached catalog responses are keyed by these versions, so they can live in a process-local cache.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    changed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.key}: {self.changed_at}'
+
+    @classmethod
+    def get_many(cls, keys):
+        return dict(cls.objects.filter(key__in=keys).values_list('key', 'changed_at'))
+
+    @classmethod
+    def bump(cls, key):
+        """
+        Move a version forward, even when clocks of concurrent transactions disagree.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {cls._meta.db_table} (key, changed_at) VALUES (%s, clock_timestamp()) '
+                f'ON CONFLICT (key) DO UPDATE SET changed_at = GREATEST(EXCLUDED.changed_at, '
+                f"{cls._meta.db_table}.changed_at + interval '1 microsecond')",
+                [key]
+            )
@@ -20,6 +20,8 @@ class ProductSchema(schemas.AutoSchema):
             return [
                 coreapi.Field('client_id', required=True, location='path',
                               schema=coreschema.Integer(description='Client ID')),
+                coreapi.Field('sub_categories', required=False, location='query',
+                              schema=coreschema.Boolean(description='Include products of sub categories')),
             ]
         else:
             return []
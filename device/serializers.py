@@ -1,8 +1,9 @@
 from rest_framework import serializers
 
 from device.models import Category, Product, Manufacturer, Feature
+from neptune.serializers import FastSerializer, attribute, key, decimal_string
 from price.constants import UNIT_COST, SYSTEM_COST
-from price.serializers import DiscountSerializer
+from price.serializers import DiscountSerializer, FastDiscountSerializer
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -29,6 +30,19 @@ class FeatureSerializer(serializers.ModelSerializer):
         return shared_image and shared_image.image.url
 
 
+class FeatureSyncSerializer(FeatureSerializer):
+    class Meta(FeatureSerializer.Meta):
+        fields = FeatureSerializer.Meta.fields + ('product',)
+
+
+class ProductSyncSerializer(serializers.ModelSerializer):
+    manufacturer = ManufacturerSerializer()
+
+    class Meta:
+        model = Product
+        fields = ('id', 'name', 'image', 'level', 'model_number', 'category', 'manufacturer')
+
+
 class ProductSerializer(serializers.ModelSerializer):
     manufacturer = ManufacturerSerializer()
     unit_cost = serializers.SerializerMethodField()
@@ -79,6 +93,82 @@ class ProductSerializer(serializers.ModelSerializer):
         return self.get_cost(product, cost_type=SYSTEM_COST)
 
 
+class FastManufacturerSerializer(FastSerializer):
+    def get_fields(self):
+        return (
+            ('id', attribute('id'), int),
+            ('name', attribute('name'), str),
+            ('short_name', attribute('short_name'), str),
+            ('image', attribute('image'), self.image_url),
+        )
+
+
+class FastFeatureSerializer(FastSerializer):
+    def get_fields(self):
+        return (
+            ('id', attribute('id'), int),
+            ('name', attribute('name'), str),
+            ('value', attribute('value'), str),
+            ('image', self.get_image, None),
+            ('category_feature', attribute('category_feature_id'), None),
+        )
+
+    def get_image(self, feature):
+        shared_image = feature.category_feature.shared_image
+        return shared_image and self.image_url(shared_image.image)
+
+
+class FastProductSerializer(FastSerializer):
+    """
+    ProductSerializer data for products prefetched with ProductQuerySet.prefetch_catalog.
+    """
+    def get_fields(self):
+        self.manufacturer_serializer = FastManufacturerSerializer(context=self.context)
+        self.feature_serializer = FastFeatureSerializer(context=self.context)
+        self.discount_serializer = FastDiscountSerializer(context=self.context)
+        self.bulk_discounts = self.context['client_inventory_bulk_discounts']
+        return (
+            ('id', attribute('id'), int),
+            ('name', attribute('name'), str),
+            ('image', attribute('image'), self.image_url),
+            ('level', attribute('level'), int),
+            ('model_number', attribute('model_number'), str),
+            ('manufacturer', attribute('manufacturer'), self.manufacturer_serializer.to_representation),
+            ('bulk', attribute('bulk'), int),
+            ('unit_cost', self.get_unit_cost, None),
+            ('system_cost', self.get_system_cost, None),
+            ('features', attribute('features'), self.get_features),
+        )
+
+    def get_cost(self, product, cost_type):
+        client_price = product.client_prices[0]
+        if cost_type == UNIT_COST:
+            cost = client_price.unit_cost
+            discounts = client_price.unit_discounts
+        else:
+            cost = client_price.system_cost
+            discounts = client_price.system_discounts
+
+        bulk_discounts = self.bulk_discounts.get(client_price.id, {}).get(cost_type, [])
+        max_bulk_discount = ProductSerializer._find_max_bulk_discount(bulk_discounts, cost)
+        if max_bulk_discount:
+            discounts = discounts + [max_bulk_discount]
+
+        return {
+            'value': cost,
+            'discounts': [self.discount_serializer.to_representation(discount) for discount in discounts]
+        }
+
+    def get_unit_cost(self, product):
+        return self.get_cost(product, cost_type=UNIT_COST)
+
+    def get_system_cost(self, product):
+        return self.get_cost(product, cost_type=SYSTEM_COST)
+
+    def get_features(self, features):
+        return [self.feature_serializer.to_representation(feature) for feature in features]
+
+
 class MarketshareSerializer(serializers.Serializer):
     spend = serializers.DecimalField(max_digits=20, decimal_places=2)
     units = serializers.IntegerField()
@@ -87,3 +177,13 @@ class MarketshareSerializer(serializers.Serializer):
 
     def get_name(self, marketshare):
         return marketshare.get('manufacturer_short_name') or marketshare.get('manufacturer_name')
+
+
+class FastMarketshareSerializer(FastSerializer):
+    fields = (
+        ('spend', key('spend'), decimal_string(20, 2)),
+        ('units', key('units'), int),
+        ('name', lambda marketshare: marketshare.get('manufacturer_short_name') or
+         marketshare.get('manufacturer_name'), None),
+        ('id', key('manufacturer_id'), int),
+    )
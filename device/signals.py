@@ -0,0 +1,174 @@
+from django.db.models.signals import pre_delete, post_delete, post_save, m2m_changed
+from django.dispatch import receiver
+
+from device.cache import invalidate_catalog
+from device.constants import CATALOG_CHANGE_CREATED, CATALOG_CHANGE_UPDATED, CATALOG_CHANGE_DELETED
+from device.models import CatalogChange, Category, CategoryAncestor, CategoryFeature, Feature, Manufacturer, Product, \
+    Specialty
+from hospital.models import Account, Device, Item
+from neptune.models import SharedImage
+from price.models import ClientPrice, Discount
+
+
+@receiver(pre_delete, sender=Category)
+def collect_sub_categories(sender, instance, **kwargs):
+    instance.sub_category_ids = list(instance.descendant_links.values_list('category_id', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def rebuild_sub_category_ancestors(sender, instance, **kwargs):
+    CategoryAncestor.rebuild(getattr(instance, 'sub_category_ids', []))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Feature)
+@receiver(post_delete, sender=Feature)
+@receiver(post_save, sender=CategoryFeature)
+@receiver(post_delete, sender=CategoryFeature)
+@receiver(post_save, sender=SharedImage)
+@receiver(post_delete, sender=SharedImage)
+@receiver(post_save, sender=Manufacturer)
+@receiver(post_delete, sender=Manufacturer)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Specialty)
+@receiver(post_delete, sender=Specialty)
+def invalidate_catalog_cache(sender, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(m2m_changed, sender=Account.specialties.through)
+def invalidate_account_catalog_cache(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_catalog(instance.client_id if isinstance(instance, Account) else None)
+
+
+@receiver(post_save, sender=ClientPrice)
+@receiver(post_delete, sender=ClientPrice)
+def invalidate_client_price_catalog_cache(sender, instance, **kwargs):
+    invalidate_catalog(instance.client_id)
+
+
+def get_discount_client_id(discount):
+    if Discount.client_price.field.is_cached(discount):
+        return discount.client_price.client_id
+    return ClientPrice.objects.filter(pk=discount.client_price_id).values_list('client_id', flat=True).first()
+
+
+@receiver(post_save, sender=Discount)
+@receiver(post_delete, sender=Discount)
+def invalidate_discount_catalog_cache(sender, instance, **kwargs):
+    invalidate_catalog(get_discount_client_id(instance))
+
+
+def get_device_client_id(device_id):
+    return Device.objects.filter(pk=device_id).values_list('client_id', flat=True).first()
+
+
+def get_item_client_id(item):
+    if Item.device.field.is_cached(item):
+        return item.device.client_id
+    return get_device_client_id(item.device_id)
+
+
+@receiver(post_save, sender=Item)
+def invalidate_saved_item_catalog_cache(sender, instance, created, **kwargs):
+    """
+    Client catalogs only show whether items are used, how they are purchased and their device,
+    other item changes leave them valid.
+    """
+    if created:
+        invalidate_catalog(get_item_client_id(instance))
+    elif instance.catalog_state != instance.original_catalog_state:
+        client_ids = {get_item_client_id(instance)}
+        original_device_id = instance.original_catalog_state[2]
+        if original_device_id != instance.device_id:
+            client_ids.add(get_device_client_id(original_device_id))
+        for client_id in client_ids - {None}:
+            invalidate_catalog(client_id)
+
+
+@receiver(post_delete, sender=Item)
+def invalidate_item_catalog_cache(sender, instance, **kwargs):
+    invalidate_catalog(get_item_client_id(instance))
+
+
+@receiver(m2m_changed, sender=Item.discounts.through)
+def invalidate_item_discounts_catalog_cache(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        if isinstance(instance, Item):
+            invalidate_catalog(get_item_client_id(instance))
+        else:
+            invalidate_catalog(instance.client_price.client_id)
+
+
+def get_client_id(instance):
+    if isinstance(instance, ClientPrice):
+        return instance.client_id
+    if isinstance(instance, Discount):
+        return get_discount_client_id(instance)
+    return None
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Feature)
+@receiver(post_save, sender=ClientPrice)
+@receiver(post_save, sender=Discount)
+def log_catalog_change(sender, instance, created, **kwargs):
+    CatalogChange.log(sender._meta.model_name, [instance.id],
+                      CATALOG_CHANGE_CREATED if created else CATALOG_CHANGE_UPDATED,
+                      get_client_id(instance))
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Feature)
+@receiver(post_delete, sender=ClientPrice)
+@receiver(pre_delete, sender=Discount)
+def log_catalog_deletion(sender, instance, **kwargs):
+    CatalogChange.log(sender._meta.model_name, [instance.id], CATALOG_CHANGE_DELETED, get_client_id(instance))
+
+
+def log_client_price_product_change(client_price, action):
+    """
+    A client price adds its product and features to the catalog of the client, or removes them.
+    """
+    if client_price.client_id is not None:
+        CatalogChange.log('product', [client_price.product_id], action, client_price.client_id)
+        feature_ids = Feature.objects.filter(product_id=client_price.product_id).values_list('id', flat=True)
+        CatalogChange.log('feature', feature_ids, action, client_price.client_id)
+
+
+@receiver(post_save, sender=ClientPrice)
+def log_client_price_creation(sender, instance, created, **kwargs):
+    if created:
+        log_client_price_product_change(instance, CATALOG_CHANGE_CREATED)
+
+
+@receiver(post_delete, sender=ClientPrice)
+def log_client_price_deletion(sender, instance, **kwargs):
+    log_client_price_product_change(instance, CATALOG_CHANGE_DELETED)
+
+
+@receiver(post_save, sender=Manufacturer)
+def log_manufacturer_products_change(sender, instance, created, **kwargs):
+    if not created:
+        CatalogChange.log('product', instance.product_set.values_list('id', flat=True), CATALOG_CHANGE_UPDATED)
+
+
+@receiver(post_save, sender=CategoryFeature)
+def log_category_features_change(sender, instance, created, **kwargs):
+    if not created:
+        CatalogChange.log('feature', instance.feature_set.values_list('id', flat=True), CATALOG_CHANGE_UPDATED)
+
+
+@receiver(post_save, sender=SharedImage)
+def log_shared_image_change(sender, instance, created, **kwargs):
+    if not created:
+        feature_ids = Feature.objects.filter(category_feature__shared_image=instance).values_list('id', flat=True)
+        CatalogChange.log('feature', feature_ids, CATALOG_CHANGE_UPDATED)
+        discounts = Discount.objects.filter(shared_image=instance).values_list('client_price__client_id', 'id')
+        CatalogChange.objects.bulk_create(
+            CatalogChange(client_id=client_id, model='discount', object_id=discount_id, action=CATALOG_CHANGE_UPDATED)
+            for client_id, discount_id in discounts
+        )
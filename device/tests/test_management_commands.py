@@ -2,7 +2,9 @@ from django.db.models import Count
 from django.test import TestCase
 from django.core.management import call_command
 
+from device.management.commands.benchmark_serializers import Command as BenchmarkSerializersCommand
 from device.models import Specialty, Category, Product, Manufacturer
+from device.serializers import FastProductSerializer, ProductSerializer
 
 
 class AddDefaultDeviceCategoriesCommandTestCase(TestCase):
@@ -52,3 +54,15 @@ class ImportProductCommandTestCase(TestCase):
     def test_command_multiple_runs(self):
         self.run_command_and_assert()
         self.run_command_and_assert()
+
+
+class BenchmarkSerializersCommandTestCase(TestCase):
+    def test_build_products_serialized_alike(self):
+        products = BenchmarkSerializersCommand.build_products(20)
+        context = {'client_inventory_bulk_discounts': {}}
+        self.assertEqual(FastProductSerializer(products, many=True, context=context).data,
+                         ProductSerializer(products, many=True, context=context).data)
+
+    def test_command(self):
+        with self.assertNumQueries(0):
+            call_command('benchmark_serializers', products=10, repeat=1)
@@ -1,6 +1,6 @@
 from django.test import TestCase
 
-from device.factories import ProductFactory, FeatureFactory
+from device.factories import CategoryFactory, ProductFactory, FeatureFactory
 from device.models import Product
 from hospital.factories import ClientFactory, ItemFactory, DeviceFactory
 from price.constants import UNIT_COST, SYSTEM_COST
@@ -24,6 +24,15 @@ class ProductQuerySetTestCase(TestCase):
         self.assertEqual(product, self.product_1)
         self.assertEqual(product.bulk, 3)
 
+    def test_in_category_tree(self):
+        sub_category = CategoryFactory(parent=self.product_1.category)
+        product_3 = ProductFactory(category=sub_category)
+        ProductFactory(category=CategoryFactory(parent=self.product_2.category))
+
+        self.assertCountEqual(Product.objects.in_category_tree([self.product_1.category_id]),
+                              [self.product_1, product_3])
+        self.assertCountEqual(Product.objects.in_category_tree([sub_category.id]), [product_3])
+
     def test_prefetch_features_queryset(self):
         feature_1 = FeatureFactory(product=self.product_1)
         feature_2, feature_3 = FeatureFactory.create_batch(2, product=self.product_2)
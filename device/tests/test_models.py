@@ -1,9 +1,20 @@
-from django.db import IntegrityError
-from django.test import TestCase
+from datetime import timedelta
+from threading import Event, Thread
+from time import time
 
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from device.cache import get_catalog_cache, get_catalog_versions, invalidate_catalog
 from device.factories import SpecialtyFactory, CategoryFactory, ProductFactory, ManufacturerFactory, FeatureFactory, \
     CategoryFeatureFactory
-from device.models import Specialty, Category, Feature, CategoryFeature
+from device.constants import CATALOG_CHANGE_CREATED, CATALOG_CHANGE_UPDATED, CATALOG_CHANGE_DELETED, \
+    CATALOG_VERSION_KEY
+from device.models import Specialty, Category, CategoryAncestor, Feature, CategoryFeature, CatalogChange, \
+    CatalogVersion
+from hospital.factories import DeviceFactory, ItemFactory
+from price.factories import ClientPriceFactory, DiscountFactory
 
 
 class SpecialtyTestCase(TestCase):
@@ -43,6 +54,25 @@ class CategoryTestCase(TestCase):
         parent_categories = Category.get_all_parent_categories([category_2.id])
         self.assertCountEqual(parent_categories, [category_1, category_2])
 
+    def test_get_all_sub_categories(self):
+        category_1, category_2 = CategoryFactory.create_batch(2)
+        category_3 = CategoryFactory(parent=category_1)
+        category_4 = CategoryFactory(parent=category_3)
+        self.assertCountEqual(Category.get_all_sub_categories([category_1.id]), [category_3, category_4])
+
+        category_3.parent = category_2
+        category_3.save()
+        self.assertCountEqual(Category.get_all_sub_categories([category_1.id]), [])
+        self.assertCountEqual(Category.get_all_parent_categories([category_4.id]), [category_2, category_3])
+
+        category_1.sub_categories.set([category_2])
+        CategoryAncestor.rebuild([category_1.id, category_2.id])
+        self.assertCountEqual(Category.get_all_sub_categories([category_1.id]), [category_2, category_3, category_4])
+
+        category_2.delete()
+        self.assertCountEqual(Category.get_all_sub_categories([category_1.id]), [])
+        self.assertCountEqual(Category.get_all_parent_categories([category_4.id]), [category_3])
+
 
 class ProductTestCase(TestCase):
     def setUp(self):
@@ -145,3 +175,144 @@ class FeatureTestCase(TestCase):
         category_feature.save()
         feature.refresh_from_db()
         self.assertEqual(str(feature), 'New dimension')
+
+
+class CatalogChangeTestCase(TestCase):
+    def test_catalog_changes_logged_by_signals(self):
+        product = ProductFactory()
+        client_price = ClientPriceFactory(product=product)
+        discount = DiscountFactory(client_price=client_price)
+        discount_id = discount.id
+        product.name = 'Updated product'
+        product.save()
+        discount.delete()
+        changes = CatalogChange.objects.filter(model__in=['product', 'discount']).order_by('id')
+        self.assertListEqual(list(changes.values_list('client_id', 'model', 'object_id', 'action')), [
+            (None, 'product', product.id, CATALOG_CHANGE_CREATED),
+            (client_price.client_id, 'product', product.id, CATALOG_CHANGE_CREATED),
+            (client_price.client_id, 'discount', discount_id, CATALOG_CHANGE_CREATED),
+            (None, 'product', product.id, CATALOG_CHANGE_UPDATED),
+            (client_price.client_id, 'discount', discount_id, CATALOG_CHANGE_DELETED),
+        ])
+        self.assertEqual(CatalogChange.objects.filter(model='clientprice').values_list('client_id', flat=True)[0],
+                         client_price.client_id)
+
+    def test_client_price_changes_log_product_and_features(self):
+        product = ProductFactory()
+        feature = FeatureFactory(product=product)
+        client_price = ClientPriceFactory(product=product)
+        client_id = client_price.client_id
+        client_price.unit_cost = 200
+        client_price.save()
+        client_price.delete()
+
+        changes = CatalogChange.objects.filter(client_id=client_id, model__in=['product', 'feature']).order_by('id')
+        self.assertListEqual(list(changes.values_list('model', 'object_id', 'action')), [
+            ('product', product.id, CATALOG_CHANGE_CREATED),
+            ('feature', feature.id, CATALOG_CHANGE_CREATED),
+            ('product', product.id, CATALOG_CHANGE_DELETED),
+            ('feature', feature.id, CATALOG_CHANGE_DELETED),
+        ])
+
+    def test_sync_token(self):
+        sync_token = CatalogChange.make_sync_token((10, 20))
+        self.assertEqual(CatalogChange.parse_sync_token(sync_token), (10, 20))
+        self.assertIsNone(CatalogChange.parse_sync_token(None))
+        self.assertIsNone(CatalogChange.parse_sync_token('invalid'))
+        self.assertIsNone(CatalogChange.parse_sync_token(f'10.20.{int(time()) - 31 * 24 * 3600}'))
+
+    def test_compact(self):
+        product_1, product_2 = ProductFactory.create_batch(2)
+        product_1.save()
+        CatalogChange.objects.filter(object_id=product_2.id).update(changed_at=timezone.now() - timedelta(days=31))
+        self.assertEqual(CatalogChange.compact(), 2)
+        self.assertListEqual(list(CatalogChange.objects.values_list('model', 'object_id', 'action')), [
+            ('product', product_1.id, CATALOG_CHANGE_UPDATED),
+        ])
+
+    def test_compact_keeps_changes_of_other_clients(self):
+        client_price_1, client_price_2 = ClientPriceFactory.create_batch(2)
+        CatalogChange.objects.all().delete()
+        for client_price in (client_price_1, client_price_2, client_price_1):
+            CatalogChange.log('product', [100], CATALOG_CHANGE_UPDATED, client_id=client_price.client_id)
+        self.assertEqual(CatalogChange.compact(), 1)
+        self.assertCountEqual(CatalogChange.objects.values_list('client_id', flat=True),
+                              [client_price_1.client_id, client_price_2.client_id])
+
+        CatalogChange.log('product', [100], CATALOG_CHANGE_DELETED)
+        self.assertEqual(CatalogChange.compact(), 2)
+        self.assertListEqual(list(CatalogChange.objects.values_list('client_id', 'action')),
+                             [(None, CATALOG_CHANGE_DELETED)])
+
+
+class CatalogVersionTestCase(TestCase):
+    def test_versions_survive_process_local_cache(self):
+        client_id = ClientPriceFactory().client_id
+        global_version, client_version = get_catalog_versions(client_id)
+        invalidate_catalog(client_id)
+        get_catalog_cache().clear()
+
+        new_global_version, new_client_version = get_catalog_versions(client_id)
+        self.assertEqual(new_global_version, global_version)
+        self.assertGreater(new_client_version, client_version)
+
+    def test_item_saves_bump_client_version_on_catalog_changes(self):
+        item = ItemFactory()
+        client_id = item.device.client_id
+        _, client_version = get_catalog_versions(client_id)
+
+        item.cost = 100
+        item.save()
+        self.assertEqual(get_catalog_versions(client_id)[1], client_version)
+
+        item.is_used = True
+        item.save()
+        self.assertGreater(get_catalog_versions(client_id)[1], client_version)
+
+        _, client_version = get_catalog_versions(client_id)
+        other_client_id = ItemFactory().device.client_id
+        _, other_client_version = get_catalog_versions(other_client_id)
+        item.device = DeviceFactory(client_id=other_client_id)
+        item.save()
+        self.assertGreater(get_catalog_versions(client_id)[1], client_version)
+        self.assertGreater(get_catalog_versions(other_client_id)[1], other_client_version)
+
+    def test_bump_moves_forward(self):
+        CatalogVersion.objects.create(key=CATALOG_VERSION_KEY, changed_at=timezone.now() + timedelta(days=1))
+        changed_at = CatalogVersion.objects.get(key=CATALOG_VERSION_KEY).changed_at
+        CatalogVersion.bump(CATALOG_VERSION_KEY)
+        self.assertGreater(CatalogVersion.objects.get(key=CATALOG_VERSION_KEY).changed_at, changed_at)
+
+
+class CatalogChangeWatermarkTestCase(TransactionTestCase):
+    def test_changes_committed_out_of_order(self):
+        logged, committing = Event(), Event()
+        thread_changes = []
+
+        def log_change_in_transaction():
+            with transaction.atomic():
+                CatalogChange.log('product', [100], CATALOG_CHANGE_UPDATED)
+                thread_changes.extend(CatalogChange.objects.all())
+                logged.set()
+                committing.wait(10)
+            connection.close()
+
+        thread = Thread(target=log_change_in_transaction)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(committing.set)
+        self.assertTrue(logged.wait(10))
+        CatalogChange.log('product', [101], CATALOG_CHANGE_UPDATED)
+        change_101 = CatalogChange.objects.get()
+        change_100, = thread_changes
+        self.assertLess(change_100.id, change_101.id)
+
+        actions, sync_position = CatalogChange.objects.latest_actions()
+        self.assertEqual(actions, {})
+        self.assertLessEqual(sync_position[0], change_100.txid)
+
+        committing.set()
+        thread.join()
+        actions, sync_position = CatalogChange.objects.latest_actions(sync_position)
+        self.assertEqual(set(actions), {('product', 100), ('product', 101)})
+        self.assertEqual(CatalogChange.objects.latest_actions(sync_position)[0], {})
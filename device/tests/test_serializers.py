@@ -0,0 +1,88 @@
+from datetime import date
+from shutil import rmtree
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from factory.django import ImageField
+from rest_framework.renderers import JSONRenderer
+
+from device.factories import CategoryFactory, FeatureFactory, ManufacturerFactory, ProductFactory
+from device.models import Product
+from device.serializers import FastMarketshareSerializer, FastProductSerializer, MarketshareSerializer, \
+    ProductSerializer
+from device.views import get_product_serializer_context
+from hospital.constants import BULK_PURCHASE
+from hospital.factories import ClientFactory, ItemFactory
+from hospital.models import Item
+from neptune.factories import SharedImageFactory
+from price.constants import ON_DOCTOR_ORDER, PERCENT_DISCOUNT, PRE_DOCTOR_ORDER, SYSTEM_COST, UNIT_COST, \
+    VALUE_DISCOUNT
+from price.factories import ClientPriceFactory, DiscountFactory
+from tracker.factories import RepCaseFactory
+
+
+class FastSerializerTestCase(TestCase):
+    def assertSameData(self, data, fast_data):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast_data), renderer.render(data))
+
+
+@override_settings(DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage')
+class FastProductSerializerTestCase(FastSerializerTestCase):
+    def tearDown(self):
+        super().tearDown()
+        rmtree(settings.MEDIA_ROOT)
+
+    def setUp(self):
+        self.client_1 = ClientFactory()
+        self.category = CategoryFactory()
+        manufacturer = ManufacturerFactory(image=ImageField(filename='manufacturer.jpg'))
+        product_1 = ProductFactory(category=self.category, manufacturer=manufacturer,
+                                   image=ImageField(filename='product.jpg'))
+        product_2 = ProductFactory(category=self.category, model_number=None)
+        FeatureFactory(product=product_1, name='Wireless', value='Yes',
+                       shared_image=SharedImageFactory(image=ImageField(filename='wireless.jpg')))
+        FeatureFactory(product=product_1, name='Longevity', value='10')
+        price_1 = ClientPriceFactory(client=self.client_1, product=product_1, unit_cost=200, system_cost=300)
+        price_2 = ClientPriceFactory(client=self.client_1, product=product_2, unit_cost=250.5, system_cost=310)
+        shared_image = SharedImageFactory(image=ImageField(filename='discount.png'))
+        DiscountFactory(client_price=price_1, discount_type=VALUE_DISCOUNT, value=50, percent=0, order=1,
+                        apply_type=ON_DOCTOR_ORDER, cost_type=UNIT_COST, shared_image=shared_image)
+        DiscountFactory(client_price=price_2, discount_type=PERCENT_DISCOUNT, percent=12.5, value=None, order=2,
+                        apply_type=ON_DOCTOR_ORDER, cost_type=SYSTEM_COST, shared_image=shared_image)
+        bulk_discount = DiscountFactory(client_price=price_1, discount_type=PERCENT_DISCOUNT, percent=15, value=0,
+                                        apply_type=PRE_DOCTOR_ORDER, cost_type=UNIT_COST)
+        ItemFactory(device=self.client_1.device_set.get(product=product_1), discounts=[bulk_discount],
+                    purchase_type=BULK_PURCHASE, is_used=False, cost_type=UNIT_COST)
+
+    def get_products(self):
+        return list(Product.objects.filter(category=self.category).order_by('id').prefetch_catalog(self.client_1))
+
+    def test_same_data_as_product_serializer(self):
+        product_list = ProductSerializer(self.get_products(), many=True,
+                                         context=get_product_serializer_context(self.client_1)).data
+        fast_product_list = FastProductSerializer(self.get_products(), many=True,
+                                                  context=get_product_serializer_context(self.client_1)).data
+        self.assertEqual(len(fast_product_list), 2)
+        self.assertEqual(len(fast_product_list[0]['unit_cost']['discounts']), 2)
+        self.assertSameData(product_list, fast_product_list)
+
+    def test_serializing_twice_does_not_repeat_bulk_discounts(self):
+        products = self.get_products()
+        serializer = FastProductSerializer(products, many=True, context=get_product_serializer_context(self.client_1))
+        self.assertEqual(serializer.data, serializer.data)
+
+
+class FastMarketshareSerializerTestCase(FastSerializerTestCase):
+    def test_same_data_as_marketshare_serializer(self):
+        client = ClientFactory()
+        manufacturer_1 = ManufacturerFactory(short_name=None)
+        manufacturer_2 = ManufacturerFactory(short_name='MDT')
+        items = [
+            ItemFactory(device__client=client, device__product__manufacturer=manufacturer, cost=cost, is_used=True)
+            for manufacturer, cost in ((manufacturer_1, 1000.25), (manufacturer_1, 99.99), (manufacturer_2, 250))
+        ]
+        RepCaseFactory(client=client, items=items, procedure_date=date(2018, 5, 1))
+        marketshare = list(Item.objects.used_by_client(client).marketshare().order_by('manufacturer_id'))
+        self.assertSameData(MarketshareSerializer(marketshare, many=True).data,
+                            FastMarketshareSerializer(marketshare, many=True).data)
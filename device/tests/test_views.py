@@ -3,18 +3,22 @@ from datetime import datetime, date
 from decimal import Decimal
 
 from django.conf import settings
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from factory.django import ImageField
 from rest_framework import status
 from shutil import rmtree
 
 from api.tests.base import APIViewTestCase
+from device.cache import get_catalog_cache_stats, get_catalog_etag
 from device.factories import CategoryFactory, ProductFactory, FeatureFactory, CategoryFeatureFactory, \
     ManufacturerFactory
 from hospital.factories import AccountFactory, ClientFactory, DeviceFactory, ItemFactory, RoleFactory
 from hospital.constants import CONSIGNMENT_PURCHASE, BULK_PURCHASE, RolePriority
 from neptune.factories import SharedImageFactory
+from order.factories import PreferenceFactory, QuestionFactory
 from price.constants import ON_DOCTOR_ORDER, PRE_DOCTOR_ORDER
 from price.factories import ClientPriceFactory, DiscountFactory
 from price.constants import VALUE_DISCOUNT, UNIT_COST, PERCENT_DISCOUNT, SYSTEM_COST
@@ -78,12 +82,30 @@ class CategoryListViewTestCase(APIViewTestCase):
             {'id': parent_category.id, 'name': parent_category.name, 'image': None, 'parent_id': None},
         ])
 
+    def test_get_method_returns_not_modified_until_categories_change(self):
+        response = self.authorized_client.get(self.path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        response = self.authorized_client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        self.account_1.specialties.add(self.category_1.specialty)
+        response = self.authorized_client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
     def test_get_method_with_client_does_not_contain_user(self):
         client = ClientFactory()
         path = reverse('api:hospital:device:categories', args=(client.id,))
         response = self.authorized_client.get(path)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+        etag = get_catalog_etag('categories', self.user.id, client_id=client.id)
+        response = self.authorized_client.get(path, HTTP_IF_NONE_MATCH=f'"{etag}"')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 
 @override_settings(DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage')
 class ProductListViewTestCase(APIViewTestCase):
@@ -215,12 +237,58 @@ class ProductListViewTestCase(APIViewTestCase):
         ]
         self.assertCountEqual(response.data, expected)
 
+    def test_get_method_caches_product_list_until_catalog_changes(self):
+        stats = get_catalog_cache_stats()
+        response = self.authorized_client.get(self.path)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        cached_response = self.authorized_client.get(self.path)
+        self.assertEqual(cached_response['X-Cache'], 'HIT')
+        self.assertCountEqual(cached_response.data, response.data)
+        self.assertDictEqual(get_catalog_cache_stats(), {'hits': stats['hits'] + 1, 'misses': stats['misses'] + 1})
+
+        self.discount_1.value = 40
+        self.discount_1.save()
+        response = self.authorized_client.get(self.path)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        product_1 = next(product for product in response.data if product['id'] == self.product_1.id)
+        self.assertEqual(product_1['unit_cost']['discounts'][0]['value'], '40.00')
+
+        item = self.client_1.device_set.get(product=self.product_1).item_set.get()
+        item.is_used = True
+        item.save()
+        response = self.authorized_client.get(self.path)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        product_1 = next(product for product in response.data if product['id'] == self.product_1.id)
+        self.assertEqual(product_1['bulk'], 0)
+
+        ClientPriceFactory(client=ClientFactory(), product=self.product_1)
+        self.assertEqual(self.authorized_client.get(self.path)['X-Cache'], 'HIT')
+
+    def test_get_method_returns_not_modified_without_building_product_list(self):
+        with CaptureQueriesContext(connection) as full_queries:
+            response = self.authorized_client.get(self.path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as conditional_queries:
+            response = self.authorized_client.get(self.path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertLess(len(conditional_queries), len(full_queries))
+
+        sub_categories_response = self.authorized_client.get(self.path, {'sub_categories': 1},
+                                                             HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(sub_categories_response.status_code, status.HTTP_200_OK)
+
     def test_get_method_with_client_does_not_contain_user(self):
         client = ClientFactory()
         path = reverse('api:hospital:device:products', args=(client.id, self.category.id,))
         response = self.authorized_client.get(path)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+        etag = get_catalog_etag('products', self.category.id, False, client_id=client.id)
+        response = self.authorized_client.get(path, HTTP_IF_NONE_MATCH=f'"{etag}"')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 
 class ItemListViewTestCase(APIViewTestCase):
     def setUp(self):
@@ -271,6 +339,19 @@ class ItemListViewTestCase(APIViewTestCase):
             },
         ])
 
+    def test_get_method_paginates_items_by_cursor(self):
+        item_3 = ItemFactory(device=self.item_1.device, is_used=False, purchase_type=BULK_PURCHASE)
+        response = self.authorized_client.get(self.path, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['previous'])
+        self.assertEqual([item['identifier'] for item in response.data['results']],
+                         [self.item_1.identifier, self.item_2.identifier])
+
+        response = self.authorized_client.get(response.data['next'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual([item['identifier'] for item in response.data['results']], [item_3.identifier])
+
 
 class PhysicianMarketshareViewTestCase(APIViewTestCase):
     def setUp(self):
@@ -331,6 +412,17 @@ class PhysicianMarketshareViewTestCase(APIViewTestCase):
             }
         ])
 
+    def test_return_marketshare_in_one_query(self):
+        device = DeviceFactory(client=self.client_1, product=ProductFactory(manufacturer=self.manufacturer_1))
+        RepCaseFactory(client=self.client_1, physician=self.physician, items=ItemFactory.create_batch(2, device=device),
+                       procedure_date=self.today)
+        self.authorized_client.get(self.path)
+
+        with self.assertNumQueries(1):
+            response = self.authorized_client.get(self.path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([len(period['marketshare']) for period in response.data], [1, 1])
+
     def test_return_marketshare_with_procedure_date(self):
         device = DeviceFactory(client=self.client_1, product=ProductFactory(manufacturer=self.manufacturer_1))
         device_2 = DeviceFactory(client=self.client_1, product=ProductFactory(manufacturer=self.manufacturer_2))
@@ -417,6 +509,18 @@ class FeatureListViewTestCase(APIViewTestCase):
     def test_api_path(self):
         self.assertEqual(self.path, f'/api/products/{self.product.id}/features')
 
+    def test_get_method_returns_not_modified_until_feature_change(self):
+        response = self.authorized_client.get(self.path)
+        self.assertNotIn('Last-Modified', response)
+
+        response = self.authorized_client.get(self.path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.feature_1.value = '25/11'
+        self.feature_1.save()
+        response = self.authorized_client.get(self.path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_get_method_return_feature_list(self):
         response = self.authorized_client.get(self.path)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -454,3 +558,112 @@ class FeatureListViewTestCase(APIViewTestCase):
         response = self.authorized_client.get(path)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, [])
+
+
+class CatalogBootstrapViewTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client_1 = ClientFactory()
+        self.category_1, self.category_2 = CategoryFactory.create_batch(2)
+        self.product_1 = ProductFactory(category=self.category_1)
+        self.product_2, self.product_3 = ProductFactory.create_batch(2, category=self.category_2)
+        FeatureFactory(product=self.product_1)
+        for product in (self.product_1, self.product_2, self.product_3):
+            ClientPriceFactory(client=self.client_1, product=product)
+        AccountFactory(user=self.user, client=self.client_1,
+                       specialties=[self.category_1.specialty, self.category_2.specialty])
+        self.question = QuestionFactory()
+        PreferenceFactory(client=self.client_1, content_object=self.category_1, questions=[self.question])
+        self.path = reverse('api:hospital:device:bootstrap', args=(self.client_1.id,))
+
+    def test_api_path(self):
+        self.assertEqual(self.path, f'/api/clients/{self.client_1.id}/bootstrap')
+
+    def test_get_method_unauthorized_user(self):
+        self._test_get_method_unauthorized_user()
+
+    def test_get_method_returns_catalog_sections(self):
+        response = self.authorized_client.get(self.path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        bootstrap = response.data
+        self.assertCountEqual(bootstrap['versions'], ['clients', 'categories', 'products', 'preferences'])
+        self.assertEqual(bootstrap['clients'], self.authorized_client.get(reverse('api:hospital:clients')).data)
+        categories_path = reverse('api:hospital:device:categories', args=(self.client_1.id,))
+        self.assertCountEqual(bootstrap['categories'], self.authorized_client.get(categories_path).data)
+        for category in (self.category_1, self.category_2):
+            products_path = reverse('api:hospital:device:products', args=(self.client_1.id, category.id))
+            self.assertCountEqual(bootstrap['products'][category.id], self.authorized_client.get(products_path).data)
+        self.assertEqual(len(bootstrap['products'][self.category_1.id][0]['features']), 1)
+        self.assertDictEqual(bootstrap['preferences'], {
+            self.category_1.id: [{'id': self.question.id, 'question': self.question.name}],
+            self.category_2.id: [],
+        })
+
+    def test_get_method_omits_unchanged_sections(self):
+        versions = self.authorized_client.get(self.path).data['versions']
+        response = self.authorized_client.get(self.path, versions)
+        self.assertDictEqual(response.data, {'versions': versions})
+
+        ClientPriceFactory(client=self.client_1, product=ProductFactory(category=self.category_1))
+        response = self.authorized_client.get(self.path, versions)
+        self.assertCountEqual(response.data, ['versions', 'categories', 'products'])
+        self.assertEqual(len(response.data['products'][self.category_1.id]), 2)
+
+    def test_get_method_gzip_response(self):
+        response = self.authorized_client.get(self.path, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class CatalogChangeListViewTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client_1 = ClientFactory()
+        AccountFactory(user=self.user, client=self.client_1)
+        self.product_1, self.product_2 = ProductFactory.create_batch(2)
+        self.client_price_1 = ClientPriceFactory(client=self.client_1, product=self.product_1)
+        self.client_price_2 = ClientPriceFactory(client=self.client_1, product=self.product_2)
+        self.discount = DiscountFactory(client_price=self.client_price_1, cost_type=UNIT_COST)
+        ClientPriceFactory(product=self.product_2)
+        self.path = reverse('api:hospital:device:changes', args=(self.client_1.id,))
+
+    def test_api_path(self):
+        self.assertEqual(self.path, f'/api/clients/{self.client_1.id}/changes')
+
+    def test_get_method_unauthorized_user(self):
+        self._test_get_method_unauthorized_user()
+
+    def test_get_method_without_token_returns_client_catalog(self):
+        response = self.authorized_client.get(self.path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['reset'])
+        changes = response.data['changes']
+        self.assertCountEqual([product['id'] for product in changes['products']['updated']],
+                              [self.product_1.id, self.product_2.id])
+        self.assertCountEqual([client_price['id'] for client_price in changes['client_prices']['updated']],
+                              [self.client_price_1.id, self.client_price_2.id])
+        self.assertEqual([discount['id'] for discount in changes['discounts']['updated']], [self.discount.id])
+
+    def test_get_method_with_token_returns_changes_since(self):
+        token = self.authorized_client.get(self.path).data['token']
+        response = self.authorized_client.get(self.path, {'token': token})
+        self.assertFalse(response.data['reset'])
+        self.assertEqual(response.data['token'].split('.')[0], token.split('.')[0])
+        for section in ('products', 'features', 'client_prices', 'discounts'):
+            self.assertDictEqual(response.data['changes'][section], {'updated': [], 'deleted': []})
+
+        self.product_1.name = 'Updated product'
+        self.product_1.save()
+        feature = FeatureFactory(product=self.product_1, value='5')
+        discount_id = self.discount.id
+        self.discount.delete()
+        ClientPriceFactory(product=ProductFactory())
+
+        with self.assertNumQueries(5):
+            response = self.authorized_client.get(self.path, {'token': token})
+        changes = response.data['changes']
+        self.assertEqual([(product['id'], product['name']) for product in changes['products']['updated']],
+                         [(self.product_1.id, 'Updated product')])
+        self.assertEqual([feature['id'] for feature in changes['features']['updated']], [feature.id])
+        self.assertDictEqual(changes['discounts'], {'updated': [], 'deleted': [discount_id]})
+        self.assertDictEqual(changes['client_prices'], {'updated': [], 'deleted': []})
@@ -1,79 +1,127 @@
 from calendar import month_name
+from collections import defaultdict
 from datetime import datetime
+from hashlib import md5
 
-from knox.auth import TokenAuthentication
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from device.models import Category, Product
+from api.authentication import CachedTokenAuthentication
+from api.pagination import ListResponseMixin
+from device.cache import get_catalog_cache, get_product_list, get_catalog_etag
+from device.models import CatalogChange, Category, Feature, Product
 from device.schemas import CategorySchema, ProductSchema
-from device.serializers import CategorySerializer, ProductSerializer, FeatureSerializer
+from device.serializers import CategorySerializer, FastProductSerializer, FeatureSerializer, FeatureSyncSerializer, \
+    ProductSyncSerializer
 from hospital.constants import RolePriority
-from hospital.models import BULK_PURCHASE, Item
-from hospital.serializers import ItemSerializer
-from device.serializers import MarketshareSerializer
-from price.constants import ON_DOCTOR_ORDER
-from price.models import Discount
+from hospital.models import BULK_PURCHASE, Client, Device
+from hospital.permissions import AuthorizationContext
+from hospital.serializers import ClientSerializer, ItemSerializer
+from device.serializers import FastMarketshareSerializer
+from order.models import Preference
+from order.serializers import QuestionSerializer
+from price.models import ClientPrice, Discount
+from price.serializers import ClientPriceSyncSerializer, DiscountSyncSerializer
+from tracker.managers import period_window
+from tracker.models import ItemRollup
+
+
+def get_client_categories(client_id, specialty_ids):
+    """
+    Categories of the given specialties with products priced at a client, along with their parent categories.
+    """
+    categories = Category.objects.filter(
+        product__clientprice__client_id=client_id,
+        specialty__in=specialty_ids
+    ).distinct()
+    category_ids = categories.values_list('id', flat=True)
+    return set(categories) | set(Category.get_all_parent_categories(category_ids))
+
+
+def get_client_catalog_etag(request, client_id, *scope):
+    """
+    ETag of a client catalog response, computed once the user is known to have an account at the client,
+    so conditional requests of other users get a 404 rather than a 304.
+    """
+    AuthorizationContext.for_user(request.user).get_account_or_404(client_id)
+    return get_catalog_etag(*scope, client_id=client_id)
+
+
+def get_product_serializer_context(client):
+    client_inventory_bulk_discounts = Discount.objects.available_in_client_inventory(client).to_client_prices_dict()
+    return {'client_inventory_bulk_discounts': client_inventory_bulk_discounts}
 
 
 class CategoryListView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     schema = CategorySchema()
 
+    @method_decorator(condition(
+        etag_func=lambda request, client_id: get_client_catalog_etag(request, client_id, 'categories', request.user.id),
+    ))
     def get(self, request, client_id):
         """
         List of categories of the logged in user
         """
-        client = get_object_or_404(request.user.clients, pk=client_id)
-        account = get_object_or_404(client.account_set, user=request.user)
-        categories = Category.objects.filter(product__clientprice__client=client,
-                                             specialty__in=account.specialties.all()).distinct()
-        category_ids = categories.values_list('id', flat=True)
-        categories = list(categories) + list(Category.get_all_parent_categories(category_ids))
-        category_serializer = CategorySerializer(set(categories), many=True)
+        authorization_context = AuthorizationContext.for_user(request.user)
+        categories = get_client_categories(client_id, authorization_context.get_specialty_ids(client_id))
+        category_serializer = CategorySerializer(categories, many=True)
         return Response(category_serializer.data)
 
 
 class ProductListView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     schema = ProductSchema()
 
+    @method_decorator(condition(
+        etag_func=lambda request, client_id, category_id: get_client_catalog_etag(
+            request, client_id, 'products', category_id, bool(request.GET.get('sub_categories'))
+        ),
+    ))
     def get(self, request, client_id, category_id):
         """
         List of devices of the category
         """
-        client = get_object_or_404(request.user.clients, pk=client_id)
-        selected_products = Product.objects.filter(category_id=category_id, enabled=True)
-        products = selected_products\
-            .prefetch_price_with_discounts(client, discount_apply_types=[ON_DOCTOR_ORDER]) \
-            .prefetch_features() \
-            .select_related('manufacturer')\
-            .unused_bulk_items_count_by_client(client)
+        sub_categories = bool(request.query_params.get('sub_categories'))
 
-        client_inventory_bulk_discounts = Discount.objects.available_in_client_inventory(client).to_client_prices_dict()
-        context = {'client_inventory_bulk_discounts': client_inventory_bulk_discounts}
-        return Response(ProductSerializer(products, many=True, context=context).data)
+        def build_product_list():
+            client = Client.objects.get(pk=client_id)
+            if sub_categories:
+                selected_products = Product.objects.in_category_tree([category_id]).filter(enabled=True)
+            else:
+                selected_products = Product.objects.filter(category_id=category_id, enabled=True)
+            products = selected_products.prefetch_catalog(client)
+            return FastProductSerializer(products, many=True, context=get_product_serializer_context(client)).data
 
+        product_list, hit = get_product_list(client_id, category_id, sub_categories, build_product_list)
+        return Response(product_list, headers={'X-Cache': 'HIT' if hit else 'MISS'})
 
-class ItemListView(APIView):
-    authentication_classes = (TokenAuthentication,)
+
+class ItemListView(ListResponseMixin, APIView):
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get(self, request, client_id, product_id):
-        client = get_object_or_404(request.user.clients, pk=client_id)
-        device = get_object_or_404(client.device_set, product_id=product_id)
-        items = device.item_set.filter(purchase_type=BULK_PURCHASE, is_used=False).all()
-        return Response(ItemSerializer(items, many=True).data)
+        AuthorizationContext.for_user(request.user).get_account_or_404(client_id)
+        device = get_object_or_404(Device, client_id=client_id, product_id=product_id)
+        items = device.item_set.filter(purchase_type=BULK_PURCHASE, is_used=False)
+        return self.list_response(items, ItemSerializer)
 
 
 class FeatureListView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
+    @method_decorator(condition(
+        etag_func=lambda request, product_id: get_catalog_etag('features', product_id),
+    ))
     def get(self, request, product_id):
         product = get_object_or_404(Product, pk=product_id)
         features = product.feature_set.filter(value__isnull=False).select_related(
@@ -82,8 +130,124 @@ class FeatureListView(APIView):
         return Response(FeatureSerializer(features, many=True).data)
 
 
+@method_decorator(gzip_page, name='dispatch')
+class CatalogBootstrapView(APIView):
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    sections = ('clients', 'categories', 'products', 'preferences')
+
+    def get(self, request, client_id):
+        """
+        Clients, categories, products with their features and preference questions by category, in one response.
+        Sections whose version is passed back as ?<section>=<version> are unchanged and omitted.
+        """
+        authorization_context = AuthorizationContext.for_user(request.user)
+        authorization_context.get_account_or_404(client_id)
+        client = get_object_or_404(Client, pk=client_id)
+        categories = get_client_categories(client_id, authorization_context.get_specialty_ids(client_id))
+        category_ids = sorted(category.id for category in categories)
+        clients = ClientSerializer(request.user.clients.order_by('id'), many=True).data
+
+        versions = {
+            'clients': md5(str(clients).encode()).hexdigest(),
+            'categories': get_catalog_etag('categories', request.user.id, client_id=client_id),
+            'products': get_catalog_etag('bootstrap', *category_ids, client_id=client_id),
+            'preferences': md5(f'{Preference.questions_version()}:{category_ids}'.encode()).hexdigest(),
+        }
+        builders = {
+            'clients': lambda: clients,
+            'categories': lambda: CategorySerializer(categories, many=True).data,
+            'products': lambda: get_catalog_cache().get_or_set(
+                f'catalog:{client_id}:bootstrap:products:{versions["products"]}',
+                lambda: self.get_products(client, category_ids), None
+            ),
+            'preferences': lambda: self.get_preferences(client, categories),
+        }
+
+        bootstrap = {'versions': versions}
+        for section in self.sections:
+            if request.query_params.get(section) != versions[section]:
+                bootstrap[section] = builders[section]()
+        return Response(bootstrap)
+
+    @staticmethod
+    def get_products(client, category_ids):
+        products = list(Product.objects.filter(category_id__in=category_ids, enabled=True).prefetch_catalog(client))
+        product_list = FastProductSerializer(products, many=True, context=get_product_serializer_context(client)).data
+        category_products = defaultdict(list)
+        for product, data in zip(products, product_list):
+            category_products[product.category_id].append(data)
+        return dict(category_products)
+
+    @staticmethod
+    def get_preferences(client, categories):
+        questions = Preference.get_preferences_by_categories_client(categories, client)
+        return dict((category_id, QuestionSerializer(category_questions, many=True).data)
+                    for category_id, category_questions in questions.items())
+
+
+class CatalogChangeListView(APIView):
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, client_id):
+        """
+        Products, features, client prices and discounts changed since ?token=<sync token>.
+        Without a valid sync token, the whole catalog of the client is returned with reset set.
+        """
+        AuthorizationContext.for_user(request.user).get_account_or_404(client_id)
+        since = CatalogChange.parse_sync_token(request.query_params.get('token'))
+        reset = since is None
+        if reset:
+            sync_position, _ = CatalogChange.get_sync_position()
+        else:
+            actions, sync_position = CatalogChange.objects.for_client(client_id).latest_actions(since)
+
+        changes = {}
+        for model, (section, queryset, serializer_class) in self.get_sections(client_id).items():
+            if reset:
+                objects, deleted_ids = queryset, []
+            else:
+                changed_ids = set(object_id for change_model, object_id in actions if change_model == model)
+                objects = list(queryset.filter(id__in=changed_ids)) if changed_ids else []
+                deleted_ids = sorted(changed_ids - set(obj.id for obj in objects))
+            changes[section] = {'updated': serializer_class(objects, many=True).data, 'deleted': deleted_ids}
+
+        return Response({'token': CatalogChange.make_sync_token(sync_position), 'reset': reset, 'changes': changes})
+
+    @staticmethod
+    def get_sections(client_id):
+        """
+        Section name, catalog objects of the client and serializer by changed model.
+        Changed objects missing from the catalog of the client are reported as deleted.
+        """
+        return {
+            'product': (
+                'products',
+                Product.objects.filter(clientprice__client_id=client_id, enabled=True).select_related('manufacturer'),
+                ProductSyncSerializer,
+            ),
+            'feature': (
+                'features',
+                Feature.objects.filter(product__clientprice__client_id=client_id, product__enabled=True,
+                                       value__isnull=False).select_related('category_feature__shared_image'),
+                FeatureSyncSerializer,
+            ),
+            'clientprice': (
+                'client_prices',
+                ClientPrice.objects.filter(client_id=client_id),
+                ClientPriceSyncSerializer,
+            ),
+            'discount': (
+                'discounts',
+                Discount.objects.filter(client_price__client_id=client_id).select_related('shared_image'),
+                DiscountSyncSerializer,
+            ),
+        }
+
+
 class PhysicianMarketshareView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get(self, request, client_id, procedure_date=''):
@@ -94,18 +258,19 @@ class PhysicianMarketshareView(APIView):
 
         month = procedure_time.month
         year = procedure_time.year
-        physician = get_object_or_404(request.user.account_set,
-                                      role__priority=RolePriority.PHYSICIAN.value,
-                                      client_id=client_id)
-        monthly_marketshare = Item.objects.used_by_physician(physician).used_in_period(year, month).marketshare()
-        annual_marketshare = Item.objects.used_by_physician(physician).used_in_period(year).marketshare()
+        physician = AuthorizationContext.for_user(request.user).get_account_or_404(client_id,
+                                                                                   RolePriority.PHYSICIAN.value)
+        marketshare = ItemRollup.objects.used_by_physician(physician).used_in_period(year).marketshare_windows({
+            'monthly': period_window(year, month),
+            'annual': period_window(year),
+        })
 
         return Response([
             {
                 'name': f'{month_name[month]}, {year}',
-                'marketshare': MarketshareSerializer(monthly_marketshare, many=True).data
+                'marketshare': FastMarketshareSerializer(marketshare['monthly'], many=True).data
             }, {
                 'name': f'{year} to Date',
-                'marketshare': MarketshareSerializer(annual_marketshare, many=True).data
+                'marketshare': FastMarketshareSerializer(marketshare['annual'], many=True).data
             }
         ])
@@ -14,9 +14,9 @@ from import_export.admin import ImportExportActionModelAdmin
 
 from device.models import Specialty
 from hospital.models import Client, Device, Role, Account, Item
-from hospital.resources import AccountResource, ItemResource
+from hospital.resources import AccountResource, BulkItemResource, ItemResource
 from hospital.constants import BULK_PURCHASE
-from neptune.admin import AutoCompleteSearchAdminMixin
+from neptune.admin import AutoCompleteSearchAdminMixin, StreamingExportAdminMixin
 
 
 class ClientForm(FixedModelForm):
@@ -63,7 +63,7 @@ class AccountForm(forms.ModelForm):
         }
 
 
-class AccountAdmin(ImportExportActionModelAdmin):
+class AccountAdmin(StreamingExportAdminMixin, ImportExportActionModelAdmin):
     resource_class = AccountResource
     form = AccountForm
     list_display = ('user', 'role', 'client_link')
@@ -229,7 +229,7 @@ class DeviceAdmin(admin.ModelAdmin):
         )
 
 
-class ItemAdmin(ImportExportActionModelAdmin):
+class ItemAdmin(StreamingExportAdminMixin, ImportExportActionModelAdmin):
     resource_class = ItemResource
     list_filter = ('is_used', 'purchase_type', 'device__product__category__specialty',
                    'device__product__manufacturer', 'device__client')
@@ -286,6 +286,9 @@ class ItemAdmin(ImportExportActionModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).order_by('is_used').prefetch_related('discounts')
 
+    def get_import_resource_class(self):
+        return BulkItemResource
+
 
 admin.site.register(Client, ClientAdmin)
 admin.site.register(Account, AccountAdmin)
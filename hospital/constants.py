@@ -25,6 +25,7 @@ class RolePriority(Enum):
 
 
 PRODUCT_ITEM_INDENTIFIER_SIZE = 6
+AUTHORIZATION_CONTEXT_VERSION_KEY = 'authorization-context-version'
 BULK_PURCHASE = 1
 CONSIGNMENT_PURCHASE = 2
 PURCHASE_TYPES = (
@@ -32,6 +33,18 @@ PURCHASE_TYPES = (
     (CONSIGNMENT_PURCHASE, _('Consignment')),
 )
 
+EXPIRY_HORIZONS = (30, 60)
+EXPIRY_MAX_HORIZONS = 10
+EXPIRY_GROUPS = {
+    'manufacturer': ('device__product__manufacturer_id', 'device__product__manufacturer__name'),
+    'category': ('device__product__category_id', 'device__product__category__name'),
+    'device': ('device_id', 'device__product__name'),
+}
+
+ITEM_IMPORT_CHUNK_SIZE = 1000
+ITEM_IDENTIFIER_SEQUENCE = 'hospital_item_identifier_seq'
+ITEM_SEQUENCE_BLOCK_SIZE = 100
+
 COUNTRIES = (
     ('AF', _('Afghanistan')),
     ('AX', _('Åland Islands')),
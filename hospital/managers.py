@@ -1,19 +1,125 @@
-from django.db.models import QuerySet, Sum, Count, F, Avg, FloatField
-from django.db.models.functions import TruncMonth
+from datetime import timedelta
+
+from django.db.models import QuerySet, Sum, Count, F, Avg, FloatField, Case, When, Value, DecimalField, Q
+from django.db.models.functions import TruncMonth, ExtractYear
+
+from hospital.constants import BULK_PURCHASE
+from price.models import ClientPrice
+from tracker.managers import period_window
+from tracker.models import ItemRollup, PurchasePrice
 
 
 class ItemQuerySet(QuerySet):
+    def bulk_create(self, objs, batch_size=None):
+        """
+        Identify items without an identifier first, identifier numbers of lot items are allocated all at once.
+        """
+        objs = list(objs)
+        unidentified_items = [item for item in objs if not item.identifier]
+        numbers = iter(self.model.identifier_allocator.allocate(
+            len([item for item in unidentified_items if not item.has_serial_number])
+        ))
+        for item in unidentified_items:
+            item.update_identifier(None if item.has_serial_number else next(numbers))
+        return super().bulk_create(objs, batch_size=batch_size)
+
+    def redeem(self):
+        """
+        Redeem current discounts of all items with a fixed number of queries.
+        Returns (item, redemption) pairs, redemption is None for items without client price.
+        """
+        items = list(self.select_related('device', 'rep_case').prefetch_related('discounts'))
+        if not items:
+            return []
+
+        client_prices = ClientPrice.objects.filter(
+            product_id__in=set(item.device.product_id for item in items),
+            client_id__in=set(item.device.client_id for item in items),
+        )
+        client_prices = dict(((client_price.product_id, client_price.client_id), client_price)
+                             for client_price in client_prices)
+
+        priced_items = []
+        for item in items:
+            client_price = client_prices.get((item.device.product_id, item.device.client_id))
+            if client_price:
+                priced_items.append((client_price, item.discounts.all(), item))
+        redemptions = dict(zip((item.id for _, _, item in priced_items), ClientPrice.redeem_batch(priced_items)))
+        return [(item, redemptions.get(item.id)) for item in items]
+
+    def update_costs(self, items, batch_size=500):
+        """
+        Write cost and saving of the given items back with one UPDATE per batch.
+        """
+        def cost_case(field):
+            return Case(*[When(pk=item.pk, then=Value(getattr(item, field))) for item in batch],
+                        output_field=DecimalField(max_digits=20, decimal_places=2))
+
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            self.filter(pk__in=[item.pk for item in batch]).update(cost=cost_case('cost'),
+                                                                   saving=cost_case('saving'))
+
+    def app_keys(self):
+        """
+        (category, client, year, level, cost type) keys of the purchase prices the used items are counted in.
+        """
+        return self.filter(is_used=True, rep_case__procedure_date__isnull=False).annotate(
+            year=ExtractYear('rep_case__procedure_date')
+        ).values_list('device__product__category_id', 'device__client_id', 'year',
+                      'device__product__level', 'cost_type').order_by().distinct()
+
+    def update_app(self):
+        """
+        Recompute purchase prices affected by used items once per (category, client, year, level, cost type).
+        """
+        PurchasePrice.mark_dirty(*self.app_keys())
+
+    def rollup_keys(self):
+        return ItemRollup.rolled_up_items(self).values_list(*ItemRollup.item_key_fields).distinct()
+
+    def update_rollups(self):
+        """
+        Recount item rollups affected by the items once per rollup key.
+        """
+        ItemRollup.mark_dirty(*self.rollup_keys())
+
     def used_by_client(self, client):
         return self.filter(rep_case__client=client)
 
+    def used_by_client_tree(self, client):
+        """
+        Items used at a client or at any of its affiliates, at every level below it.
+        """
+        from hospital.models import ClientAncestor
+
+        affiliate_ids = ClientAncestor.objects.filter(ancestor=client).values('client_id')
+        return self.filter(Q(rep_case__client=client) | Q(rep_case__client__in=affiliate_ids))
+
     def used_by_physician(self, physician):
-        return self.used_by_client(physician.client).filter(rep_case__physician=physician)
+        return self.used_by_client(physician.client_id).filter(rep_case__physician=physician)
 
     def used_in_period(self, year, month=None):
-        queryset = self.filter(rep_case__procedure_date__year=year)
-        if month:
-            queryset = queryset.filter(rep_case__procedure_date__month=month)
-        return queryset
+        return self.filter(period_window(year, month, date_field='rep_case__procedure_date'))
+
+    def unused_bulk(self):
+        return self.filter(is_used=False, purchase_type=BULK_PURCHASE)
+
+    def expiry_buckets(self, horizons, today, group_by=None):
+        """
+        Count all items, expired items and items expiring between consecutive horizons, in days from today,
+        with one query. Counts are aggregated over all items, or grouped by the given fields.
+        """
+        buckets = {'available': Count('id'), 'expired': Count('id', filter=Q(expired_date__lt=today))}
+        start = today
+        for horizon in sorted(horizons):
+            end = today + timedelta(days=horizon)
+            buckets[f'expiring{horizon}'] = Count('id', filter=Q(expired_date__gte=start, expired_date__lt=end))
+            start = end
+
+        if not group_by:
+            return self.aggregate(**buckets)
+        return self.values(*group_by).annotate(**buckets).order_by(*group_by)
 
     def marketshare(self):
         return self.values('device__product__manufacturer').annotate(
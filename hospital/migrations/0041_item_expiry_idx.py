@@ -0,0 +1,17 @@
+# Generated by Django 2.0.9 on 2026-10-18 07:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0039_item_saving'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['device', 'is_used', 'purchase_type', 'expired_date'], name='item_expiry_idx'),
+        ),
+    ]
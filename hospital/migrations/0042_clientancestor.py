@@ -0,0 +1,45 @@
+# Generated by Django 2.0.9 on 2026-10-18 07:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_client_ancestors(apps, schema_editor):
+    Client = apps.get_model('hospital', 'Client')
+    ClientAncestor = apps.get_model('hospital', 'ClientAncestor')
+    parent_ids = dict(Client.objects.values_list('id', 'parent_id'))
+    client_ancestors = []
+    for client_id in parent_ids:
+        ancestor_ids = set()
+        ancestor_id = parent_ids.get(client_id)
+        depth = 1
+        while ancestor_id and ancestor_id not in ancestor_ids:
+            ancestor_ids.add(ancestor_id)
+            client_ancestors.append(ClientAncestor(client_id=client_id, ancestor_id=ancestor_id, depth=depth))
+            ancestor_id = parent_ids.get(ancestor_id)
+            depth += 1
+    ClientAncestor.objects.bulk_create(client_ancestors)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0041_item_expiry_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientAncestor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='hospital.Client')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='hospital.Client')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='clientancestor',
+            unique_together={('client', 'ancestor')},
+        ),
+        migrations.RunPython(build_client_ancestors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0042_clientancestor'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                'CREATE SEQUENCE hospital_item_identifier_seq',
+                "SELECT setval('hospital_item_identifier_seq', COALESCE(MAX(id), 0) + 1, false) FROM hospital_item",
+            ],
+            reverse_sql='DROP SEQUENCE hospital_item_identifier_seq',
+        ),
+    ]
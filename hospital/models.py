@@ -1,8 +1,10 @@
+import threading
+from collections import deque
 from functools import partial
 
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import connection, models
 from django.template.loader import render_to_string
 from django.utils.translation import gettext_lazy as _
 
@@ -10,9 +12,11 @@ from hospital.constants import COUNTRIES
 from hospital.converter import int_to_b32
 from hospital.managers import ItemQuerySet
 from neptune.utils import make_imagefield_filepath
+from price.models import ClientPrice
 from price.constants import COST_TYPES, UNIT_COST, NOT_IMPLANTED_REASONS, PRE_DOCTOR_ORDER
-from tracker.models import PurchasePrice
-from hospital.constants import RolePriority, PURCHASE_TYPES, BULK_PURCHASE, PRODUCT_ITEM_INDENTIFIER_SIZE
+from tracker.models import ItemRollup, PurchasePrice, RepCase
+from hospital.constants import RolePriority, PURCHASE_TYPES, BULK_PURCHASE, PRODUCT_ITEM_INDENTIFIER_SIZE, \
+    ITEM_IDENTIFIER_SEQUENCE, ITEM_SEQUENCE_BLOCK_SIZE
 
 User = get_user_model()
 
@@ -35,6 +39,17 @@ class Client(models.Model):
     def __str__(self):
         return self.name
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__original_parent_id = self.__dict__.get('parent_id')
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding or self.parent_id != self.__original_parent_id:
+            ClientAncestor.rebuild([self.id])
+        self.__original_parent_id = self.parent_id
+
     def devices_by_specialties(self):
         devices_by_specialties = {}
         products = self.products.select_related('category__specialty').all()
@@ -48,21 +63,60 @@ class Client(models.Model):
         return devices_by_specialties
 
     def set_children(self, children_ids):
+        original_children_ids = list(self.children.values_list('id', flat=True))
         children = Client.objects.filter(id__in=children_ids)
         self.children.set(children)
+        ClientAncestor.rebuild(original_children_ids + [int(child_id) for child_id in children_ids])
 
     @property
     def root_parent_id(self):
-        if self.parent:
-            return self.parent.root_parent_id
-        else:
-            return self.id
+        return self.ancestor_links.order_by('-depth').values_list('ancestor_id', flat=True).first() or self.id
 
     @property
     def items(self):
         return Item.objects.filter(device__client=self).distinct()
 
 
+class ClientAncestor(models.Model):
+    """
+    Closure of Client.parent, linking every client to all of its parent clients.
+    """
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='ancestor_links')
+    ancestor = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='descendant_links')
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ('client', 'ancestor')
+
+    @classmethod
+    def build_links(cls, parent_ids, client_ids):
+        for client_id in client_ids:
+            ancestor_ids = set()
+            ancestor_id = parent_ids.get(client_id)
+            depth = 1
+            while ancestor_id and ancestor_id not in ancestor_ids:
+                ancestor_ids.add(ancestor_id)
+                yield cls(client_id=client_id, ancestor_id=ancestor_id, depth=depth)
+                ancestor_id = parent_ids.get(ancestor_id)
+                depth += 1
+
+    @classmethod
+    def rebuild(cls, client_ids=None):
+        """
+        Rebuild ancestors of given clients and their affiliates, or of all clients.
+        """
+        parent_ids = dict(Client.objects.values_list('id', 'parent_id'))
+        if client_ids is None:
+            client_ids = set(parent_ids)
+            cls.objects.all().delete()
+        else:
+            client_ids = set(client_ids).union(
+                cls.objects.filter(ancestor_id__in=client_ids).values_list('client_id', flat=True)
+            ).intersection(parent_ids)
+            cls.objects.filter(client_id__in=client_ids).delete()
+        cls.objects.bulk_create(cls.build_links(parent_ids, client_ids))
+
+
 class Role(models.Model):
     name = models.CharField(max_length=255, default='Physician', unique=True)
     priority = models.PositiveSmallIntegerField(default=RolePriority.default().value,
@@ -90,6 +144,32 @@ class Account(models.Model):
         return f'{self.role.name} {self.user.email}'
 
 
+class SequenceAllocator(threading.local):
+    """
+    Values of a database sequence, reserved in blocks and handed out in memory.
+    Sequence values are never given twice, even when the reserving transaction is rolled back.
+    Reserved values are kept per thread, so the leftovers of a block carry over to the next requests served
+    by the same thread, leaving gaps in the sequence order; reset drops them.
+    """
+    def __init__(self, sequence, block_size=ITEM_SEQUENCE_BLOCK_SIZE):
+        self.sequence = sequence
+        self.block_size = block_size
+        self.values = deque()
+
+    def reserve(self, count):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [self.sequence, count])
+            self.values.extend(value for value, in cursor.fetchall())
+
+    def allocate(self, count=1):
+        if len(self.values) < count:
+            self.reserve(max(count - len(self.values), self.block_size))
+        return [self.values.popleft() for _ in range(count)]
+
+    def reset(self):
+        self.values.clear()
+
+
 class Item(models.Model):
     device = models.ForeignKey('hospital.Device', on_delete=models.CASCADE)
     rep_case = models.ForeignKey('tracker.RepCase', on_delete=models.SET_NULL, null=True, blank=True)
@@ -107,79 +187,199 @@ class Item(models.Model):
     not_implanted_reason = models.PositiveSmallIntegerField(_('Not implanted reason'), choices=NOT_IMPLANTED_REASONS,
                                                             null=True, blank=True)
 
-    __original_is_used = None
+    __original_app_state = None
+    __original_rollup_state = None
+    __original_catalog_state = None
+    __original_identity = None
 
     objects = ItemQuerySet.as_manager()
+    id_allocator = SequenceAllocator('hospital_item_id_seq')
+    identifier_allocator = SequenceAllocator(ITEM_IDENTIFIER_SEQUENCE)
 
     class Meta:
         verbose_name_plural = 'Serial numbers'
+        indexes = [
+            models.Index(fields=['device', 'is_used', 'purchase_type', 'expired_date'], name='item_expiry_idx'),
+        ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.__original_is_used = self.is_used
+        self.__original_app_state = self.app_state
+        self.__original_rollup_state = self.rollup_state
+        self.__original_catalog_state = self.catalog_state
+        self.__original_identity = self.identity
         self.__bulk_discount = None
 
     def __str__(self):
         return f'{self.device.hospital_number}: {self.identifier} expired on {self.expired_date}'
 
+    @property
+    def identity(self):
+        return self.__dict__.get('serial_number'), self.__dict__.get('lot_number')
+
+    @property
+    def has_serial_number(self):
+        return bool(self.serial_number and self.serial_number.strip())
+
     def update_item_identifier(self):
-        if self.id:
-            persistent_item = Item.objects.get(pk=self.id)
-            if persistent_item.lot_number != self.lot_number or persistent_item.serial_number != self.serial_number:
-                self.update_identifier()
-        else:
+        if self._state.adding or self.identity != self.__original_identity:
             self.update_identifier()
 
-    def update_identifier(self):
-        if (self.serial_number is not None) and self.serial_number.strip() == '':
+    def update_identifier(self, number=None):
+        """
+        Identify the item by its serial number, or by its lot number and a number allocated from a sequence.
+        """
+        if not self.has_serial_number:
             self.serial_number = None
 
         if not (self.serial_number or self.lot_number):
             raise AttributeError('Either serial number or lot number must be present.')
 
-        max_pk_item = self.__class__.objects.order_by('-id').first()
-        pk = self.pk if self.pk else (max_pk_item.pk + 1 if max_pk_item else 1)
-        self.identifier = self.serial_number or f'{self.lot_number}-{int_to_b32(pk, PRODUCT_ITEM_INDENTIFIER_SIZE)}'
+        if self.serial_number:
+            self.identifier = self.serial_number
+        else:
+            number = number or self.identifier_allocator.allocate()[0]
+            self.identifier = f'{self.lot_number}-{int_to_b32(number, PRODUCT_ITEM_INDENTIFIER_SIZE)}'
 
     def update_app(self):
         if self.rep_case and self.rep_case.procedure_date:
-            year = self.rep_case.procedure_date.year
-            PurchasePrice.update(
-                category=self.device.product.category,
-                client=self.device.client,
-                year=year,
-                level=self.device.product.level,
-                cost_type=self.cost_type,
-            )
+            PurchasePrice.mark_dirty((
+                self.device.product.category_id,
+                self.device.client_id,
+                self.rep_case.procedure_date.year,
+                self.device.product.level,
+                self.cost_type,
+            ))
+
+    @property
+    def app_state(self):
+        return tuple(self.__dict__.get(field) for field in ('is_used', 'cost', 'cost_type', 'device_id', 'rep_case_id'))
+
+    def get_app_contribution(self, is_used, cost, cost_type, device_id, rep_case_id):
+        """
+        (purchase price key, cost) pair the given item state adds to its client APP, None if it isn't counted.
+        """
+        if not (is_used and cost and cost > 0):
+            return None
+
+        device_values, rep_case_values = self.get_device_values(device_id), self.get_rep_case_values(rep_case_id)
+        if not (device_values and rep_case_values and rep_case_values[2]):
+            return None
+        client_id, category_id, _, level = device_values
+        return (category_id, client_id, rep_case_values[2].year, level, cost_type), cost
+
+    def get_device_values(self, device_id):
+        """
+        (client id, category id, manufacturer id, level) of a device, None when there is no such device anymore.
+        """
+        if device_id is None:
+            return None
+        if device_id == self.device_id and Item.device.field.is_cached(self):
+            product = self.device.product
+            return self.device.client_id, product.category_id, product.manufacturer_id, product.level
+        return Device.objects.filter(pk=device_id).values_list(
+            'client_id', 'product__category_id', 'product__manufacturer_id', 'product__level'
+        ).first()
+
+    def get_rep_case_values(self, rep_case_id):
+        """
+        (client id, physician id, procedure date) of a rep case, None when there is no such rep case anymore.
+        """
+        if rep_case_id is None:
+            return None
+        if rep_case_id == self.rep_case_id and Item.rep_case.field.is_cached(self):
+            rep_case = self.rep_case
+            procedure_date = RepCase._meta.get_field('procedure_date').to_python(rep_case.procedure_date)
+            return rep_case.client_id, rep_case.physician_id, procedure_date
+        return RepCase.objects.filter(pk=rep_case_id).values_list('client_id', 'physician_id', 'procedure_date').first()
+
+    @property
+    def rollup_state(self):
+        return tuple(self.__dict__.get(field) for field in ('cost_type', 'device_id', 'rep_case_id', 'cost', 'saving'))
+
+    def get_rollup_key(self, cost_type, device_id, rep_case_id, *totals):
+        """
+        Key of the item rollup the given item state is counted in, None if it isn't counted.
+        """
+        device_values, rep_case_values = self.get_device_values(device_id), self.get_rep_case_values(rep_case_id)
+        if not (device_values and rep_case_values and rep_case_values[2]):
+            return None
+        _, category_id, manufacturer_id, level = device_values
+        client_id, physician_id, procedure_date = rep_case_values
+        return (client_id, physician_id, category_id, manufacturer_id, level, cost_type, procedure_date.replace(day=1))
+
+    @property
+    def catalog_state(self):
+        """
+        (is used, purchase type, device id) of the item, the fields client catalogs depend on.
+        """
+        return tuple(self.__dict__.get(field) for field in ('is_used', 'purchase_type', 'device_id'))
+
+    @property
+    def original_catalog_state(self):
+        return self.__original_catalog_state
+
+    def update_rollups(self, original_rollup_state):
+        rollup_keys = set([self.get_rollup_key(*self.rollup_state)])
+        if original_rollup_state:
+            rollup_keys.add(self.get_rollup_key(*original_rollup_state))
+        ItemRollup.mark_dirty(*filter(None, rollup_keys))
 
     def save(self, *args, discounts=None, update_app=None, **kwargs):
+        original_app_state = None if self._state.adding else self.__original_app_state
+        original_rollup_state = None if self._state.adding else self.__original_rollup_state
         self.update_item_identifier()
         super().save(*args, **kwargs)
 
         if update_app is None:
-            update_app = (self.__original_is_used != self.is_used) or (not self.id and self.is_used)
-        if update_app:
+            app_state = self.app_state
+            if app_state != original_app_state:
+                PurchasePrice.update_cost(removed=original_app_state and self.get_app_contribution(*original_app_state),
+                                          added=self.get_app_contribution(*app_state))
+        elif update_app:
             self.update_app()
+        if self.rollup_state != original_rollup_state:
+            self.update_rollups(original_rollup_state)
+        self.__original_app_state = self.app_state
+        self.__original_rollup_state = self.rollup_state
+        self.__original_catalog_state = self.catalog_state
+        self.__original_identity = self.identity
+
+    def delete(self, *args, **kwargs):
+        app_contribution = self.get_app_contribution(*self.__original_app_state)
+        rollup_key = self.get_rollup_key(*self.__original_rollup_state)
+        result = super().delete(*args, **kwargs)
+        PurchasePrice.update_cost(removed=app_contribution)
+        if rollup_key:
+            ItemRollup.mark_dirty(rollup_key)
+        return result
 
     def save_bulk_discount(self):
-        if self.__bulk_discount:
-            self.discounts.add(self.__bulk_discount)
-            self.__bulk_discount = None
+        bulk_discount = self.pop_bulk_discount()
+        if bulk_discount:
+            self.discounts.add(bulk_discount)
+
+    def pop_bulk_discount(self):
+        bulk_discount, self.__bulk_discount = self.__bulk_discount, None
+        return bulk_discount
 
     def build_bulk_discount(self, bulk_discount):
         self.__bulk_discount = bulk_discount
 
     def update_cost(self, discounts):
         try:
-            client_price = self.device.product.clientprice_set.get(client=self.device.client)
-            redemption = client_price.redeem(discounts, self)
-            self.cost = redemption['total_cost']
-            self.saving = redemption['point_of_sales_saving']
+            client_price = ClientPrice.objects.get(product_id=self.device.product_id, client_id=self.device.client_id)
+            self.apply_redemption(client_price.redeem(discounts, self))
         except ObjectDoesNotExist:
             pass
 
+    def apply_redemption(self, redemption):
+        if redemption:
+            self.cost = redemption['total_cost']
+            self.saving = redemption['point_of_sales_saving']
+
     def refresh_cost(self):
-        self.update_cost(self.discounts.all())
+        self.update_cost(list(self.discounts.all()))
 
     @property
     def bulk_discount(self):
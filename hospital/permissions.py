@@ -1,20 +1,106 @@
+from uuid import uuid4
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.http import Http404
 from rest_framework.permissions import BasePermission
 
-from hospital.constants import RolePriority
+from api.cache import get_auth_token_cache, get_auth_token_cache_timeout
+from hospital.constants import RolePriority, AUTHORIZATION_CONTEXT_VERSION_KEY
+from hospital.models import Account
+
+
+class AuthorizationContext(object):
+    """
+    Accounts of an authenticated user with their clients, roles and specialties, loaded once and cached
+    along with verified auth tokens, so that account changes reach other processes as token revocations do.
+    """
+    ACCOUNT_FIELDS = [field.attname for field in Account._meta.concrete_fields]
+
+    def __init__(self, user_id, accounts):
+        self.user_id = user_id
+        self.accounts = accounts
+
+    @staticmethod
+    def cache_key(user_id):
+        version = get_auth_token_cache().get_or_set(AUTHORIZATION_CONTEXT_VERSION_KEY, uuid4().hex, None)
+        return f'authorization:{user_id}:{version}'
+
+    @classmethod
+    def invalidate(cls, user_id=None):
+        cache = get_auth_token_cache()
+        if user_id is None:
+            cache.set(AUTHORIZATION_CONTEXT_VERSION_KEY, uuid4().hex, None)
+        else:
+            cache.delete(cls.cache_key(user_id))
+
+    @classmethod
+    def for_user(cls, user):
+        if not (user and user.is_authenticated):
+            return cls(None, [])
+
+        context = getattr(user, '_authorization_context', None)
+        if context is None:
+            cache = get_auth_token_cache()
+            cache_key = cls.cache_key(user.id)
+            accounts = cache.get(cache_key)
+            if accounts is None:
+                accounts = cls.load_accounts(user.id)
+                cache.set(cache_key, accounts, get_auth_token_cache_timeout(cache))
+            context = user._authorization_context = cls(user.id, accounts)
+        return context
+
+    @staticmethod
+    def load_accounts(user_id):
+        accounts = Account.objects.filter(user_id=user_id).annotate(
+            specialty_ids=ArrayAgg('specialties__id')
+        ).values(*AuthorizationContext.ACCOUNT_FIELDS, 'role__priority', 'specialty_ids').order_by('id')
+        return [dict(account, specialty_ids=[specialty_id for specialty_id in account['specialty_ids'] if specialty_id])
+                for account in accounts]
+
+    def filter_accounts(self, client_id=None, role_priority=None):
+        return [account for account in self.accounts
+                if (client_id is None or account['client_id'] == int(client_id)) and
+                (role_priority is None or account['role__priority'] == role_priority)]
+
+    def has_access(self, role_priority=None, client_id=None):
+        return bool(self.filter_accounts(client_id, role_priority))
+
+    @property
+    def client_ids(self):
+        return [account['client_id'] for account in self.accounts]
+
+    def get_specialty_ids(self, client_id):
+        return [specialty_id
+                for account in self.filter_accounts(client_id) for specialty_id in account['specialty_ids']]
+
+    def get_account(self, client_id, role_priority=None):
+        """
+        Account of the user at a client as an Account instance, without querying it.
+        """
+        accounts = self.filter_accounts(client_id, role_priority)
+        if accounts:
+            return Account.from_db('default', self.ACCOUNT_FIELDS,
+                                   [accounts[0][field] for field in self.ACCOUNT_FIELDS])
+
+    def get_account_or_404(self, client_id, role_priority=None):
+        account = self.get_account(client_id, role_priority)
+        if account is None:
+            raise Http404('No account matches the given query.')
+        return account
 
 
 class HasPhysicianAccess(BasePermission):
     message = 'Unauthorized physician access'
 
     def has_permission(self, request, view):
-        return request.user and request.user.account_set.filter(role__priority=RolePriority.PHYSICIAN.value).exists()
+        return AuthorizationContext.for_user(request.user).has_access(RolePriority.PHYSICIAN.value)
 
 
 class HasAdminAccess(BasePermission):
     message = 'Unauthorized admin access'
 
     def has_permission(self, request, view):
-        return request.user and request.user.account_set.filter(role__priority=RolePriority.ADMIN.value).exists()
+        return AuthorizationContext.for_user(request.user).has_access(RolePriority.ADMIN.value)
 
 
 class IsClientAdmin(BasePermission):
@@ -22,8 +108,9 @@ class IsClientAdmin(BasePermission):
 
     def has_permission(self, request, view, *args, **kwargs):
         client_id = view.kwargs.get('client_id')
-        return request.user and request.user.account_set.filter(role__priority=RolePriority.ADMIN.value,
-                                                                client_id=client_id).exists()
+        return client_id is not None and AuthorizationContext.for_user(request.user).has_access(
+            RolePriority.ADMIN.value, client_id
+        )
 
 
 class IsClientPhysician(BasePermission):
@@ -31,5 +118,6 @@ class IsClientPhysician(BasePermission):
 
     def has_permission(self, request, view, *args, **kwargs):
         client_id = view.kwargs.get('client_id')
-        return request.user and request.user.account_set.filter(role__priority=RolePriority.PHYSICIAN.value,
-                                                                client_id=client_id).exists()
+        return client_id is not None and AuthorizationContext.for_user(request.user).has_access(
+            RolePriority.PHYSICIAN.value, client_id
+        )
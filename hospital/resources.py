@@ -1,19 +1,49 @@
+import traceback
+
 from import_export import resources, fields, widgets
+from import_export.instance_loaders import CachedInstanceLoader
+from import_export.results import RowResult
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import DatabaseError, transaction
+from django.db.models import Prefetch
 
 from account.models import User
+from device.cache import invalidate_catalog
 from device.models import Product
+from hospital.constants import ITEM_IMPORT_CHUNK_SIZE
 from hospital.models import Account, Client, Role, Item, Device
+from neptune.resources import StreamingExportResourceMixin
 from price.constants import COST_TYPES, PRE_DOCTOR_ORDER, UNIT_COST, VALUE_DISCOUNT, PERCENT_DISCOUNT
 from price.models import Discount, ClientPrice
+from tracker.models import ItemRollup, PurchasePrice
+
+
+BULK_DISCOUNT_FIELDS = ('client_price_id', 'cost_type', 'order', 'start_date', 'end_date', 'discount_type',
+                        'percent', 'value')
+
 
+def get_bulk_discount_key(**values):
+    return tuple(Discount._meta.get_field(field).to_python(values[field]) for field in BULK_DISCOUNT_FIELDS)
 
-class AccountResource(resources.ModelResource):
+
+def unique_by(objects, attribute):
+    """
+    Objects by attribute value, leaving out values shared by several objects.
+    """
+    objects_by_value = {}
+    for obj in objects:
+        objects_by_value.setdefault(getattr(obj, attribute), []).append(obj)
+    return dict((value, objects[0]) for value, objects in objects_by_value.items() if len(objects) == 1)
+
+
+class AccountResource(StreamingExportResourceMixin, resources.ModelResource):
     name = fields.Field(attribute='user__name', column_name='name')
     email = fields.Field(attribute='user__email', column_name='email')
     role = fields.Field(attribute='role__name', column_name='role')
     client = fields.Field(attribute='client__name', column_name='client')
 
+    export_select_related = ('user', 'role', 'client')
+
     class Meta:
         model = Account
         fields = ('id', 'name', 'email', 'role', 'client')
@@ -35,7 +65,7 @@ class AccountResource(resources.ModelResource):
         instance.user.save()
 
 
-class ItemResource(resources.ModelResource):
+class ItemResource(StreamingExportResourceMixin, resources.ModelResource):
     client_name = fields.Field(attribute='device__client__name', column_name='Hospital name')
     manufacturer_name = fields.Field(attribute='device__product__manufacturer__name', column_name='Manufacturer name')
     hospital_number = fields.Field(attribute='device__hospital_number', column_name='Hospital part #',
@@ -60,6 +90,8 @@ class ItemResource(resources.ModelResource):
 
     COST_TYPES_DICT = dict((name, value) for value, name in COST_TYPES)
 
+    export_select_related = ('device__client', 'device__product__manufacturer')
+
     class Meta:
         model = Item
         fields = ('id', 'client_name', 'manufacturer_name', 'hospital_number', 'model_number',
@@ -71,8 +103,69 @@ class ItemResource(resources.ModelResource):
                         'bulk_discount_percent', 'bulk_discount_value', 'discount_order',
                         'discount_start_date', 'discount_end_date')
 
+    def __init__(self):
+        super().__init__()
+        self.clients = {}
+        self.products = {}
+        self.devices = {}
+        self.client_prices = {}
+        self.bulk_discounts = {}
+
     @staticmethod
-    def _build_bulk_discount(item):
+    def cached(cache, key, load):
+        if key not in cache:
+            cache[key] = load()
+        return cache[key]
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('device__client', 'device__product__manufacturer')
+
+    def import_data_inner(self, dataset, dry_run, raise_errors, using_transactions, collect_failed_rows, **kwargs):
+        """
+        Update purchase prices and item rollups once, in the import transaction, unless the import is rolled back.
+        """
+        with PurchasePrice.deferred() as purchase_prices, ItemRollup.deferred() as rollups:
+            result = super().import_data_inner(dataset, dry_run, raise_errors, using_transactions,
+                                               collect_failed_rows, **kwargs)
+            if using_transactions and (dry_run or result.has_errors()):
+                purchase_prices.discard()
+                rollups.discard()
+            return result
+
+    def before_import(self, dataset, using_transactions, dry_run, **kwargs):
+        """
+        Preload clients, products, devices, client prices and bulk discounts referenced by the dataset.
+        """
+        rows = dataset.dict
+        client_names = set(self.get_field_value('client_name', row) for row in rows)
+        model_numbers = set(self.get_field_value('model_number', row) for row in rows)
+        self.clients = unique_by(Client.objects.filter(name__in=client_names), 'name')
+        self.products = unique_by(Product.objects.filter(model_number__in=model_numbers).select_related('manufacturer'),
+                                  'model_number')
+
+        clients = dict((client.id, client) for client in self.clients.values())
+        products = dict((product.id, product) for product in self.products.values())
+        self.devices = {}
+        for device in Device.objects.filter(client_id__in=clients, product_id__in=products):
+            device.client, device.product = clients[device.client_id], products[device.product_id]
+            self.devices[(device.client_id, device.product_id)] = device
+        self.client_prices = dict(((client_price.client_id, client_price.product_id), client_price)
+                                  for client_price in ClientPrice.objects.filter(client_id__in=clients,
+                                                                                 product_id__in=products))
+        self.bulk_discounts = dict(
+            (get_bulk_discount_key(**discount.__dict__), discount) for discount in Discount.objects.filter(
+                client_price__in=self.client_prices.values(), name='Bulk', apply_type=PRE_DOCTOR_ORDER
+            ).order_by('-id')
+        )
+
+    def get_export_prefetch_related(self):
+        return (Prefetch('discounts', queryset=Discount.objects.filter(apply_type=PRE_DOCTOR_ORDER).order_by('id'),
+                         to_attr='pre_doctor_order_discounts'),)
+
+    def _build_bulk_discount(self, item):
+        if hasattr(item, 'pre_doctor_order_discounts'):
+            return next((discount for discount in item.pre_doctor_order_discounts
+                         if discount.cost_type == item.cost_type), None) or Discount()
         return (item.id and item.bulk_discount) or Discount()
 
     def dehydrate_cost_type(self, item):
@@ -102,9 +195,12 @@ class ItemResource(resources.ModelResource):
 
     def init_instance(self, row=None):
         instance = super().init_instance(row)
-        client = Client.objects.get(name=self.get_field_value('client_name', row))
-        product = Product.objects.get(model_number=self.get_field_value('model_number', row))
-        instance.device = Device.objects.get_or_create(client=client, product=product)[0]
+        client_name = self.get_field_value('client_name', row)
+        model_number = self.get_field_value('model_number', row)
+        client = self.cached(self.clients, client_name, lambda: Client.objects.get(name=client_name))
+        product = self.cached(self.products, model_number, lambda: Product.objects.get(model_number=model_number))
+        instance.device = self.cached(self.devices, (client.id, product.id),
+                                      lambda: Device.objects.get_or_create(client=client, product=product)[0])
         return instance
 
     def get_or_init_instance(self, instance_loader, row):
@@ -120,18 +216,23 @@ class ItemResource(resources.ModelResource):
         bulk_discount_value = self.get_field_value('bulk_discount_value', row, default=0)
         if bulk_discount_percent or bulk_discount_value:
             device = instance.device
-            client_price = ClientPrice.objects.get_or_create(client=device.client, product=device.product)[0]
-            bulk_discount = client_price.discount_set.get_or_create(
-                name='Bulk',
+            client_price = self.cached(
+                self.client_prices, (device.client_id, device.product_id),
+                lambda: ClientPrice.objects.get_or_create(client=device.client, product=device.product)[0]
+            )
+            discount = dict(
                 cost_type=self.get_field_value('cost_type', row),
                 order=self.get_field_value('discount_order', row),
                 start_date=self.get_field_value('discount_start_date', row, default=None),
                 end_date=self.get_field_value('discount_end_date', row, default=None),
-                apply_type=PRE_DOCTOR_ORDER,
                 discount_type=PERCENT_DISCOUNT if bulk_discount_percent > 0 else VALUE_DISCOUNT,
                 percent=bulk_discount_percent,
                 value=bulk_discount_value,
-            )[0]
+            )
+            bulk_discount = self.cached(
+                self.bulk_discounts, get_bulk_discount_key(client_price_id=client_price.id, **discount),
+                lambda: client_price.discount_set.get_or_create(name='Bulk', apply_type=PRE_DOCTOR_ORDER, **discount)[0]
+            )
             instance.build_bulk_discount(bulk_discount)
 
         return instance, created
@@ -140,3 +241,97 @@ class ItemResource(resources.ModelResource):
         another_cost_type_orphan_discounts = instance.discounts.exclude(cost_type=instance.cost_type).all()
         instance.discounts.remove(*another_cost_type_orphan_discounts)
         instance.save_bulk_discount()
+
+
+class BulkItemResource(ItemResource):
+    """
+    Item import creating new items with batched inserts, existing items are still saved one by one.
+    """
+    chunk_size = ITEM_IMPORT_CHUNK_SIZE
+
+    class Meta(ItemResource.Meta):
+        instance_loader_class = CachedInstanceLoader
+
+    def before_import(self, dataset, using_transactions, dry_run, **kwargs):
+        super().before_import(dataset, using_transactions, dry_run, **kwargs)
+        serial_numbers = set(filter(None, (self.get_field_value('serial_number', row) for row in dataset.dict)))
+        self.serial_numbers = set(Item.objects.filter(serial_number__in=serial_numbers)
+                                  .values_list('serial_number', flat=True))
+        self.pending_items = {}
+        self.pending_bulk_discounts = {}
+        self.pending_rows = {}
+        self.failed_row_results = []
+        self.client_ids = set()
+
+    def _build_bulk_discount(self, item):
+        if item.id in self.pending_items:
+            return self.pending_bulk_discounts.get(item.id) or Discount()
+        return super()._build_bulk_discount(item)
+
+    def save_instance(self, instance, using_transactions=True, dry_run=False):
+        """
+        Queue new items for bulk creation, with the serial number uniqueness checked against the database
+        and the rows imported before.
+        """
+        if instance.pk or (dry_run and not using_transactions):
+            return super().save_instance(instance, using_transactions, dry_run)
+
+        instance.update_identifier()
+        if instance.serial_number in self.serial_numbers:
+            raise instance.unique_error_message(Item, ('serial_number',))
+        if instance.serial_number:
+            self.serial_numbers.add(instance.serial_number)
+
+        self.before_save_instance(instance, using_transactions, dry_run)
+        instance.id = Item.id_allocator.allocate()[0]
+        self.pending_items[instance.id] = instance
+        bulk_discount = instance.pop_bulk_discount()
+        if bulk_discount:
+            self.pending_bulk_discounts[instance.id] = bulk_discount
+
+    def after_import_row(self, row, row_result, **kwargs):
+        if row_result.object_id in self.pending_items:
+            self.pending_rows[row_result.object_id] = (row, row_result)
+        if len(self.pending_items) >= self.chunk_size:
+            self.create_pending_items(row_result)
+
+    def after_import(self, dataset, result, using_transactions, dry_run, **kwargs):
+        """
+        Insert the last queued items and count rows of failed chunks as errors. Item ids are reserved from
+        the item id sequence, which is not reset after the import since blocks of it may be reserved elsewhere.
+        """
+        self.create_pending_items()
+        for row_result in self.failed_row_results:
+            result.totals[RowResult.IMPORT_TYPE_NEW] -= 1
+            result.totals[RowResult.IMPORT_TYPE_ERROR] += 1
+        for client_id in self.client_ids:
+            invalidate_catalog(client_id)
+
+    def create_pending_items(self, current_row_result=None):
+        """
+        Insert queued items along with their bulk discounts, in a savepoint reporting a failure on every row
+        of the chunk, rows imported before the current one being counted again as errors.
+        New items have no rep case yet, so they add nothing to purchase prices or item rollups.
+        """
+        items, self.pending_items = self.pending_items, {}
+        bulk_discounts, self.pending_bulk_discounts = self.pending_bulk_discounts, {}
+        rows, self.pending_rows = self.pending_rows, {}
+        if not items:
+            return
+
+        try:
+            with transaction.atomic():
+                Item.objects.bulk_create(items.values())
+                Item.discounts.through.objects.bulk_create(
+                    Item.discounts.through(item_id=item_id, discount_id=bulk_discount.id)
+                    for item_id, bulk_discount in bulk_discounts.items()
+                )
+        except DatabaseError as e:
+            tb_info = traceback.format_exc()
+            for row, row_result in rows.values():
+                row_result.import_type = RowResult.IMPORT_TYPE_ERROR
+                row_result.errors.append(self.get_error_result_class()(e, tb_info, row))
+                if row_result is not current_row_result:
+                    self.failed_row_results.append(row_result)
+            return
+        self.client_ids.update(item.device.client_id for item in items.values())
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from hospital.models import Account, Role
+from hospital.permissions import AuthorizationContext
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def invalidate_account_authorization_context(sender, instance, **kwargs):
+    AuthorizationContext.invalidate(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Account.specialties.through)
+def invalidate_account_specialties_authorization_context(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        AuthorizationContext.invalidate(instance.user_id if isinstance(instance, Account) else None)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_authorization_contexts(sender, **kwargs):
+    AuthorizationContext.invalidate()
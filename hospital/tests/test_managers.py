@@ -13,6 +13,7 @@ from hospital.models import Item
 from price.constants import PRE_DOCTOR_ORDER, VALUE_DISCOUNT, ON_DOCTOR_ORDER, UNIT_COST
 from price.factories import DiscountFactory, ClientPriceFactory
 from tracker.factories import RepCaseFactory
+from tracker.models import PurchasePrice
 
 
 @override_settings(DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage')
@@ -50,6 +51,18 @@ class ItemQuerySetTestCase(TestCase):
         self.assertCountEqual(self.client_1.items.used_by_client(self.client_1), [self.item_1, self.item_2])
         self.assertCountEqual(self.client_2.items.used_by_client(self.client_2), [self.item_3])
 
+    def test_used_by_client_tree_queryset(self):
+        affiliate = ClientFactory()
+        self.client_1.set_children([affiliate.id])
+        affiliate.set_children([self.client_2.id])
+        RepCaseFactory(client=self.client_1, items=[self.item_1])
+        RepCaseFactory(client=affiliate, items=[self.item_2])
+        RepCaseFactory(client=self.client_2, items=[self.item_3])
+
+        self.assertCountEqual(Item.objects.used_by_client_tree(self.client_1), [self.item_1, self.item_2, self.item_3])
+        self.assertCountEqual(Item.objects.used_by_client_tree(affiliate), [self.item_2, self.item_3])
+        self.assertCountEqual(Item.objects.used_by_client_tree(self.client_2), [self.item_3])
+
     def test_used_by_physician_queryset(self):
         physician_3 = AccountFactory(client=self.client_2, role=self.physician_2.role)
         self.assertEqual(Item.objects.used_by_physician(self.physician_1).count(), 0)
@@ -107,6 +120,27 @@ class ItemQuerySetTestCase(TestCase):
             'app': float(self.item_3.cost),
         }])
 
+    def test_expiry_buckets(self):
+        today = date(2018, 10, 1)
+        Item.objects.filter(id=self.item_1.id).update(expired_date=date(2018, 9, 30))
+        Item.objects.filter(id=self.item_2.id).update(expired_date=date(2018, 10, 5))
+        Item.objects.filter(id=self.item_4.id).update(expired_date=date(2018, 10, 20), is_used=True)
+        items = Item.objects.filter(device__client=self.client_1)
+
+        self.assertDictEqual(items.expiry_buckets([30, 7], today), {
+            'available': 3, 'expired': 1, 'expiring7': 1, 'expiring30': 1,
+        })
+        self.assertDictEqual(items.unused_bulk().expiry_buckets([30, 7], today), {
+            'available': 2, 'expired': 1, 'expiring7': 1, 'expiring30': 0,
+        })
+        category = self.item_1.device.product.category
+        self.assertEqual(list(items.expiry_buckets([7], today, group_by=['device__product__category_id'])), [{
+            'device__product__category_id': category.id, 'available': 2, 'expired': 1, 'expiring7': 0,
+        }, {
+            'device__product__category_id': self.item_2.device.product.category_id,
+            'available': 1, 'expired': 0, 'expiring7': 1,
+        }])
+
     def test_physician_app(self):
         item_3 = ItemFactory(device=DeviceFactory(client=self.client_1), cost=randint(350, 370))
         item_5 = ItemFactory(device=DeviceFactory(client=self.client_1), cost=randint(100, 200))
@@ -170,3 +204,51 @@ class ItemQuerySetTestCase(TestCase):
             'saving': repless_discount.value,
             'spend': self.item_2.cost,
         }])
+
+    def test_redeem(self):
+        self.assertEqual(Item.objects.none().redeem(), [])
+
+        cco_discount = DiscountFactory(apply_type=ON_DOCTOR_ORDER, discount_type=VALUE_DISCOUNT, value=15,
+                                       cost_type=UNIT_COST)
+        bulk_discount = DiscountFactory(apply_type=PRE_DOCTOR_ORDER, discount_type=VALUE_DISCOUNT, value=10,
+                                        cost_type=UNIT_COST)
+        ClientPriceFactory(client=self.client_1, product=self.item_1.device.product, unit_cost=200)
+        ClientPriceFactory(client=self.client_1, product=self.item_4.device.product, unit_cost=300)
+        RepCaseFactory(client=self.client_1, procedure_date=date.today(), items=[self.item_1, self.item_4])
+        self.item_1.discounts.set([cco_discount, bulk_discount])
+        self.item_4.discounts.set([cco_discount])
+
+        with self.assertNumQueries(3):
+            redemptions = dict((item.id, redemption) for item, redemption in self.client_1.items.redeem())
+
+        self.assertCountEqual(redemptions.keys(), [self.item_1.id, self.item_2.id, self.item_4.id])
+        self.assertIsNone(redemptions[self.item_2.id])
+        self.assertEqual(redemptions[self.item_1.id]['total_cost'], 175)
+        self.assertEqual(redemptions[self.item_1.id]['point_of_sales_saving'], 15)
+        self.assertEqual(redemptions[self.item_4.id]['total_cost'], 285)
+        self.assertEqual(redemptions[self.item_4.id]['point_of_sales_saving'], 15)
+
+    def test_update_costs(self):
+        self.item_1.cost, self.item_1.saving = 100, 10
+        self.item_2.cost, self.item_2.saving = 200, 20
+        with self.assertNumQueries(2):
+            Item.objects.update_costs([self.item_1, self.item_2], batch_size=1)
+
+        self.item_1.refresh_from_db()
+        self.item_2.refresh_from_db()
+        self.item_4.refresh_from_db()
+        self.assertEqual((self.item_1.cost, self.item_1.saving), (100, 10))
+        self.assertEqual((self.item_2.cost, self.item_2.saving), (200, 20))
+        self.assertEqual(self.item_4.cost, 1000)
+
+    def test_update_app(self):
+        RepCaseFactory(client=self.client_1, procedure_date=date(2018, 9, 10), items=[self.item_1, self.item_4])
+        Item.objects.filter(id__in=[self.item_1.id, self.item_4.id]).update(is_used=True)
+        Item.objects.filter(device__client=self.client_1).update_app()
+
+        purchase_price = PurchasePrice.objects.get(client=self.client_1, year=2018)
+        self.assertEqual(purchase_price.category, self.item_1.device.product.category)
+        self.assertEqual(purchase_price.cost_type, UNIT_COST)
+        self.assertEqual(purchase_price.min, self.item_1.cost)
+        self.assertEqual(purchase_price.max, 1000)
+        self.assertEqual(purchase_price.avg, (self.item_1.cost + 1000) / 2)
@@ -7,11 +7,13 @@ from django.utils import timezone
 
 from account.factories import UserFactory
 from device.factories import SpecialtyFactory, CategoryFactory, ProductFactory
+from hospital.constants import ITEM_IDENTIFIER_SEQUENCE
 from hospital.factories import ClientFactory, RoleFactory, AccountFactory, DeviceFactory, ItemFactory
-from hospital.models import Client, Item
+from hospital.models import Client, ClientAncestor, Item, SequenceAllocator
 from price.factories import ClientPriceFactory, DiscountFactory
 from price.constants import UNIT_COST, SYSTEM_COST, VALUE_DISCOUNT, PERCENT_DISCOUNT, PRE_DOCTOR_ORDER, ON_DOCTOR_ORDER
 from tracker.factories import RepCaseFactory
+from tracker.models import PurchasePrice, RepCase
 
 
 class ClientTestCase(TestCase):
@@ -85,6 +87,38 @@ class ClientTestCase(TestCase):
         self.assertEqual(hospital3.root_parent_id, self.client.id)
         self.assertEqual(hospital33.root_parent_id, self.client.id)
 
+    def test_client_ancestors(self):
+        hospital1, hospital2, hospital3 = ClientFactory.create_batch(3)
+        self.client.set_children(children_ids=[hospital1.id])
+        hospital1.set_children(children_ids=[hospital2.id])
+        ClientFactory(parent=hospital2)
+
+        def ancestors():
+            return set(ClientAncestor.objects.values_list('client__name', 'ancestor__name', 'depth'))
+
+        hospital4 = Client.objects.get(parent=hospital2)
+        self.assertSetEqual(ancestors(), {
+            (hospital1.name, self.client.name, 1),
+            (hospital2.name, hospital1.name, 1),
+            (hospital2.name, self.client.name, 2),
+            (hospital4.name, hospital2.name, 1),
+            (hospital4.name, hospital1.name, 2),
+            (hospital4.name, self.client.name, 3),
+        })
+        with self.assertNumQueries(1):
+            self.assertEqual(hospital4.root_parent_id, self.client.id)
+
+        hospital3.set_children(children_ids=[hospital2.id])
+        self.assertSetEqual(ancestors(), {
+            (hospital1.name, self.client.name, 1),
+            (hospital2.name, hospital3.name, 1),
+            (hospital4.name, hospital2.name, 1),
+            (hospital4.name, hospital3.name, 2),
+        })
+
+        hospital3.delete()
+        self.assertSetEqual(ancestors(), {(hospital1.name, self.client.name, 1)})
+
 
 class DeviceTestCase(TestCase):
     def test_to_string_returns_device_name(self):
@@ -123,12 +157,68 @@ class ItemTestCase(TestCase):
         next_item.save()
         self.assertEqual(next_item.identifier, 'SERIAL-NUMBER-2')
 
+    def test_save_method_keeps_identifier_of_unchanged_lot(self):
+        item = ItemFactory(serial_number=None, lot_number='LOT')
+        identifier = item.identifier
+
+        item.expired_date = date(2020, 1, 1)
+        item.save()
+        self.assertEqual(item.identifier, identifier)
+
+        item.lot_number = 'LOT-2'
+        item.save()
+        self.assertTrue(item.identifier.startswith('LOT-2-'))
+        self.assertNotEqual(item.identifier[-6:], identifier[-6:])
+
+    def test_bulk_create_allocates_identifiers(self):
+        device = DeviceFactory()
+        Item.identifier_allocator.reset()
+        items = [Item(device=device, lot_number='LOT') for _ in range(150)] + [Item(device=device, serial_number='SN')]
+
+        with self.assertNumQueries(2):
+            Item.objects.bulk_create(items)
+        identifiers = set(Item.objects.values_list('identifier', flat=True))
+        self.assertEqual(len(identifiers), 151)
+        self.assertIn('SN', identifiers)
+
+    def test_sequence_allocator_reserves_blocks(self):
+        allocator = SequenceAllocator(ITEM_IDENTIFIER_SEQUENCE, block_size=3)
+        with self.assertNumQueries(1):
+            values = allocator.allocate() + allocator.allocate(2)
+        with self.assertNumQueries(1):
+            values += allocator.allocate(4)
+        self.assertEqual(len(set(values)), 7)
+        self.assertEqual(values, sorted(values))
+        self.assertNotIn(allocator.allocate()[0], SequenceAllocator(ITEM_IDENTIFIER_SEQUENCE).allocate(10))
+
+        allocator.reset()
+        with self.assertNumQueries(1):
+            self.assertGreater(allocator.allocate()[0], max(values))
+
     def test_save_method_errors(self):
         self.assertRaises(AttributeError, ItemFactory, serial_number=None, lot_number=None)
 
         item = ItemFactory()
         self.assertRaises(IntegrityError, Item.objects.create, serial_number=item.serial_number)
 
+    def test_save_and_delete_after_rep_case_deleted(self):
+        item_1, item_2 = ItemFactory.create_batch(2, cost=100, is_used=True,
+                                                  rep_case=RepCaseFactory(procedure_date=date(2018, 7, 9)))
+        item_1, item_2 = Item.objects.get(pk=item_1.pk), Item.objects.get(pk=item_2.pk)
+        counted_2018 = PurchasePrice.objects.filter(year=2018, count__gt=0)
+        self.assertEqual(counted_2018.count(), 2)
+        RepCase.objects.get(pk=item_1.rep_case_id).delete()
+        self.assertFalse(counted_2018.exists())
+
+        item_1.rep_case = RepCaseFactory(procedure_date=date(2019, 7, 9))
+        item_1.save()
+        self.assertEqual(PurchasePrice.objects.get(year=2019).avg, 100)
+        self.assertFalse(counted_2018.exists())
+
+        item_2.delete()
+        self.assertCountEqual(Item.objects.all(), [item_1])
+        self.assertFalse(counted_2018.exists())
+
     def test_update_cost(self):
         client = ClientFactory()
         product = ProductFactory()
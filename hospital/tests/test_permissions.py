@@ -0,0 +1,60 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from account.factories import UserFactory
+from api.cache import get_auth_token_cache
+from api.constants import AUTH_TOKEN_LOCAL_CACHE_TIMEOUT
+from device.factories import SpecialtyFactory
+from hospital.constants import RolePriority
+from hospital.factories import AccountFactory, ClientFactory, RoleFactory
+from hospital.permissions import AuthorizationContext
+
+
+class AuthorizationContextTestCase(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.client_1, self.client_2 = ClientFactory.create_batch(2)
+        self.specialty = SpecialtyFactory()
+        self.physician = AccountFactory(user=self.user, client=self.client_1,
+                                        role=RoleFactory(priority=RolePriority.PHYSICIAN.value),
+                                        specialties=[self.specialty])
+        self.admin = AccountFactory(user=self.user, client=self.client_2,
+                                    role=RoleFactory(priority=RolePriority.ADMIN.value))
+
+    def get_context(self):
+        return AuthorizationContext.for_user(UserFactory.build(id=self.user.id))
+
+    def test_for_user_loads_accounts_once(self):
+        with self.assertNumQueries(1):
+            context = self.get_context()
+        with self.assertNumQueries(0):
+            self.assertCountEqual(context.client_ids, [self.client_1.id, self.client_2.id])
+            self.assertTrue(context.has_access(RolePriority.PHYSICIAN.value, self.client_1.id))
+            self.assertFalse(context.has_access(RolePriority.ADMIN.value, self.client_1.id))
+            self.assertTrue(context.has_access(RolePriority.ADMIN.value))
+            self.assertEqual(context.get_specialty_ids(self.client_1.id), [self.specialty.id])
+            self.assertEqual(context.get_specialty_ids(self.client_2.id), [])
+            account = context.get_account(self.client_1.id, RolePriority.PHYSICIAN.value)
+            self.assertEqual((account.id, account.client_id, account.role_id),
+                             (self.physician.id, self.client_1.id, self.physician.role_id))
+            self.assertIsNone(context.get_account(self.client_2.id, RolePriority.PHYSICIAN.value))
+            self.get_context()
+
+    def test_context_invalidated_on_account_changes(self):
+        self.get_context()
+        self.admin.role = self.physician.role
+        self.admin.save()
+        self.assertTrue(self.get_context().has_access(RolePriority.PHYSICIAN.value, self.client_2.id))
+
+        self.physician.specialties.clear()
+        self.assertEqual(self.get_context().get_specialty_ids(self.client_1.id), [])
+
+        self.physician.delete()
+        self.assertEqual(self.get_context().client_ids, [self.client_2.id])
+
+    def test_context_cached_briefly_in_process_local_cache(self):
+        cache = get_auth_token_cache()
+        with patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.get_context()
+        self.assertEqual(cache_set.call_args[0][2], AUTH_TOKEN_LOCAL_CACHE_TIMEOUT)
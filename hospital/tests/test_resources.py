@@ -1,19 +1,31 @@
 import os
+from datetime import date
+from decimal import Decimal
+from io import BytesIO
+from unittest.mock import patch
 
+from django.contrib import admin
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from openpyxl import load_workbook
 from tablib import Dataset
 
 from account.factories import UserFactory
 from account.models import User
 from device.factories import ManufacturerFactory, ProductFactory
 from hospital.constants import RolePriority
-from hospital.factories import ClientFactory, RoleFactory, ItemFactory
+from hospital.managers import ItemQuerySet
+from hospital.factories import ClientFactory, RoleFactory, ItemFactory, AccountFactory
 from hospital.models import Account, Item
-from hospital.resources import AccountResource, ItemResource
+from hospital.resources import AccountResource, BulkItemResource, ItemResource
 from neptune.settings.base import FIXTURE_DIR
 from price.constants import SYSTEM_COST, UNIT_COST, PRE_DOCTOR_ORDER, ON_DOCTOR_ORDER, PERCENT_DISCOUNT
 from price.factories import ClientPriceFactory, DiscountFactory
 from price.models import Discount
+from tracker.factories import RepCaseFactory
+from tracker.models import ItemRollup, PurchasePrice
 
 
 class AccountResourceTestCase(TestCase):
@@ -45,6 +57,8 @@ class AccountResourceTestCase(TestCase):
 
 
 class ItemResourceTestCase(TestCase):
+    resource_class = ItemResource
+
     def setUp(self):
         self.client = ClientFactory(name='UVMC')
         manufacturer = ManufacturerFactory(name='Medtronic')
@@ -79,7 +93,7 @@ class ItemResourceTestCase(TestCase):
             f.write(dataset.export('xls'))
 
     def test_import_from_xls_file(self):
-        item_resource = ItemResource()
+        item_resource = self.resource_class()
         dataset = Dataset().load(open(self.xls_file_path, 'rb').read())
 
         self.assertEqual(Item.objects.count(), 1)
@@ -91,7 +105,9 @@ class ItemResourceTestCase(TestCase):
         self.assertCountEqual(Discount.objects.all(), [self.bulk_discount, self.discount_2,
                                                        bulk_discount_2, bulk_discount_3])
 
-        item_1, item_2, item_3 = Item.objects.all().order_by('id')
+        item_1 = Item.objects.get(pk=self.item.id)
+        item_2 = Item.objects.get(serial_number='PJN7204200')
+        item_3 = Item.objects.get(lot_number='31232123')
         self.assertEqual(str(item_1.purchased_date), '2019-03-28')
         self.assertEqual(item_1.cost_type, UNIT_COST)
         self.assertEqual(item_1.device, self.device)
@@ -110,3 +126,157 @@ class ItemResourceTestCase(TestCase):
         self.assertEqual(str(item_3.purchased_date), '2019-03-22')
         self.assertEqual(item_3.cost_type, SYSTEM_COST)
         self.assertCountEqual(item_3.discounts.all(), [bulk_discount_3])
+
+    def test_dry_run_leaves_purchase_prices_and_rollups_unchanged(self):
+        self.item.rep_case = RepCaseFactory(client=self.client, procedure_date=date(2019, 3, 28))
+        self.item.is_used = True
+        self.item.cost = 500
+        self.item.save()
+        purchase_prices = list(PurchasePrice.objects.order_by('id').values_list('cost_type', 'count', 'total'))
+        self.assertEqual(purchase_prices, [(SYSTEM_COST, 1, 500)])
+        rollups = list(ItemRollup.objects.order_by('id').values_list('month', 'units', 'spend'))
+        self.assertEqual(rollups, [(date(2019, 3, 1), 1, 500)])
+
+        dataset = Dataset().load(open(self.xls_file_path, 'rb').read())
+        result = self.resource_class().import_data(dataset, dry_run=True)
+
+        self.assertFalse(result.has_errors())
+        self.assertEqual(PurchasePrice.flush(), 0)
+        self.assertEqual(list(PurchasePrice.objects.order_by('id').values_list('cost_type', 'count', 'total')),
+                         purchase_prices)
+        self.assertEqual(ItemRollup.flush(), 0)
+        self.assertEqual(list(ItemRollup.objects.order_by('id').values_list('month', 'units', 'spend')), rollups)
+
+
+class BulkItemResourceTestCase(ItemResourceTestCase):
+    resource_class = BulkItemResource
+
+    def test_import_new_items_in_batches(self):
+        item_resource = BulkItemResource()
+        item_resource.chunk_size = 2
+        headers = ('id', 'Hospital name', 'Manufacturer name', 'Hospital part #', 'Manufacturer part #',
+                   'Serial number', 'Lot number', 'Purchased date', 'Cost type', 'Bulk discount percent',
+                   'Discount order')
+        dataset = Dataset(*[('', 'UVMC', 'Medtronic', '', 'SESR01', f'SN{index}', '', '2019-03-22', 'Unit cost',
+                             15 if index % 2 else 10, 1) for index in range(20)], headers=headers)
+
+        Item.id_allocator.reset()
+        with CaptureQueriesContext(connection) as context:
+            result = item_resource.import_data(dataset)
+        queries = [query['sql'] for query in context.captured_queries
+                   if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+        self.assertEqual(len([query for query in queries if query.startswith('INSERT INTO "hospital_item')]), 20)
+        self.assertEqual(len(queries), 33)
+        self.assertFalse(result.has_errors())
+        self.assertEqual(Item.objects.count(), 21)
+        self.assertEqual(Discount.objects.filter(name='Bulk').count(), 2)
+        self.assertEqual(Item.objects.filter(discounts=self.bulk_discount).count(), 10)
+        self.assertEqual(Item.objects.filter(discounts__percent=15).count(), 10)
+        self.assertEqual(Item.objects.get(serial_number='SN3').identifier, 'SN3')
+
+    def test_import_reports_failed_chunks_on_their_rows(self):
+        item_resource = BulkItemResource()
+        item_resource.chunk_size = 2
+        headers = ('id', 'Hospital name', 'Manufacturer name', 'Hospital part #', 'Manufacturer part #',
+                   'Serial number', 'Lot number', 'Purchased date', 'Cost type')
+        dataset = Dataset(*[('', 'UVMC', 'Medtronic', '', 'SESR01', f'SN{index}', '', '2019-03-22', 'Unit cost')
+                            for index in range(5)], headers=headers)
+        bulk_create = ItemQuerySet.bulk_create
+
+        def failing_bulk_create(queryset, items, *args, **kwargs):
+            items = list(items)
+            if any(item.serial_number in ('SN3', 'SN4') for item in items):
+                raise IntegrityError('duplicate key value violates unique constraint')
+            return bulk_create(queryset, items, *args, **kwargs)
+
+        with patch.object(ItemQuerySet, 'bulk_create', failing_bulk_create):
+            result = item_resource.import_data(dataset)
+
+        self.assertTrue(result.has_errors())
+        self.assertEqual([bool(row.errors) for row in result.rows], [False, False, True, True, True])
+        self.assertEqual((result.totals['new'], result.totals['error']), (2, 3))
+        self.assertEqual(result.rows[2].errors[0].row['Serial number'], 'SN2')
+        self.assertEqual(Item.objects.count(), 1)
+
+    def test_dry_run_reports_without_saving(self):
+        dataset = Dataset().load(open(self.xls_file_path, 'rb').read())
+        result = BulkItemResource().import_data(dataset, dry_run=True)
+
+        self.assertFalse(result.has_errors())
+        self.assertEqual([row.import_type for row in result.rows], ['new', 'update', 'new'])
+        self.assertIn('15', result.rows[0].diff[-5])
+        self.assertEqual(Item.objects.count(), 1)
+        self.assertEqual(Discount.objects.count(), 2)
+
+    def test_import_reports_row_errors(self):
+        headers = ('id', 'Hospital name', 'Manufacturer name', 'Hospital part #', 'Manufacturer part #',
+                   'Serial number', 'Lot number', 'Purchased date', 'Cost type')
+        dataset = Dataset(
+            ('', 'UVMC', 'Medtronic', '', 'SESR01', 'PJN7204267', '', '2019-03-22', 'Unit cost'),
+            ('', 'UVMC', 'Medtronic', '', 'SESR01', 'SN1', '', '2019-03-22', 'Unit cost'),
+            ('', 'UVMC', 'Medtronic', '', 'SESR01', 'SN1', '', '2019-03-22', 'Unit cost'),
+            ('', 'UVMC', 'Medtronic', '', 'SESR01', '', '', '2019-03-22', 'Unit cost'),
+            ('', 'UVMC', 'Medtronic', '', 'UNKNOWN', 'SN2', '', '2019-03-22', 'Unit cost'),
+            headers=headers
+        )
+        result = BulkItemResource().import_data(dataset)
+
+        self.assertTrue(result.has_errors())
+        self.assertEqual([bool(row.errors) for row in result.rows], [True, False, True, True, True])
+        self.assertEqual(Item.objects.count(), 1)
+
+
+class ItemExportTestCase(TestCase):
+    def setUp(self):
+        client_price = ClientPriceFactory()
+        device = client_price.product.device_set.get(client=client_price.client)
+        bulk_discount = DiscountFactory(name='Bulk', client_price=client_price, apply_type=PRE_DOCTOR_ORDER,
+                                        cost_type=UNIT_COST, percent=10, order=1)
+        discount = DiscountFactory(client_price=client_price, apply_type=ON_DOCTOR_ORDER, cost_type=UNIT_COST)
+        ItemFactory.create_batch(3, device=device, cost_type=UNIT_COST, discounts=[discount, bulk_discount])
+        ItemFactory.create_batch(2, device=device, cost_type=SYSTEM_COST, discounts=[bulk_discount])
+        ItemFactory(device=device, cost_type=UNIT_COST)
+
+    def test_iter_export(self):
+        item_resource = ItemResource()
+        dataset = item_resource.export(Item.objects.order_by('id'))
+        item_resource.export_chunk_size = 4
+
+        with self.assertNumQueries(3):
+            rows = list(item_resource.iter_export(Item.objects.order_by('id')))
+        self.assertEqual(rows[0], dataset.headers)
+        self.assertEqual(rows[1:], [list(row) for row in dataset])
+        self.assertEqual([row[10] for row in rows[1:]], [Decimal(10)] * 3 + [0] * 3)
+
+    def test_export_admin_action_streams_csv(self):
+        user = UserFactory(is_staff=True, is_superuser=True)
+        self.client.force_login(user)
+        file_formats = [file_format().get_extension() for file_format in
+                        admin.site._registry[Item].get_export_formats()]
+
+        response = self.client.post(reverse('admin:hospital_item_changelist'), {
+            'action': 'export_admin_action',
+            'file_format': file_formats.index('csv'),
+            '_selected_action': list(Item.objects.values_list('id', flat=True)),
+        })
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertTrue(lines[0].startswith('id,Hospital name,Manufacturer name'))
+
+    def test_export_admin_action_streams_accounts_xlsx(self):
+        AccountFactory.create_batch(3)
+        self.client.force_login(UserFactory(is_staff=True, is_superuser=True))
+        file_formats = [file_format().get_extension() for file_format in
+                        admin.site._registry[Account].get_export_formats()]
+
+        response = self.client.post(reverse('admin:hospital_account_changelist'), {
+            'action': 'export_admin_action',
+            'file_format': file_formats.index('xlsx'),
+            '_selected_action': list(Account.objects.values_list('id', flat=True)),
+        })
+        self.assertTrue(response.streaming)
+        rows = list(load_workbook(BytesIO(b''.join(response.streaming_content))).active.iter_rows(values_only=True))
+        self.assertEqual(rows[0], ('id', 'name', 'email', 'role', 'client'))
+        self.assertEqual(len(rows), 4)
@@ -1,11 +1,14 @@
 from django.urls import path
 
-from device.views import CategoryListView, ProductListView, ItemListView, PhysicianMarketshareView
+from device.views import CategoryListView, ProductListView, ItemListView, PhysicianMarketshareView, \
+    CatalogBootstrapView, CatalogChangeListView
 
 app_name = 'device'
 
 
 urlpatterns = [
+    path('bootstrap', CatalogBootstrapView.as_view(), name='bootstrap'),
+    path('changes', CatalogChangeListView.as_view(), name='changes'),
     path('categories', CategoryListView.as_view(), name='categories'),
     path('categories/<int:category_id>/products', ProductListView.as_view(), name='products'),
     path('products/<int:product_id>/items', ItemListView.as_view(), name='items'),
@@ -1,6 +1,9 @@
 from django.contrib import admin
+from django.http import StreamingHttpResponse
+from import_export.admin import ExportActionModelAdmin
 
 from neptune.models import SharedImage
+from neptune.resources import STREAM_WRITERS
 
 
 class AutoCompleteSearchAdminMixin(object):
@@ -13,6 +16,28 @@ class AutoCompleteSearchAdminMixin(object):
               'js/admin/autocomplete-search.js',)
 
 
+class StreamingExportAdminMixin(object):
+    """
+    Export action streaming CSV and XLSX files from resources able to export row by row.
+    Other formats are exported as a whole dataset.
+    """
+    def export_admin_action(self, request, queryset):
+        export_format = request.POST.get('file_format')
+        resource = self.get_export_resource_class()(**self.get_export_resource_kwargs(request))
+        if export_format and hasattr(resource, 'iter_export'):
+            file_format = self.get_export_formats()[int(export_format)]()
+            stream_writer = STREAM_WRITERS.get(file_format.get_extension())
+            if stream_writer:
+                response = StreamingHttpResponse(stream_writer(resource.iter_export(queryset)),
+                                                 content_type=file_format.get_content_type())
+                response['Content-Disposition'] = f'attachment; filename={self.get_export_filename(file_format)}'
+                return response
+        return super().export_admin_action(request, queryset)
+    export_admin_action.short_description = ExportActionModelAdmin.export_admin_action.short_description
+
+    actions = [export_admin_action]
+
+
 class SharedImageAdmin(admin.ModelAdmin):
     list_display = ('name', 'image')
 
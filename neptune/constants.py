@@ -0,0 +1,2 @@
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FILE_BLOCK_SIZE = 64 * 1024
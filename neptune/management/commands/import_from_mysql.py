@@ -17,6 +17,7 @@ from hospital.models import Client, Role, Account, Device, Item
 from hospital.constants import CONSIGNMENT_PURCHASE, BULK_PURCHASE
 from price.models import ClientPrice, Discount
 from price.constants import VALUE_DISCOUNT, UNIT_COST, PERCENT_DISCOUNT, SYSTEM_COST, DISCOUNTS, ON_DOCTOR_ORDER
+from tracker.models import ItemRollup, PurchasePrice
 
 User = get_user_model()
 
@@ -500,7 +501,8 @@ class Command(BaseCommand):
         prices = self.import_client_prices(products, clients)
         self.import_costs(prices)
 
-        self.import_client_devices(clients, products, prices)
+        with PurchasePrice.deferred(), ItemRollup.deferred():
+            self.import_client_devices(clients, products, prices)
 
         self.import_physician_specialties()
 
@@ -0,0 +1,82 @@
+import csv
+from datetime import date, datetime
+from decimal import Decimal
+from tempfile import TemporaryFile
+
+from django.db.models import prefetch_related_objects
+from django.utils.encoding import force_text
+from openpyxl import Workbook
+
+from neptune.constants import EXPORT_CHUNK_SIZE, EXPORT_FILE_BLOCK_SIZE
+
+
+class StreamingExportResourceMixin(object):
+    """
+    Export rows one chunk of objects at a time, instead of building the whole dataset in memory.
+    Related objects are selected along with the rows, or prefetched for every chunk.
+    """
+    export_chunk_size = EXPORT_CHUNK_SIZE
+    export_select_related = ()
+
+    def get_export_prefetch_related(self):
+        return ()
+
+    def iter_export(self, queryset=None):
+        """
+        Export headers, then the exported row of every object.
+        """
+        if queryset is None:
+            queryset = self.get_queryset()
+        queryset = queryset.select_related(*self.export_select_related).prefetch_related(None)
+
+        yield self.get_export_headers()
+        chunk = []
+        for obj in queryset.iterator(chunk_size=self.export_chunk_size):
+            chunk.append(obj)
+            if len(chunk) == self.export_chunk_size:
+                yield from self.export_chunk(chunk)
+                chunk = []
+        yield from self.export_chunk(chunk)
+
+    def export_chunk(self, objs):
+        prefetch_related_objects(objs, *self.get_export_prefetch_related())
+        for obj in objs:
+            yield self.export_resource(obj)
+
+
+class Echo(object):
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def xlsx_value(value):
+    if value is None or isinstance(value, (bool, int, float, Decimal, date, datetime)):
+        return value
+    return force_text(value)
+
+
+def stream_xlsx(rows):
+    """
+    Rows written to a write-only workbook, which keeps them in a temporary file until the workbook is saved.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in rows:
+        sheet.append([xlsx_value(value) for value in row])
+
+    with TemporaryFile() as xlsx_file:
+        workbook.save(xlsx_file)
+        xlsx_file.seek(0)
+        yield from iter(lambda: xlsx_file.read(EXPORT_FILE_BLOCK_SIZE), b'')
+
+
+STREAM_WRITERS = {
+    'csv': stream_csv,
+    'xlsx': stream_xlsx,
+}
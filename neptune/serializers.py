@@ -0,0 +1,68 @@
+import decimal
+from operator import attrgetter, itemgetter
+
+
+def attribute(source):
+    return attrgetter(source)
+
+
+def key(source):
+    return itemgetter(source)
+
+
+def decimal_string(max_digits, decimal_places):
+    """
+    Format numbers the way rest_framework DecimalField does.
+    """
+    context = decimal.getcontext().copy()
+    context.prec = max_digits
+    exponent = decimal.Decimal('.1') ** decimal_places
+
+    def to_representation(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return '{0:f}'.format(value.quantize(exponent, context=context))
+    return to_representation
+
+
+class FastSerializer(object):
+    """
+    Read-only serializer producing the same data as a rest_framework serializer, without its field machinery.
+    The plan of (name, getter, to_representation) fields is built once and applied as is to every instance,
+    to_representation being skipped for None values.
+    """
+    fields = ()
+
+    def __init__(self, instance=None, many=False, context=None):
+        self.instance = instance
+        self.many = many
+        self.context = context if context is not None else {}
+        self.image_urls = self.context.setdefault('image_urls', {})
+        self.plan = self.get_fields()
+
+    def get_fields(self):
+        return self.fields
+
+    def image_url(self, image):
+        """
+        Url of an image file, computed once per file name.
+        """
+        if not image:
+            return None
+        url = self.image_urls.get(image.name)
+        if url is None:
+            url = self.image_urls[image.name] = image.url
+        return url
+
+    def to_representation(self, instance):
+        representation = {}
+        for name, getter, to_representation in self.plan:
+            value = getter(instance)
+            representation[name] = value if value is None or to_representation is None else to_representation(value)
+        return representation
+
+    @property
+    def data(self):
+        if self.many:
+            return [self.to_representation(instance) for instance in self.instance]
+        return self.to_representation(self.instance)
@@ -53,6 +53,7 @@ INSTALLED_APPS = [
     'neptune',
     'order',
     'tracker',
+    'api',
 ]
 
 MIDDLEWARE = [
@@ -63,6 +64,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'tracker.middleware.PurchasePriceQueueMiddleware',
 ]
 
 ROOT_URLCONF = 'neptune.urls'
@@ -103,6 +105,31 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': config('NEPTUNE_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('NEPTUNE_CACHE_LOCATION', default=''),
+    },
+    'catalog': {
+        'BACKEND': config('NEPTUNE_CATALOG_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('NEPTUNE_CATALOG_CACHE_LOCATION', default='catalog'),
+    },
+    # Verified auth tokens and authorization contexts. Revocations only reach other processes through a shared
+    # backend, a process-local one keeps its entries for a few seconds at most.
+    'auth-tokens': {
+        'BACKEND': config('NEPTUNE_AUTH_TOKEN_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('NEPTUNE_AUTH_TOKEN_CACHE_LOCATION', default='auth-tokens'),
+        'TIMEOUT': config('NEPTUNE_AUTH_TOKEN_CACHE_TIMEOUT', default=300, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('NEPTUNE_AUTH_TOKEN_CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
@@ -175,7 +202,7 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_FILE_STORAGE = 'neptune.storages.MediaStorage'
 
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ('knox.auth.TokenAuthentication',),
+    'DEFAULT_AUTHENTICATION_CLASSES': ('api.authentication.CachedTokenAuthentication',),
     'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.AllowAny',),
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
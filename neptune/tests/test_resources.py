@@ -0,0 +1,35 @@
+from datetime import date
+from decimal import Decimal
+from io import BytesIO
+
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy as _
+from openpyxl import load_workbook
+
+from neptune.resources import stream_csv, stream_xlsx
+
+
+class StreamWritersTestCase(SimpleTestCase):
+    def setUp(self):
+        self.rows = [
+            ('id', 'name', 'purchased date', 'cost'),
+            (1, _('Unit cost'), date(2019, 3, 22), Decimal('10.50')),
+            (2, 'Lot, "quoted"', None, None),
+        ]
+
+    def test_stream_csv(self):
+        lines = list(stream_csv(iter(self.rows)))
+        self.assertEqual(lines, [
+            'id,name,purchased date,cost\r\n',
+            '1,Unit cost,2019-03-22,10.50\r\n',
+            '2,"Lot, ""quoted""",,\r\n',
+        ])
+
+    def test_stream_xlsx(self):
+        workbook = load_workbook(BytesIO(b''.join(stream_xlsx(iter(self.rows)))))
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(rows[0], ('id', 'name', 'purchased date', 'cost'))
+        self.assertEqual(rows[1][:2], (1, 'Unit cost'))
+        self.assertEqual(rows[1][2].date(), date(2019, 3, 22))
+        self.assertEqual(rows[1][3], 10.5)
+        self.assertEqual(rows[2], (2, 'Lot, "quoted"', None, None))
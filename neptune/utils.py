@@ -1,5 +1,7 @@
 import time
 
+from django.core.cache.backends.locmem import LocMemCache
+
 
 def make_imagefield_filepath(upload_to, instance, filename):
     model_class = instance.__class__
@@ -13,3 +15,10 @@ def make_imagefield_filepath(upload_to, instance, filename):
         uploading_filename = f'{file_name}-{timestamp}.{file_extension}'
 
     return uploading_filename
+
+
+def is_process_local_cache(cache):
+    """
+    Whether entries of a cache are only seen by the current process, so other processes cannot invalidate them.
+    """
+    return isinstance(cache, LocMemCache)
@@ -1,11 +1,14 @@
+from collections import defaultdict
+
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.postgres.fields import JSONField
+from django.core.cache import cache
 from django.db import models
 from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 
-from device.models import Product
+from device.models import CatalogVersion, Category, Product, Specialty
 from hospital.models import Account
 from price.models import COST_TYPES, UNIT_COST
 from order.managers import OrderQuerySet
@@ -21,6 +24,8 @@ ORDER_STATUSES = (
     (ORDER_CANCELLED, _('Cancelled')),
 )
 
+PREFERENCE_QUESTIONS_CACHE_VERSION_KEY = 'preference-questions-version'
+
 
 class Question(models.Model):
     name = models.CharField(_('Question'), max_length=255, unique=True)
@@ -57,19 +62,85 @@ class Preference(models.Model):
 
     @staticmethod
     def get_preferences_by_product_client(product, client):
-        cases = (
-            (client, product.category),
-            (client, product.category.specialty),
-            (None, product.category),
-            (None, product.category.specialty),
-            (client,),
-            (),
+        return Preference.get_preferences_by_categories_client([product.category], client)[product.category_id]
+
+    @staticmethod
+    def questions_version():
+        """
+        Timestamp of the last change of preference questions, 0 before the first one.
+        It is kept in the database, so cached questions of every process are invalidated together.
+        """
+        changed_at = CatalogVersion.get_many([PREFERENCE_QUESTIONS_CACHE_VERSION_KEY]).get(
+            PREFERENCE_QUESTIONS_CACHE_VERSION_KEY
         )
-        for case in cases:
-            preference = Preference._retrieve_preferences(*case)
-            if preference.exists():
-                return preference.first().questions.all()
-        return Question.objects.none()
+        return changed_at.timestamp() if changed_at else 0
+
+    @staticmethod
+    def questions_cache_key(client_id, category_id, version):
+        return f'preference:{client_id}:{category_id}:questions:{version}'
+
+    @staticmethod
+    def invalidate_questions():
+        CatalogVersion.bump(PREFERENCE_QUESTIONS_CACHE_VERSION_KEY)
+
+    @staticmethod
+    def get_preferences_by_categories_client(categories, client):
+        """
+        Cached preference questions of all products of the given categories at a client, by category id.
+        """
+        version = Preference.questions_version()
+        categories = dict((Preference.questions_cache_key(client.id, category.id, version), category)
+                          for category in categories)
+        cached_questions = cache.get_many(categories)
+        questions = dict((categories[key].id, category_questions)
+                         for key, category_questions in cached_questions.items())
+
+        uncached_categories = [category for key, category in categories.items() if key not in cached_questions]
+        if uncached_categories:
+            resolved_questions = Preference._resolve_questions(uncached_categories, client)
+            cache.set_many(dict((Preference.questions_cache_key(client.id, category_id, version), category_questions)
+                                for category_id, category_questions in resolved_questions.items()), None)
+            questions.update(resolved_questions)
+        return questions
+
+    @staticmethod
+    def _resolve_questions(categories, client):
+        category_type = ContentType.objects.get_for_model(Category)
+        specialty_type = ContentType.objects.get_for_model(Specialty)
+        preferences = Preference.objects.filter(
+            Q(client=client) | Q(client=None),
+            Q(content_type=None, object_id=None) |
+            Q(content_type=category_type, object_id__in=[category.id for category in categories]) |
+            Q(content_type=specialty_type, object_id__in=[category.specialty_id for category in categories])
+        ).order_by('id').values_list('client_id', 'content_type_id', 'object_id', 'id')
+
+        preference_ids = {}
+        for client_id, content_type_id, object_id, preference_id in preferences:
+            preference_ids.setdefault((client_id, content_type_id, object_id), preference_id)
+
+        category_preference_ids = {}
+        for category in categories:
+            cases = (
+                (client.id, category_type.id, category.id),
+                (client.id, specialty_type.id, category.specialty_id),
+                (None, category_type.id, category.id),
+                (None, specialty_type.id, category.specialty_id),
+                (client.id, None, None),
+                (None, None, None),
+            )
+            category_preference_ids[category.id] = next(
+                (preference_ids[case] for case in cases if case in preference_ids), None
+            )
+
+        questions = defaultdict(list)
+        questionnaires = Questionnaire.objects.filter(
+            preference_id__in=set(category_preference_ids.values())
+        ).select_related('question').order_by('id')
+        for questionnaire in questionnaires:
+            questions[questionnaire.preference_id].append(questionnaire.question)
+
+        return dict((category_id, questions.get(preference_id, []))
+                    for category_id, preference_id in category_preference_ids.items())
 
 
 class Questionnaire(models.Model):
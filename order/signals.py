@@ -0,0 +1,18 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from device.models import Category
+from order.models import Preference, Question, Questionnaire
+
+
+@receiver(post_save, sender=Preference)
+@receiver(post_delete, sender=Preference)
+@receiver(post_save, sender=Questionnaire)
+@receiver(post_delete, sender=Questionnaire)
+@receiver(m2m_changed, sender=Questionnaire)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_preference_questions(sender, **kwargs):
+    Preference.invalidate_questions()
@@ -1,10 +1,11 @@
 from datetime import datetime
+from django.core.cache import cache
 from django.test import TestCase
 
-from device.factories import ProductFactory
+from device.factories import CategoryFactory, ProductFactory
 from hospital.factories import ClientFactory
 from order.factories import PreferenceFactory, OrderFactory, QuestionFactory
-from order.models import Preference
+from order.models import Preference, Questionnaire
 
 
 class PreferenceTestCase(TestCase):
@@ -77,6 +78,41 @@ class PreferenceTestCase(TestCase):
             []
         )
 
+    def test_get_preferences_by_categories_client(self):
+        question_1, question_2, question_3 = QuestionFactory.create_batch(3)
+        category_1 = self.product.category
+        category_2 = CategoryFactory(specialty=category_1.specialty)
+        category_3 = CategoryFactory()
+        PreferenceFactory(client=self.client, content_object=category_1, questions=[question_1])
+        PreferenceFactory(client=None, content_object=category_1.specialty, questions=[question_2])
+        common_preference = PreferenceFactory(client=None, content_object=None, questions=[question_3])
+
+        with self.assertNumQueries(3):
+            questions = Preference.get_preferences_by_categories_client([category_1, category_2, category_3],
+                                                                        self.client)
+        self.assertDictEqual(questions, {
+            category_1.id: [question_1],
+            category_2.id: [question_2],
+            category_3.id: [question_3],
+        })
+
+        with self.assertNumQueries(1):
+            Preference.get_preferences_by_categories_client([category_1, category_2, category_3], self.client)
+
+        Questionnaire.objects.create(preference=common_preference, question=question_1)
+        self.assertCountEqual(
+            Preference.get_preferences_by_categories_client([category_3], self.client)[category_3.id],
+            [question_1, question_3]
+        )
+
+    def test_questions_version_survives_process_local_cache(self):
+        version = Preference.questions_version()
+        cache.clear()
+        self.assertEqual(Preference.questions_version(), version)
+
+        QuestionFactory()
+        self.assertGreater(Preference.questions_version(), version)
+
 
 class OderTestCase(TestCase):
     def test_order_to_string(self):
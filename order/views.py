@@ -1,15 +1,15 @@
 from django.db.models import Count
-from knox.auth import TokenAuthentication
 from rest_framework import status
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from api.authentication import CachedTokenAuthentication
 from device.models import Product
 from hospital.constants import RolePriority
-from hospital.models import Client, Account
-from hospital.permissions import IsClientPhysician
+from hospital.models import Client
+from hospital.permissions import AuthorizationContext, IsClientPhysician
 from order.models import Preference, Order, Question
 from order.serializers import QuestionSerializer, OrderSerializer, OrderSummarySerializer, \
     ProductOrderSummarySerializer, PreferenceQuestionSummarySerializer
@@ -17,7 +17,7 @@ from order.schemas import OrderSchema
 
 
 class ProductPreferenceListView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get(self, request, client_id, product_id):
@@ -25,7 +25,7 @@ class ProductPreferenceListView(APIView):
         List of possible preferences a physician can select when ordering a product
         """
 
-        product = get_object_or_404(Product, id=product_id)
+        product = get_object_or_404(Product.objects.select_related('category'), id=product_id)
         client = get_object_or_404(Client, id=client_id)
         questions = Preference.get_preferences_by_product_client(product, client)
         questions_serializer = QuestionSerializer(questions, many=True)
@@ -33,7 +33,7 @@ class ProductPreferenceListView(APIView):
 
 
 class OrderListView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     schema = OrderSchema()
 
@@ -41,9 +41,9 @@ class OrderListView(APIView):
         """
         Physician orders a product in a client
         """
-        physician_account = get_object_or_404(request.user.account_set,
-                                              client_id=client_id,
-                                              role__priority=RolePriority.PHYSICIAN.value)
+        physician_account = AuthorizationContext.for_user(request.user).get_account_or_404(
+            client_id, RolePriority.PHYSICIAN.value
+        )
         request.data['physician'] = physician_account.id
         order_serializer = OrderSerializer(data=request.data)
         if order_serializer.is_valid():
@@ -53,7 +53,7 @@ class OrderListView(APIView):
 
 
 class OrderSummaryListAPIView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated, IsClientPhysician,)
 
     def get(self, request, client_id):
@@ -83,14 +83,14 @@ class OrderSummaryListAPIView(APIView):
 
 
 class OrderSummaryByCategoryListAPIView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated, IsClientPhysician,)
 
     def get(self, request, client_id, category_id):
         """
         Summarize number of orders of current physician in a category at a client
         """
-        physician = get_object_or_404(Account, client_id=client_id, user=request.user)
+        physician = AuthorizationContext.for_user(request.user).get_account_or_404(client_id)
         products_with_orders_count = Product.objects.filter(
             order__physician=physician,
             category__id=category_id
@@ -100,14 +100,14 @@ class OrderSummaryByCategoryListAPIView(APIView):
 
 
 class PreferenceByOrderedProductListView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated, IsClientPhysician,)
 
     def get(self, request, client_id, product_id):
         """
         List of preferences selected by current physician on ordered products
         """
-        physician = get_object_or_404(Account, client_id=client_id, user=request.user)
+        physician = AuthorizationContext.for_user(request.user).get_account_or_404(client_id)
         product = get_object_or_404(Product, pk=product_id)
         questions = Question.objects.annotate(count=Count('id')).filter(order__physician=physician,
                                                                         order__product=product)
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib import admin
 from django.http import HttpResponse
+from django.template.loader import render_to_string
 from django.utils.functional import curry
 from django.utils.safestring import mark_safe
 
@@ -206,9 +207,9 @@ class RebatedItemsInline(admin.TabularInline):
 class RebateAdmin(FSMTransitionMixin, admin.ModelAdmin):
     list_display = ('name', 'start_date', 'end_date', 'status')
     form = RebateForm
-    fields = ('name', 'manufacturer', 'client', 'start_date', 'end_date', 'status')
+    fields = ('name', 'manufacturer', 'client', 'start_date', 'end_date', 'status', 'progress')
     fsm_field = ('status',)
-    readonly_fields = ('status',)
+    readonly_fields = ('status', 'progress')
     inlines = (TiersInline, RebatedItemsInline, EligibleItemsInline)
 
     class Media:
@@ -224,6 +225,11 @@ class RebateAdmin(FSMTransitionMixin, admin.ModelAdmin):
             instances = [instance for instance in instances if isinstance(instance, TiersInline)]
         return instances
 
+    def progress(self, rebate):
+        if rebate.id is None:
+            return '-'
+        return render_to_string('admin/price/rebate/progress.html', {'progress': rebate.progress()})
+
 
 admin.site.register(ClientPrice, ClientPriceAdmin)
 admin.site.register(Rebate, RebateAdmin)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class PriceConfig(AppConfig):
     name = 'price'
+
+    def ready(self):
+        import price.signals  # noqa: F401
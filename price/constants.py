@@ -58,6 +58,9 @@ REBATABLE_ITEM_TYPES = (
     (REBATED_ITEM, _('Rebated item')),
 )
 
+REBATABLE_PRODUCT_IDS_CACHE_VERSION_KEY = 'rebatable-product-ids-version'
+REBATABLE_PRODUCT_IDS_LOCAL_CACHE_TIMEOUT = 60
+
 DROPPED = 1
 WRONG_DEVICE = 2
 REP_ERROR = 3
@@ -1,3 +1,4 @@
+from django.apps import apps
 from django.db.models import QuerySet
 
 from hospital.constants import BULK_PURCHASE
@@ -22,3 +23,42 @@ class DiscountQuerySet(QuerySet):
             discount_list = client_price.setdefault(discount.cost_type, [])
             discount_list.append(discount)
         return client_prices
+
+
+class RebatableItemQuerySet(QuerySet):
+    def product_ids_by_rebate(self):
+        """
+        Expand rebatable items into product ids with one query per content type.
+        Returns {(rebate_id, item_type): set of product ids}.
+        """
+        Product = apps.get_model(app_label='device', model_name='product')
+        rebatable_items = self.values_list('rebate_id', 'item_type', 'content_type__model', 'object_id')
+
+        scopes = {}
+        object_ids = {'product': set(), 'category': set(), 'specialty': set()}
+        for rebate_id, item_type, model, object_id in rebatable_items:
+            scopes.setdefault((rebate_id, item_type), [])
+            if model in object_ids:
+                scopes[(rebate_id, item_type)].append((model, object_id))
+                object_ids[model].add(object_id)
+
+        product_ids = {('product', product_id): [product_id] for product_id in object_ids['product']}
+        for model, lookup in (('category', 'category_id'), ('specialty', 'category__specialty_id')):
+            if object_ids[model]:
+                products = Product.objects.filter(**{f'{lookup}__in': object_ids[model]}).values_list(lookup, 'id')
+                for object_id, product_id in products:
+                    product_ids.setdefault((model, object_id), []).append(product_id)
+
+        return dict(
+            (scope, set(product_id for scope_object in scope_objects
+                        for product_id in product_ids.get(scope_object, [])))
+            for scope, scope_objects in scopes.items()
+        )
+
+    def product_ids(self):
+        """
+        Product ids covered by the rebatable items, None when there is no rebatable item.
+        """
+        scopes = self.product_ids_by_rebate()
+        if scopes:
+            return set.union(*scopes.values())
@@ -1,20 +1,28 @@
 from decimal import Decimal
+from operator import attrgetter
+from uuid import uuid4
 
 from django.apps import apps
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
 from django.db import models, transaction
-from django.db.models import Sum, Q
+from django.db.models import Sum, Q, Count, OuterRef, Subquery
 from django.db.models.query import QuerySet
 from django.utils.translation import gettext_lazy as _
 from django_fsm import transition, FSMIntegerField
 
+from device.cache import invalidate_catalog
+from device.constants import CATALOG_CHANGE_CREATED
 from neptune.models import SharedImage
+from neptune.utils import is_process_local_cache
 from price.constants import UNIT_COST, SYSTEM_COST, PERCENT_DISCOUNT, COST_TYPES, DISCOUNT_TYPES, \
     DISCOUNT_APPLY_TYPES, ON_DOCTOR_ORDER, SPEND, MARKETSHARE, TIER_TYPES, POST_DOCTOR_ORDER, PURCHASED_UNITS, \
     NEW_REBATE, COMPLETE_REBATE, REBATE_STATUSES, REBATABLE_ITEM_TYPES, ELIGIBLE_ITEM, REBATED_ITEM, USED_UNITS, \
-    PRE_DOCTOR_ORDER
-from price.managers import DiscountQuerySet
+    PRE_DOCTOR_ORDER, REBATABLE_PRODUCT_IDS_CACHE_VERSION_KEY, REBATABLE_PRODUCT_IDS_LOCAL_CACHE_TIMEOUT
+from price.managers import DiscountQuerySet, RebatableItemQuerySet
 
 
 class ClientPrice(models.Model):
@@ -48,11 +56,24 @@ class ClientPrice(models.Model):
         return self.discounts(SYSTEM_COST)
 
     def redeem(self, discounts, item):
+        if isinstance(discounts, QuerySet):
+            discounts = discounts.filter(cost_type=item.cost_type).order_by('order')
+        return self.redeem_batch([(self, discounts, item)])[0]
+
+    @staticmethod
+    def redeem_batch(redemptions):
+        """
+        Redeem discounts of many items in one pass, without touching the database.
+        `redemptions` is an iterable of (client_price, discounts, item) with preloaded discounts,
+        item's rep_case should be selected to avoid extra queries.
+        Returns redemption results in the same order.
+        """
+        return [client_price._redeem_discounts(discounts, item) for client_price, discounts, item in redemptions]
+
+    def _redeem_discounts(self, discounts, item):
         original_cost = cost = self.original_cost(item.cost_type)
-        if not isinstance(discounts, QuerySet):
-            discount_ids = [discount.id for discount in discounts]
-            discounts = Discount.objects.filter(id__in=discount_ids)
-        discounts = discounts.filter(cost_type=item.cost_type).order_by('order')
+        discounts = sorted((discount for discount in discounts if discount.cost_type == item.cost_type),
+                           key=attrgetter('order'))
 
         previous_order = None
         previous_order_discounts_value = 0
@@ -166,6 +187,8 @@ class RebatableItem(models.Model):
     item_type = models.PositiveSmallIntegerField(choices=REBATABLE_ITEM_TYPES, default=ELIGIBLE_ITEM)
     rebate = models.ForeignKey('Rebate', on_delete=models.CASCADE, related_name='rebatable_items')
 
+    objects = RebatableItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ('content_type', 'object_id', 'rebate', 'item_type')
 
@@ -203,74 +226,250 @@ class Rebate(models.Model):
     def rebated_items(self):
         return self.rebatable_items.filter(item_type=REBATED_ITEM)
 
-    def rebatable_product_ids(self, rebatable_items):
-        product_ids = []
-        for rebatable_item in rebatable_items.all():
-            product_ids += rebatable_item.product_ids
+    @staticmethod
+    def product_ids_cache_timeout():
+        """
+        Invalidations only reach other processes through a shared cache, a process-local one keeps scopes briefly.
+        """
+        if is_process_local_cache(caches[DEFAULT_CACHE_ALIAS]):
+            return REBATABLE_PRODUCT_IDS_LOCAL_CACHE_TIMEOUT
+        return None
+
+    @classmethod
+    def product_ids_cache_key(cls, rebate_id, item_type):
+        version = cache.get_or_set(REBATABLE_PRODUCT_IDS_CACHE_VERSION_KEY, uuid4().hex,
+                                   cls.product_ids_cache_timeout())
+        return f'rebate:{rebate_id}:{item_type}:product_ids:{version}'
+
+    @classmethod
+    def invalidate_all_product_ids(cls):
+        cache.set(REBATABLE_PRODUCT_IDS_CACHE_VERSION_KEY, uuid4().hex, cls.product_ids_cache_timeout())
+
+    @classmethod
+    def invalidate_product_ids(cls, rebate_id):
+        cache.delete_many([cls.product_ids_cache_key(rebate_id, item_type) for item_type, _ in REBATABLE_ITEM_TYPES])
+
+    @classmethod
+    def cache_product_ids(cls, rebates):
+        """
+        Resolve and cache product ids of all rebatable items of the given rebates with a fixed number of queries.
+        """
+        rebate_ids = [rebate.id for rebate in rebates]
+        product_ids = RebatableItem.objects.filter(rebate_id__in=rebate_ids).product_ids_by_rebate()
+        cache.set_many(dict(
+            (cls.product_ids_cache_key(rebate_id, item_type), {'product_ids': product_ids.get((rebate_id, item_type))})
+            for rebate_id in rebate_ids for item_type, _ in REBATABLE_ITEM_TYPES
+        ), cls.product_ids_cache_timeout())
         return product_ids
 
+    def get_product_ids(self, item_type):
+        """
+        Cached product ids of rebatable items of the given type, None when the rebate has no such item.
+        """
+        scope = cache.get(self.product_ids_cache_key(self.id, item_type))
+        if scope is None:
+            return self.cache_product_ids([self]).get((self.id, item_type))
+        return scope['product_ids']
+
     def get_device_items(self, rebatable_items):
+        return self._get_device_items(rebatable_items.product_ids())
+
+    def _get_device_items(self, product_ids):
         Item = apps.get_model(app_label='hospital', model_name='item')
+        return Item.objects.filter(**self._get_device_items_filter_attrs(product_ids))
+
+    def _get_device_items_filter_attrs(self, product_ids):
         filter_attrs = dict(
             device__client=self.client,
             device__product__manufacturer=self.manufacturer,
         )
 
-        if rebatable_items.exists():
-            filter_attrs['device__product__id__in'] = self.rebatable_product_ids(rebatable_items)
+        if product_ids is not None:
+            filter_attrs['device__product__id__in'] = product_ids
         if self.start_date:
             filter_attrs['purchased_date__gte'] = self.start_date
         if self.end_date:
             filter_attrs['purchased_date__lte'] = self.end_date
 
-        return Item.objects.filter(**filter_attrs)
+        return filter_attrs
+
+    def progress(self):
+        """
+        Evaluate every tier against eligible purchased items with a single aggregate query.
+        """
+        Item = apps.get_model(app_label='hospital', model_name='item')
+        eligible_filter_attrs = self._get_device_items_filter_attrs(self.get_product_ids(ELIGIBLE_ITEM))
+        period_filter_attrs = dict((lookup, value) for lookup, value in eligible_filter_attrs.items()
+                                   if lookup.startswith('purchased_date'))
+        eligible = Q(**eligible_filter_attrs)
+
+        progress = Item.objects.filter(device__client=self.client, **period_filter_attrs).aggregate(
+            spend=Sum('cost', filter=eligible),
+            purchased_units=Count('id', filter=eligible),
+            used_units=Count('id', filter=eligible & Q(is_used=True)),
+            client_spend=Sum('cost'),
+        )
+        progress['spend'] = progress['spend'] or 0
+        progress['client_spend'] = progress['client_spend'] or 0
+        progress['marketshare'] = (float((progress['spend'] / progress['client_spend']) * 100)
+                                   if progress['client_spend'] else 0)
+
+        tiers = []
+        for tier in self.tier_set.all():
+            value = tier.get_progress_value(progress)
+            tiers.append({'tier': tier, 'value': value, 'is_valid': tier.is_reached(value)})
+        progress['tiers'] = tiers
+        return progress
+
+    def simulate(self):
+        """
+        Compute which tiers qualify and how rebated item costs would change if the rebate was applied,
+        without writing anything to the database.
+        """
+        Item = apps.get_model(app_label='hospital', model_name='item')
+        RepCase = apps.get_model(app_label='tracker', model_name='repcase')
+        progress = self.progress()
+        valid_tiers = [tier_progress['tier'] for tier_progress in progress['tiers'] if tier_progress['is_valid']]
+
+        rebated_purchased_items = self._get_device_items(self.get_product_ids(REBATED_ITEM))
+        item_discount_ids = Item.discounts.through.objects.filter(item_id=OuterRef('pk')).order_by().values(
+            'item_id'
+        ).annotate(discount_ids=ArrayAgg('discount_id')).values('discount_ids')
+        item_groups = list(rebated_purchased_items.annotate(
+            discount_ids=Subquery(item_discount_ids, output_field=ArrayField(models.IntegerField()))
+        ).values(
+            'device__product_id', 'cost_type', 'purchased_date', 'rep_case__procedure_date', 'discount_ids'
+        ).annotate(count=Count('id')).order_by())
+
+        discounts = Discount.objects.exclude(rebate=self).in_bulk(
+            set(discount_id for item_group in item_groups for discount_id in item_group['discount_ids'] or [])
+        )
+        client_prices = dict(
+            (client_price.product_id, client_price)
+            for client_price in self.client.clientprice_set.filter(product__manufacturer=self.manufacturer)
+        )
+
+        simulation = dict(items=0, cost=0, saving=0, rebated_cost=0, rebated_saving=0)
+        rebate_discounts = {}
+        for item_group in item_groups:
+            client_price = client_prices.get(item_group['device__product_id'])
+            if client_price is None:
+                continue
+
+            cost_type = item_group['cost_type']
+            procedure_date = item_group['rep_case__procedure_date']
+            item = Item(cost_type=cost_type, purchased_date=item_group['purchased_date'])
+            item.rep_case = procedure_date and RepCase(procedure_date=procedure_date)
+            item_discounts = [discounts[discount_id] for discount_id in item_group['discount_ids'] or []
+                              if discount_id in discounts]
+            for tier in valid_tiers:
+                rebate_discounts.setdefault(
+                    (tier.id, client_price.id, cost_type),
+                    Discount(cost_type=cost_type, client_price=client_price, **tier.rebate_discount_attrs)
+                )
+            rebated_item_discounts = item_discounts + [rebate_discounts[(tier.id, client_price.id, cost_type)]
+                                                       for tier in valid_tiers]
+            redemption, rebated_redemption = ClientPrice.redeem_batch([
+                (client_price, item_discounts, item),
+                (client_price, rebated_item_discounts, item),
+            ])
+
+            count = item_group['count']
+            simulation['items'] += count
+            simulation['cost'] += redemption['total_cost'] * count
+            simulation['saving'] += redemption['point_of_sales_saving'] * count
+            simulation['rebated_cost'] += rebated_redemption['total_cost'] * count
+            simulation['rebated_saving'] += rebated_redemption['point_of_sales_saving'] * count
+
+        simulation['cost_delta'] = simulation['rebated_cost'] - simulation['cost']
+        simulation['progress'] = progress
+        return simulation
 
     @transition(field=status, source=NEW_REBATE, target=COMPLETE_REBATE)
     @transaction.atomic
     def apply(self):
-        eligible_purchased_items = self.get_device_items(self.eligible_items)
+        self.invalidate_product_ids(self.id)
         rebated_purchased_items = self.get_device_items(self.rebated_items)
 
-        for tier in self.tier_set.all():
-            if tier.is_valid(eligible_purchased_items):
-                rebate_discount_attrs = dict(
-                    name=f'{self.name}: {tier}',
-                    apply_type=POST_DOCTOR_ORDER,
-                    order=tier.order,
-                    discount_type=tier.discount_type,
-                    start_date=tier.rebate.start_date,
-                    end_date=tier.rebate.end_date,
-                    rebate=self
-                )
-                if tier.discount_type == PERCENT_DISCOUNT:
-                    rebate_discount_attrs['percent'] = tier.percent
-                else:
-                    rebate_discount_attrs['value'] = tier.value
-
-                for item in rebated_purchased_items:
-                    client_price = self.client.clientprice_set.get(product=item.device.product)
-                    rebate_discount = Discount.objects.get_or_create(
-                        cost_type=item.cost_type,
-                        client_price=client_price,
-                        **rebate_discount_attrs
-                    )[0]
-                    item.discounts.add(rebate_discount)
-
-        for item in rebated_purchased_items:
-            item.refresh_cost()
-            item.save(update_app=item.is_used)
+        valid_tiers = [tier_progress['tier'] for tier_progress in self.progress()['tiers'] if tier_progress['is_valid']]
+        if valid_tiers:
+            items = list(rebated_purchased_items.select_related('device'))
+            client_prices = dict(
+                (client_price.product_id, client_price) for client_price in
+                self.client.clientprice_set.filter(product_id__in=set(item.device.product_id for item in items))
+            )
+            item_client_prices = [(item, client_prices[item.device.product_id]) for item in items
+                                  if item.device.product_id in client_prices]
+            rebate_discounts = self._get_or_create_rebate_discounts(
+                valid_tiers,
+                set((client_price, item.cost_type) for item, client_price in item_client_prices)
+            )
+            self._add_item_discounts(
+                (item.id, rebate_discounts[(tier.id, client_price.id, item.cost_type)].id)
+                for item, client_price in item_client_prices for tier in valid_tiers
+            )
+
+        self._reprice(rebated_purchased_items)
 
     @transition(field=status, source=COMPLETE_REBATE, target=NEW_REBATE)
     @transaction.atomic
     def unapply(self):
-        applied_rebate_discounts = self.discount_set.all()
-        for discount in applied_rebate_discounts:
-            discount.delete()
+        self.discount_set.all().delete()
+        self._reprice(self.get_device_items(self.rebated_items))
+
+    def _get_or_create_rebate_discounts(self, tiers, client_price_cost_types):
+        """
+        Return rebate discounts keyed by (tier id, client price id, cost type),
+        reusing existing ones and creating the missing ones in one INSERT.
+        """
+        existing_discounts = list(self.discount_set.all())
+        rebate_discounts = {}
+        new_discounts = []
+        for tier in tiers:
+            discount_attrs = tier.rebate_discount_attrs
+            existing_tier_discounts = dict(
+                ((discount.client_price_id, discount.cost_type), discount) for discount in existing_discounts
+                if all(getattr(discount, field) == value for field, value in discount_attrs.items())
+            )
+            for client_price, cost_type in client_price_cost_types:
+                discount = existing_tier_discounts.get((client_price.id, cost_type))
+                if discount is None:
+                    discount = Discount(cost_type=cost_type, client_price=client_price, **discount_attrs)
+                    new_discounts.append(discount)
+                rebate_discounts[(tier.id, client_price.id, cost_type)] = discount
+
+        Discount.objects.bulk_create(new_discounts)
+        if new_discounts:
+            CatalogChange = apps.get_model(app_label='device', model_name='catalogchange')
+            CatalogChange.log('discount', [discount.id for discount in new_discounts], CATALOG_CHANGE_CREATED,
+                              self.client_id)
+            invalidate_catalog(self.client_id)
+        return rebate_discounts
+
+    @staticmethod
+    def _add_item_discounts(item_discount_ids):
+        ItemDiscount = Discount.item_set.through
+        item_discount_ids = set(item_discount_ids)
+        existing_item_discount_ids = set(ItemDiscount.objects.filter(
+            item_id__in=set(item_id for item_id, _ in item_discount_ids),
+            discount_id__in=set(discount_id for _, discount_id in item_discount_ids),
+        ).values_list('item_id', 'discount_id')) if item_discount_ids else set()
+
+        ItemDiscount.objects.bulk_create(
+            ItemDiscount(item_id=item_id, discount_id=discount_id)
+            for item_id, discount_id in item_discount_ids - existing_item_discount_ids
+        )
 
-        rebated_purchased_items = self.get_device_items(self.rebated_items)
-        for item in rebated_purchased_items:
-            item.refresh_cost()
-            item.save(update_app=item.is_used)
+    @staticmethod
+    def _reprice(purchased_items):
+        repriced_items = []
+        for item, redemption in purchased_items.redeem():
+            if redemption:
+                item.apply_redemption(redemption)
+                repriced_items.append(item)
+        purchased_items.model.objects.update_costs(repriced_items)
+        purchased_items.update_app()
+        purchased_items.update_rollups()
 
 
 class Tier(DiscountBase):
@@ -279,38 +478,35 @@ class Tier(DiscountBase):
     upper_bound = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
     rebate = models.ForeignKey(Rebate, on_delete=models.CASCADE)
 
+    PROGRESS_KEYS = {
+        SPEND: 'spend',
+        MARKETSHARE: 'marketshare',
+        PURCHASED_UNITS: 'purchased_units',
+        USED_UNITS: 'used_units',
+    }
+
     def __str__(self):
         return f'{self.get_tier_type_display()} in range ({self.lower_bound}, {self.upper_bound})'
 
-    def marketshare(self, eligible_purchased_items):
-        client_total_spend = self.rebate.client.items.filter(
-            purchased_date__gte=self.rebate.start_date,
-            purchased_date__lte=self.rebate.end_date
-        ).aggregate(spend=Sum('cost'))['spend']
-
-        if client_total_spend:
-            spend = self.spend(eligible_purchased_items)
-            return float((spend / client_total_spend) * 100)
+    @property
+    def rebate_discount_attrs(self):
+        rebate_discount_attrs = dict(
+            name=f'{self.rebate.name}: {self}',
+            apply_type=POST_DOCTOR_ORDER,
+            order=self.order,
+            discount_type=self.discount_type,
+            start_date=self.rebate.start_date,
+            end_date=self.rebate.end_date,
+            rebate_id=self.rebate_id,
+        )
+        if self.discount_type == PERCENT_DISCOUNT:
+            rebate_discount_attrs['percent'] = self.percent
         else:
-            return 0
-
-    def spend(self, eligible_purchased_items):
-        return eligible_purchased_items.aggregate(spend=Sum('cost'))['spend'] or 0
-
-    def purchased_units(self, eligible_purchased_items):
-        return eligible_purchased_items.count()
-
-    def used_units(self, eligible_purchased_items):
-        return eligible_purchased_items.filter(is_used=True).count()
+            rebate_discount_attrs['value'] = self.value
+        return rebate_discount_attrs
 
-    def is_valid(self, eligible_purchased_items):
-        if self.tier_type == SPEND:
-            value = self.spend(eligible_purchased_items)
-        elif self.tier_type == MARKETSHARE:
-            value = self.marketshare(eligible_purchased_items)
-        elif self.tier_type == PURCHASED_UNITS:
-            value = self.purchased_units(eligible_purchased_items)
-        elif self.tier_type == USED_UNITS:
-            value = self.used_units(eligible_purchased_items)
+    def get_progress_value(self, progress):
+        return progress[self.PROGRESS_KEYS[self.tier_type]]
 
+    def is_reached(self, value):
         return (value >= self.lower_bound) and (value <= self.upper_bound if self.upper_bound else True)
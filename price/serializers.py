@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
-from price.models import Discount
+from neptune.serializers import FastSerializer, attribute, decimal_string
+from price.models import ClientPrice, Discount
 
 
 class DiscountSerializer(serializers.ModelSerializer):
@@ -12,3 +13,31 @@ class DiscountSerializer(serializers.ModelSerializer):
 
     def get_image(self, discount):
         return discount.shared_image and discount.shared_image.image.url
+
+
+class FastDiscountSerializer(FastSerializer):
+    def get_fields(self):
+        return (
+            ('id', attribute('id'), int),
+            ('name', attribute('name'), str),
+            ('value', attribute('value'), decimal_string(20, 2)),
+            ('order', attribute('order'), int),
+            ('image', self.get_image, None),
+            ('percent', attribute('percent'), decimal_string(5, 2)),
+            ('discount_type', attribute('discount_type'), int),
+            ('apply_type', attribute('apply_type'), int),
+        )
+
+    def get_image(self, discount):
+        return discount.shared_image and self.image_url(discount.shared_image.image)
+
+
+class DiscountSyncSerializer(DiscountSerializer):
+    class Meta(DiscountSerializer.Meta):
+        fields = DiscountSerializer.Meta.fields + ('cost_type', 'client_price', 'start_date', 'end_date')
+
+
+class ClientPriceSyncSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ClientPrice
+        fields = ('id', 'product', 'unit_cost', 'system_cost')
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from device.models import Category, Product
+from price.models import Rebate, RebatableItem
+
+
+@receiver(post_save, sender=RebatableItem)
+@receiver(post_delete, sender=RebatableItem)
+def invalidate_rebate_product_ids(sender, instance, **kwargs):
+    Rebate.invalidate_product_ids(instance.rebate_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_all_rebate_product_ids(sender, **kwargs):
+    Rebate.invalidate_all_product_ids()
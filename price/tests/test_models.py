@@ -1,21 +1,27 @@
 from decimal import Decimal
 
 from datetime import date, datetime, timedelta
-from django.db import IntegrityError
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django_fsm import TransitionNotAllowed
 
+from device.constants import CATALOG_CHANGE_CREATED
 from device.factories import ProductFactory, CategoryFactory, SpecialtyFactory
+from device.models import CatalogChange
 from hospital.constants import BULK_PURCHASE, CONSIGNMENT_PURCHASE
 from hospital.models import Item
 from price.factories import ClientPriceFactory, DiscountFactory, RebatableItemFactory, RebateFactory, TierFactory
 from price.models import ClientPrice, RebatableItem, Discount
 from price.constants import UNIT_COST, SYSTEM_COST, VALUE_DISCOUNT, ELIGIBLE_ITEM, REBATED_ITEM, MARKETSHARE, SPEND, \
     PURCHASED_UNITS, USED_UNITS, COMPLETE_REBATE, NEW_REBATE, PERCENT_DISCOUNT, POST_DOCTOR_ORDER, PRE_DOCTOR_ORDER, \
-    ON_DOCTOR_ORDER
+    ON_DOCTOR_ORDER, REBATABLE_PRODUCT_IDS_LOCAL_CACHE_TIMEOUT
 from hospital.factories import ClientFactory, ItemFactory, DeviceFactory
 from tracker.factories import RepCaseFactory
-from tracker.models import RepCase
+from tracker.models import RepCase, PurchasePrice
 
 
 class ClientPriceTestCase(TestCase):
@@ -134,6 +140,43 @@ class ClientPriceTestCase(TestCase):
             ]
         })
 
+    def test_redeem_batch(self):
+        today = datetime.utcnow().date()
+        other_client_price = ClientPriceFactory(unit_cost=1000, system_cost=1200)
+        other_discount = DiscountFactory(cost_type=UNIT_COST, order=1, client_price=other_client_price,
+                                         discount_type=VALUE_DISCOUNT, value=100, name='CCO')
+        unit_cost_item = Item(purchased_date=today, rep_case=RepCase(procedure_date=today), cost_type=UNIT_COST)
+        system_cost_item = Item(purchased_date=today, rep_case=RepCase(procedure_date=today), cost_type=SYSTEM_COST)
+        unit_cost_discounts = list(self.client_price.unit_cost_discounts)
+        all_discounts = list(self.client_price.discount_set.all())
+
+        with self.assertNumQueries(0):
+            redemptions = ClientPrice.redeem_batch([
+                (self.client_price, unit_cost_discounts, unit_cost_item),
+                (self.client_price, all_discounts, system_cost_item),
+                (other_client_price, [other_discount], unit_cost_item),
+                (other_client_price, [other_discount], system_cost_item),
+            ])
+
+        self.assertEqual(len(redemptions), 4)
+        self.assertEqual(redemptions[0]['total_cost'], Decimal('13770.00'))
+        self.assertEqual(redemptions[0]['point_of_sales_saving'], Decimal('1530.00'))
+        self.assertEqual([redeemed['discount'] for redeemed in redemptions[0]['redeemed_discounts']],
+                         [self.unit_cost_discount_1, self.unit_cost_discount_2])
+        self.assertEqual(redemptions[1]['total_cost'], Decimal('6885.00'))
+        self.assertEqual([redeemed['discount'] for redeemed in redemptions[1]['redeemed_discounts']],
+                         [self.system_cost_discount_2, self.system_cost_discount_1])
+        self.assertEqual(redemptions[2]['total_cost'], 900)
+        self.assertEqual(redemptions[2]['point_of_sales_saving'], 100)
+        self.assertDictEqual(redemptions[3], {
+            'original_cost': 1200,
+            'total_cost': 1200,
+            'point_of_sales_saving': 0,
+            'redeemed_discounts': [],
+        })
+
+        self.assertDictEqual(self.client_price.redeem(unit_cost_discounts, unit_cost_item), redemptions[0])
+
 
 class DiscountTestCase(TestCase):
     def setUp(self):
@@ -182,6 +225,32 @@ class RebatableItemTestCase(TestCase):
         self.assertCountEqual(RebatableItemFactory(content_object=ClientFactory()).product_ids, [])
 
 
+class RebatableItemQuerySetTestCase(TestCase):
+    def test_product_ids_by_rebate(self):
+        specialty = SpecialtyFactory()
+        category_1, category_2 = CategoryFactory.create_batch(2, specialty=specialty)
+        product_1, product_2 = ProductFactory.create_batch(2, category=category_1)
+        product_3 = ProductFactory(category=category_2)
+        rebate_1, rebate_2 = RebateFactory.create_batch(2)
+        RebatableItemFactory(rebate=rebate_1, item_type=ELIGIBLE_ITEM, content_object=product_3)
+        RebatableItemFactory(rebate=rebate_1, item_type=ELIGIBLE_ITEM, content_object=category_1)
+        RebatableItemFactory(rebate=rebate_1, item_type=REBATED_ITEM, content_object=specialty)
+        RebatableItemFactory(rebate=rebate_2, item_type=REBATED_ITEM, content_object=category_2)
+        RebatableItemFactory(rebate=rebate_2, item_type=ELIGIBLE_ITEM, content_object=ClientFactory())
+
+        with self.assertNumQueries(3):
+            product_ids = RebatableItem.objects.all().product_ids_by_rebate()
+
+        self.assertDictEqual(product_ids, {
+            (rebate_1.id, ELIGIBLE_ITEM): {product_1.id, product_2.id, product_3.id},
+            (rebate_1.id, REBATED_ITEM): {product_1.id, product_2.id, product_3.id},
+            (rebate_2.id, REBATED_ITEM): {product_3.id},
+            (rebate_2.id, ELIGIBLE_ITEM): set(),
+        })
+        self.assertEqual(rebate_2.rebatable_items.product_ids(), {product_3.id})
+        self.assertIsNone(RebatableItem.objects.none().product_ids())
+
+
 class RebateTestCase(TestCase):
     def setUp(self):
         self.rebate = RebateFactory(name='Q3 bulk rebate', start_date=date(2018, 7, 1), end_date=date(2018, 9, 30))
@@ -202,11 +271,27 @@ class RebateTestCase(TestCase):
     def test_rebated_items(self):
         self.assertCountEqual(self.rebate.rebated_items, [self.rebate_item_2])
 
-    def test_rebatable_product_ids(self):
-        self.assertCountEqual(self.rebate.rebatable_product_ids(self.rebate.eligible_items), [self.product_1.id])
-        self.assertCountEqual(self.rebate.rebatable_product_ids(self.rebate.rebated_items),
-                              [self.product_1.id, self.product_2.id])
-        self.assertCountEqual(self.rebate.rebatable_product_ids(RebatableItem.objects.none()), [])
+    def test_product_ids_cached_briefly_in_process_local_cache(self):
+        with patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            self.rebate.get_product_ids(ELIGIBLE_ITEM)
+        self.assertEqual(set_many.call_args[0][1], REBATABLE_PRODUCT_IDS_LOCAL_CACHE_TIMEOUT)
+
+    def test_get_product_ids(self):
+        self.assertEqual(self.rebate.get_product_ids(ELIGIBLE_ITEM), {self.product_1.id})
+        self.assertEqual(self.rebate.get_product_ids(REBATED_ITEM), {self.product_1.id, self.product_2.id})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.rebate.get_product_ids(ELIGIBLE_ITEM), {self.product_1.id})
+
+        self.rebate_item_1.delete()
+        self.assertIsNone(self.rebate.get_product_ids(ELIGIBLE_ITEM))
+
+        product_3 = ProductFactory(category=self.category)
+        self.assertEqual(self.rebate.get_product_ids(REBATED_ITEM),
+                         {self.product_1.id, self.product_2.id, product_3.id})
+
+        self.product_1.category = CategoryFactory()
+        self.product_1.save()
+        self.assertEqual(self.rebate.get_product_ids(REBATED_ITEM), {self.product_2.id, product_3.id})
 
     def test_get_device_items(self):
         self.assertCountEqual(self.rebate.get_device_items(self.rebate.rebated_items), [])
@@ -294,6 +379,66 @@ class RebateStatusTransitionTestCase(TestCase):
 
         self.assertRaises(TransitionNotAllowed, self.rebate.apply)
 
+    def test_transition_apply_logs_catalog_changes(self):
+        CatalogChange.objects.all().delete()
+        self.rebate.apply()
+
+        changes = CatalogChange.objects.filter(model='discount', action=CATALOG_CHANGE_CREATED)
+        self.assertCountEqual(changes.values_list('object_id', flat=True),
+                              self.rebate.discount_set.values_list('id', flat=True))
+        self.assertEqual(set(changes.values_list('client_id', flat=True)), {self.rebate.client_id})
+
+    def test_transition_apply_with_constant_queries(self):
+        def count_apply_queries(rebate):
+            with CaptureQueriesContext(connection) as context:
+                rebate.apply()
+            rebate.unapply()
+            return len(context.captured_queries)
+
+        self.rebate.apply()
+        self.rebate.unapply()
+        queries_count = count_apply_queries(self.rebate)
+
+        device = self.client_price.client.device_set.get(product=self.client_price.product)
+        ItemFactory.create_batch(10, device=device, cost_type=UNIT_COST, is_used=False,
+                                 purchased_date=datetime.utcnow().date())
+        self.assertEqual(count_apply_queries(self.rebate), queries_count)
+
+        self.rebate.apply()
+        self.assertEqual(Item.objects.filter(device=device, cost=31).count(), 1)
+        self.assertEqual(Item.objects.filter(device=device, cost=40).count(), 12)
+
+    def test_transition_apply_updates_purchase_prices(self):
+        purchase_price_attrs = dict(client=self.client_price.client, category=self.client_price.product.category,
+                                    year=self.item_1.rep_case.procedure_date.year, cost_type=UNIT_COST)
+        self.rebate.apply()
+        self.assertEqual(PurchasePrice.objects.get(**purchase_price_attrs).avg, 61)
+
+        self.rebate.unapply()
+        self.assertEqual(PurchasePrice.objects.get(**purchase_price_attrs).avg, 90)
+
+    def test_simulate(self):
+        with CaptureQueriesContext(connection) as context:
+            simulation = self.rebate.simulate()
+        self.assertFalse([query for query in context.captured_queries
+                          if not query['sql'].startswith('SELECT')])
+
+        self.assertEqual(Discount.objects.count(), 2)
+        self.assertEqual(simulation['items'], 3)
+        self.assertEqual(simulation['cost'], 290)
+        self.assertEqual(simulation['saving'], 10)
+        self.assertEqual(simulation['rebated_cost'], 201)
+        self.assertEqual(simulation['rebated_saving'], 10)
+        self.assertEqual(simulation['cost_delta'], -89)
+        self.assertEqual([tier_progress['is_valid'] for tier_progress in simulation['progress']['tiers']],
+                         [True, True, False])
+
+        self.rebate.apply()
+        applied_simulation = self.rebate.simulate()
+        for key in ('items', 'cost', 'saving', 'rebated_cost', 'rebated_saving'):
+            self.assertEqual(applied_simulation[key], simulation[key])
+        self.assertEqual(sum(Item.objects.values_list('cost', flat=True)), simulation['rebated_cost'])
+
     def test_transition_unapply(self):
         self.rebate.apply()
         self.rebate.unapply()
@@ -340,41 +485,66 @@ class TierTestCase(TestCase):
     def test_to_string(self):
         self.assertEqual(str(self.tier), 'Marketshare in range (0, 30)')
 
-    def test_spend(self):
-        self.assertEqual(self.tier.spend(self.eligible_purchased_items), 720)
+    def get_tiers_validity(self):
+        return dict((tier_progress['tier'].id, tier_progress['is_valid'])
+                    for tier_progress in self.rebate.progress()['tiers'])
 
-    def test_purchased_units(self):
-        self.assertEqual(self.tier.purchased_units(self.eligible_purchased_items), 3)
+    def test_progress_values(self):
+        progress = self.rebate.progress()
+        self.assertEqual(progress['spend'], 720)
+        self.assertEqual(progress['purchased_units'], 3)
+        self.assertEqual(progress['used_units'], 1)
 
-    def test_used_units(self):
-        self.assertEqual(self.tier.used_units(self.eligible_purchased_items), 1)
-
-    def test_marketshare(self):
-        self.assertEqual(self.tier.marketshare(self.eligible_purchased_items), 100)
+    def test_progress_marketshare(self):
+        self.assertEqual(self.rebate.progress()['marketshare'], 100)
         ItemFactory.create_batch(3, device=DeviceFactory(client=self.rebate.client, product=ProductFactory()),
                                  cost=160, purchased_date=date(2018, 12, 23), is_used=True)
-        self.assertEqual(self.tier.marketshare(self.eligible_purchased_items), 60)
+        self.assertEqual(self.rebate.progress()['marketshare'], 60)
 
         self.rebate.client = ClientFactory()
         self.rebate.save()
-        self.assertEqual(self.tier.marketshare(RebatableItem.objects.none()), 0)
-
-    def test_is_valid(self):
-        self.assertFalse(self.tier.is_valid(self.eligible_purchased_items))
-        tier = TierFactory(lower_bound=31, upper_bound=100, tier_type=MARKETSHARE, rebate=self.rebate)
-        self.assertTrue(tier.is_valid(self.eligible_purchased_items))
-
-        tier_1 = TierFactory(lower_bound=300, upper_bound=600, tier_type=SPEND, rebate=self.rebate)
-        tier_2 = TierFactory(lower_bound=720, upper_bound=720, tier_type=SPEND, rebate=self.rebate)
-        self.assertFalse(tier_1.is_valid(self.eligible_purchased_items))
-        self.assertTrue(tier_2.is_valid(self.eligible_purchased_items))
-
-        tier_1 = TierFactory(lower_bound=0, upper_bound=2, tier_type=PURCHASED_UNITS, rebate=self.rebate)
-        tier_2 = TierFactory(lower_bound=2, upper_bound=None, tier_type=PURCHASED_UNITS, rebate=self.rebate)
-        self.assertFalse(tier_1.is_valid(self.eligible_purchased_items))
-        self.assertTrue(tier_2.is_valid(self.eligible_purchased_items))
-
-        tier_1 = TierFactory(lower_bound=11, upper_bound=100, tier_type=USED_UNITS, rebate=self.rebate)
-        tier_2 = TierFactory(lower_bound=1, upper_bound=10, tier_type=USED_UNITS, rebate=self.rebate)
-        self.assertFalse(tier_1.is_valid(self.eligible_purchased_items))
-        self.assertTrue(tier_2.is_valid(self.eligible_purchased_items))
+        self.assertEqual(self.rebate.progress()['marketshare'], 0)
+
+    def test_progress_tiers_validity(self):
+        marketshare_tier = TierFactory(lower_bound=31, upper_bound=100, tier_type=MARKETSHARE, rebate=self.rebate)
+        spend_tiers = [TierFactory(lower_bound=300, upper_bound=600, tier_type=SPEND, rebate=self.rebate),
+                       TierFactory(lower_bound=720, upper_bound=720, tier_type=SPEND, rebate=self.rebate)]
+        purchased_units_tiers = [
+            TierFactory(lower_bound=0, upper_bound=2, tier_type=PURCHASED_UNITS, rebate=self.rebate),
+            TierFactory(lower_bound=2, upper_bound=None, tier_type=PURCHASED_UNITS, rebate=self.rebate),
+        ]
+        used_units_tiers = [TierFactory(lower_bound=11, upper_bound=100, tier_type=USED_UNITS, rebate=self.rebate),
+                            TierFactory(lower_bound=1, upper_bound=10, tier_type=USED_UNITS, rebate=self.rebate)]
+
+        tiers_validity = self.get_tiers_validity()
+        self.assertFalse(tiers_validity[self.tier.id])
+        self.assertTrue(tiers_validity[marketshare_tier.id])
+        for tier_1, tier_2 in (spend_tiers, purchased_units_tiers, used_units_tiers):
+            self.assertFalse(tiers_validity[tier_1.id])
+            self.assertTrue(tiers_validity[tier_2.id])
+
+    def test_rebate_progress(self):
+        spend_tier = TierFactory(lower_bound=700, upper_bound=None, tier_type=SPEND, rebate=self.rebate)
+        used_units_tier = TierFactory(lower_bound=2, upper_bound=10, tier_type=USED_UNITS, rebate=self.rebate)
+        ItemFactory(device=DeviceFactory(client=self.rebate.client, product=ProductFactory()),
+                    cost=280, purchased_date=date(2018, 6, 1), is_used=True)
+
+        with self.assertNumQueries(3):
+            progress = self.rebate.progress()
+
+        self.assertEqual(progress['spend'], 720)
+        self.assertEqual(progress['client_spend'], 1000)
+        self.assertEqual(progress['purchased_units'], 3)
+        self.assertEqual(progress['used_units'], 1)
+        self.assertEqual(progress['marketshare'], 72)
+        self.assertCountEqual(progress['tiers'], [
+            {'tier': self.tier, 'value': 72, 'is_valid': False},
+            {'tier': spend_tier, 'value': 720, 'is_valid': True},
+            {'tier': used_units_tier, 'value': 1, 'is_valid': False},
+        ])
+
+        RebatableItemFactory(rebate=self.rebate, item_type=ELIGIBLE_ITEM, content_object=ProductFactory())
+        progress = self.rebate.progress()
+        self.assertEqual(progress['spend'], 0)
+        self.assertEqual(progress['purchased_units'], 0)
+        self.assertEqual(progress['marketshare'], 0)
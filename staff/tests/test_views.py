@@ -1,3 +1,6 @@
+import json
+from unittest.mock import patch
+
 from django.urls import reverse
 from rest_framework import status
 
@@ -7,6 +10,7 @@ from hospital.constants import RolePriority
 from hospital.factories import ClientFactory, AccountFactory, DeviceFactory, ItemFactory
 from price.constants import UNIT_COST, SYSTEM_COST
 from price.factories import DiscountFactory, ClientPriceFactory
+from staff.views import ItemListAPIView
 
 
 class ManufacturerEntryListViewTestCase(StaffAPIViewTestCase):
@@ -209,3 +213,13 @@ class ItemListAPIViewTestCase(StaffAPIViewTestCase):
                 'cost_type': item_2.cost_type,
             },
         ])
+
+    def test_session_authorized_staff_user_streams_items(self):
+        items = ItemFactory.create_batch(3, device=self.device, is_used=False)
+        with patch.object(ItemListAPIView, 'stream_chunk_size', 2):
+            response = self.authorized_admin_client.get(self.path, {'stream': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [
+            {'id': item.id, 'identifier': item.identifier, 'cost_type': item.cost_type} for item in items
+        ])
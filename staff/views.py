@@ -4,6 +4,7 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from api.pagination import ListResponseMixin
 from device.models import Manufacturer, Product
 from hospital.models import Client, Device
 from price.constants import ON_DOCTOR_ORDER
@@ -24,7 +25,7 @@ class AccountListAPIView(APIView):
         return Response(AccountSerializer(accounts, many=True).data)
 
 
-class DiscountListAPIView(APIView):
+class DiscountListAPIView(ListResponseMixin, APIView):
     authentication_classes = (SessionAuthentication,)
     permission_classes = (IsAuthenticated, IsAdminUser,)
 
@@ -35,7 +36,7 @@ class DiscountListAPIView(APIView):
         client = get_object_or_404(Client, pk=client_id)
         products = Product.objects.filter(clientprice__client=client).distinct()\
             .prefetch_price_with_discounts(client, discount_apply_types=[ON_DOCTOR_ORDER])
-        return Response(ProductSerializer(products, many=True).data)
+        return self.list_response(products, ProductSerializer)
 
 
 class DeviceListAPIView(APIView):
@@ -54,7 +55,7 @@ class DeviceListAPIView(APIView):
         return Response(DeviceSerializer(devices, many=True).data)
 
 
-class ItemListAPIView(APIView):
+class ItemListAPIView(ListResponseMixin, APIView):
     authentication_classes = (SessionAuthentication,)
     permission_classes = (IsAuthenticated, IsAdminUser,)
 
@@ -64,7 +65,7 @@ class ItemListAPIView(APIView):
         """
         device = get_object_or_404(Device, pk=device_id)
         items = device.item_set.filter(is_used=False)
-        return Response(ItemSerializer(items, many=True).data)
+        return self.list_response(items, ItemSerializer)
 
 
 class ManufacturerEntryListView(APIView):
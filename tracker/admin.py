@@ -3,6 +3,7 @@ from django.utils.safestring import mark_safe
 from import_export.admin import ImportExportActionModelAdmin
 
 from hospital.models import Item
+from neptune.admin import StreamingExportAdminMixin
 from tracker.forms import RepCaseForm, RepCaseItemForm
 from tracker.models import RepCase, PurchasePrice
 from tracker.resources import PurchasePriceResource
@@ -47,9 +48,10 @@ class RepCaseAdmin(admin.ModelAdmin):
         js = ('js/admin/main.js', 'js/admin/tracker.js',)
 
 
-class PurchasePriceAdmin(ImportExportActionModelAdmin):
+class PurchasePriceAdmin(StreamingExportAdminMixin, ImportExportActionModelAdmin):
     resource_class = PurchasePriceResource
     list_display = ('avg', 'year', 'client', 'category', 'level', 'cost_type')
+    readonly_fields = ('sketch',)
 
 
 admin.site.register(RepCase, RepCaseAdmin)
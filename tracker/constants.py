@@ -7,3 +7,10 @@ CASE_STATUSES = (
     (NEW_CASE, _('New')),
     (COMPLETE_CASE, _('Complete')),
 )
+
+QUANTILE_SKETCH_ACCURACY = 0.01
+APP_QUANTILES = (
+    ('p25', 0.25),
+    ('median', 0.5),
+    ('p75', 0.75),
+)
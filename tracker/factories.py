@@ -21,7 +21,7 @@ class RepCaseFactory(DjangoModelFactory):
     @post_generation
     def items(self, create, extracted, **kwargs):
         if extracted:
-            self.item_set.set(extracted)
+            self.item_set.set(extracted, bulk=False)
 
 
 class PurchasePriceFactory(DjangoModelFactory):
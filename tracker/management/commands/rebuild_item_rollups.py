@@ -0,0 +1,15 @@
+from django.core.management import BaseCommand
+
+from tracker.models import ItemRollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild item rollups of all clients, or of the given clients, from their used items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--client', type=int, action='append', dest='clients',
+                            help='Rebuild rollups of this client id only, can be repeated')
+
+    def handle(self, *args, **options):
+        created = ItemRollup.rebuild(options['clients'])
+        print(f'Created {created} item rollups')
@@ -0,0 +1,166 @@
+from django.db.models import QuerySet, Sum, F, FloatField, Q, ExpressionWrapper
+from django.db.models.functions import Cast
+
+from tracker.sketch import QuantileSketch
+
+
+def period_window(year, month=None, date_field='month'):
+    """
+    Filter of rollups in a year, or in a month of the year, items are filtered on their procedure date instead.
+    """
+    window = Q(**{f'{date_field}__year': year})
+    if month:
+        window &= Q(**{f'{date_field}__month': month})
+    return window
+
+
+def physician_window(physician):
+    return Q(physician=physician)
+
+
+def average(total, count):
+    return ExpressionWrapper(Cast(total, FloatField()) / Cast(count, FloatField()), output_field=FloatField())
+
+
+def renamed(rows, **names):
+    """
+    Rows with keys renamed, totals are annotated under other names than the rollup fields they sum.
+    """
+    return [dict((names.get(key, key), value) for key, value in row.items()) for row in rows]
+
+
+class ItemRollupQuerySet(QuerySet):
+    """
+    Item analytics answered from rollups, rows are shaped like their ItemQuerySet counterparts.
+    Priced analytics only count items with a positive cost.
+    """
+    def used_by_client(self, client):
+        return self.filter(client=client)
+
+    def used_by_client_tree(self, client):
+        from hospital.models import ClientAncestor
+
+        affiliate_ids = ClientAncestor.objects.filter(ancestor=client).values('client_id')
+        return self.filter(Q(client=client) | Q(client__in=affiliate_ids))
+
+    def used_by_physician(self, physician):
+        return self.filter(client_id=physician.client_id, physician=physician)
+
+    def used_in_period(self, year, month=None):
+        return self.filter(period_window(year, month))
+
+    def _priced(self, priced):
+        """
+        Rollups with their spend and units fields, limited to items with a positive cost when priced.
+        """
+        if priced:
+            return self.filter(priced_units__gt=0), 'priced_spend', 'priced_units'
+        return self, 'spend', 'units'
+
+    def marketshare(self, priced=False):
+        rollups, spend, units = self._priced(priced)
+        return renamed(rollups.values('manufacturer').annotate(
+            total_spend=Cast(Sum(spend), FloatField()),
+            total_units=Sum(units),
+            app=average(Sum(spend), Sum(units)),
+        ).values(
+            'total_spend', 'total_units', 'app',
+            manufacturer_short_name=F('manufacturer__short_name'),
+            manufacturer_name=F('manufacturer__name'),
+            manufacturer_id=F('manufacturer__id'),
+            manufacturer_image=F('manufacturer__image'),
+        ), total_spend='spend', total_units='units')
+
+    def marketshare_windows(self, windows):
+        """
+        Marketshare of every window, given as {name: Q filter}, with a single group by manufacturer.
+        Returns marketshare rows by window name.
+        """
+        aggregates = {}
+        for name, window in windows.items():
+            aggregates[f'{name}_spend'] = Cast(Sum('spend', filter=window), FloatField())
+            aggregates[f'{name}_units'] = Sum('units', filter=window)
+            aggregates[f'{name}_app'] = average(Sum('spend', filter=window), Sum('units', filter=window))
+
+        rows = self.values('manufacturer').annotate(**aggregates).values(
+            *aggregates,
+            manufacturer_short_name=F('manufacturer__short_name'),
+            manufacturer_name=F('manufacturer__name'),
+            manufacturer_id=F('manufacturer__id'),
+            manufacturer_image=F('manufacturer__image'),
+        )
+        marketshare = dict((name, []) for name in windows)
+        for row in rows:
+            for name in windows:
+                if row[f'{name}_units']:
+                    marketshare[name].append({
+                        'spend': row[f'{name}_spend'],
+                        'units': row[f'{name}_units'],
+                        'app': row[f'{name}_app'],
+                        'manufacturer_short_name': row['manufacturer_short_name'],
+                        'manufacturer_name': row['manufacturer_name'],
+                        'manufacturer_id': row['manufacturer_id'],
+                        'manufacturer_image': row['manufacturer_image'],
+                    })
+        return marketshare
+
+    def physician_app(self, priced=False):
+        rollups, spend, units = self._priced(priced)
+        return rollups.values('physician').annotate(
+            app=average(Sum(spend), Sum(units))
+        ).values(
+            'app',
+            physician_id=F('physician__id'),
+            physician_name=F('physician__user__name'),
+        )
+
+    def saving_by_categories(self):
+        return renamed(self.values('category').annotate(
+            total_saving=Sum('saving'),
+            total_spend=Sum('spend')
+        ).values(
+            'total_saving', 'total_spend',
+            category_id=F('category__id'),
+            category_name=F('category__name'),
+        ), total_saving='saving', total_spend='spend')
+
+    def saving_by_categories_windows(self, windows):
+        """
+        Saving and spend by category of every window, given as {name: Q filter}, with a single group by category.
+        Returns saving rows by window name.
+        """
+        aggregates = {}
+        for name, window in windows.items():
+            aggregates[f'{name}_saving'] = Sum('saving', filter=window)
+            aggregates[f'{name}_spend'] = Sum('spend', filter=window)
+            aggregates[f'{name}_units'] = Sum('units', filter=window)
+
+        rows = self.values('category').annotate(**aggregates).values(
+            *aggregates,
+            category_id=F('category__id'),
+            category_name=F('category__name'),
+        )
+        savings = dict((name, []) for name in windows)
+        for row in rows:
+            for name in windows:
+                if row[f'{name}_units']:
+                    savings[name].append({
+                        'saving': row[f'{name}_saving'],
+                        'spend': row[f'{name}_spend'],
+                        'category_id': row['category_id'],
+                        'category_name': row['category_name'],
+                    })
+        return savings
+
+    def savings_by_month(self, year):
+        rows = self.used_in_period(year).values('month').annotate(savings=Sum('saving'), total_spend=Sum('spend'))
+        return renamed(rows.values('month', 'savings', 'total_spend').order_by('month'), total_spend='spend')
+
+
+class PurchasePriceQuerySet(QuerySet):
+    def merged_sketch(self):
+        """
+        Quantile sketch of all purchase prices, to benchmark across clients, years or levels.
+        """
+        sketches = self.values_list('sketch', flat=True)
+        return QuantileSketch.merged(QuantileSketch.from_dict(sketch) for sketch in sketches)
@@ -0,0 +1,28 @@
+from django.db import transaction
+
+from tracker.models import ItemRollup, PurchasePrice
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class PurchasePriceQueueMiddleware:
+    """
+    Recompute purchase prices and item rollups touched during a request once, at the end of the request.
+    Requests that may write run in a transaction the updates are applied in, rolled back along with the queued
+    updates on server errors.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in SAFE_METHODS:
+            with PurchasePrice.deferred(), ItemRollup.deferred():
+                return self.get_response(request)
+
+        with transaction.atomic(), PurchasePrice.deferred() as purchase_prices, ItemRollup.deferred() as rollups:
+            response = self.get_response(request)
+            if response.status_code >= 500:
+                transaction.set_rollback(True)
+                purchase_prices.discard()
+                rollups.discard()
+            return response
@@ -0,0 +1,43 @@
+# Generated by Django 2.0.9 on 2026-10-18 07:15
+
+from django.db import migrations, models
+from django.db.models import Sum, Count
+
+
+def fill_running_totals(apps, schema_editor):
+    PurchasePrice = apps.get_model('tracker', 'PurchasePrice')
+    Item = apps.get_model('hospital', 'Item')
+    for purchase_price in PurchasePrice.objects.all():
+        running_totals = Item.objects.filter(
+            device__client_id=purchase_price.client_id,
+            device__product__category_id=purchase_price.category_id,
+            device__product__level=purchase_price.level,
+            is_used=True, cost_type=purchase_price.cost_type,
+            cost__gt=0,
+            rep_case__procedure_date__year=purchase_price.year
+        ).aggregate(total=Sum('cost'), count=Count('id'))
+        purchase_price.total = running_totals['total'] or 0
+        purchase_price.count = running_totals['count']
+        purchase_price.save(update_fields=['total', 'count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0007_repcase_physician'),
+        ('hospital', '0039_item_saving'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseprice',
+            name='count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Purchased items'),
+        ),
+        migrations.AddField(
+            model_name='purchaseprice',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=20, verbose_name='Total purchase price'),
+        ),
+        migrations.RunPython(fill_running_totals, migrations.RunPython.noop),
+    ]
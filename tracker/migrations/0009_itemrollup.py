@@ -0,0 +1,74 @@
+# Generated by Django 2.0.9 on 2026-10-18 07:53
+
+from django.db import migrations, models
+from django.db.models import Sum, Count, Q
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def fill_item_rollups(apps, schema_editor):
+    Item = apps.get_model('hospital', 'Item')
+    ItemRollup = apps.get_model('tracker', 'ItemRollup')
+    rows = Item.objects.filter(rep_case__procedure_date__isnull=False).annotate(
+        month=TruncMonth('rep_case__procedure_date')
+    ).values(
+        'rep_case__client_id', 'rep_case__physician_id', 'device__product__category_id',
+        'device__product__manufacturer_id', 'device__product__level', 'cost_type', 'month'
+    ).order_by().annotate(
+        spend=Sum('cost'),
+        saving=Sum('saving'),
+        units=Count('id'),
+        priced_spend=Sum('cost', filter=Q(cost__gt=0)),
+        priced_units=Count('id', filter=Q(cost__gt=0)),
+    )
+    ItemRollup.objects.bulk_create(
+        ItemRollup(
+            client_id=row['rep_case__client_id'],
+            physician_id=row['rep_case__physician_id'],
+            category_id=row['device__product__category_id'],
+            manufacturer_id=row['device__product__manufacturer_id'],
+            level=row['device__product__level'],
+            cost_type=row['cost_type'],
+            month=row['month'],
+            spend=row['spend'] or 0,
+            saving=row['saving'] or 0,
+            units=row['units'],
+            priced_spend=row['priced_spend'] or 0,
+            priced_units=row['priced_units'],
+        ) for row in rows.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0026_catalogchange'),
+        ('hospital', '0041_item_expiry_idx'),
+        ('tracker', '0008_purchaseprice_running_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveSmallIntegerField(choices=[(0, 'Unassigned level'), (1, 'Entry level'), (2, 'Advanced level')], default=0, verbose_name='Device level')),
+                ('cost_type', models.PositiveSmallIntegerField(choices=[(1, 'Unit cost'), (2, 'System cost')], default=1, verbose_name='Cost type')),
+                ('month', models.DateField(verbose_name='Month of procedure')),
+                ('spend', models.DecimalField(decimal_places=2, default=0, max_digits=20, verbose_name='Total cost')),
+                ('saving', models.DecimalField(decimal_places=2, default=0, max_digits=20, verbose_name='Total saving')),
+                ('units', models.PositiveIntegerField(default=0, verbose_name='Used items')),
+                ('priced_spend', models.DecimalField(decimal_places=2, default=0, max_digits=20, verbose_name='Total positive cost')),
+                ('priced_units', models.PositiveIntegerField(default=0, verbose_name='Used items with a positive cost')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='device.Category')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hospital.Client')),
+                ('manufacturer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='device.Manufacturer')),
+                ('physician', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='hospital.Account')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='itemrollup',
+            unique_together={('client', 'physician', 'category', 'manufacturer', 'level', 'cost_type', 'month')},
+        ),
+        migrations.RunPython(fill_item_rollups, migrations.RunPython.noop),
+    ]
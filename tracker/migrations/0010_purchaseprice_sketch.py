@@ -0,0 +1,43 @@
+# Generated by Django 2.0.9 on 2026-10-18 08:01
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+from django.db.models import Count
+
+from tracker.sketch import QuantileSketch
+
+
+def build_purchase_price_sketches(apps, schema_editor):
+    Item = apps.get_model('hospital', 'Item')
+    PurchasePrice = apps.get_model('tracker', 'PurchasePrice')
+    for purchase_price in PurchasePrice.objects.filter(count__gt=0):
+        costs = Item.objects.filter(
+            device__client_id=purchase_price.client_id,
+            device__product__category_id=purchase_price.category_id,
+            device__product__level=purchase_price.level,
+            is_used=True, cost_type=purchase_price.cost_type,
+            cost__gt=0,
+            rep_case__procedure_date__year=purchase_price.year
+        ).values_list('cost').annotate(count=Count('id')).order_by()
+        sketch = QuantileSketch()
+        for cost, count in costs:
+            sketch.add(cost, count)
+        purchase_price.sketch = sketch.to_dict()
+        purchase_price.save(update_fields=['sketch'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0042_clientancestor'),
+        ('tracker', '0009_itemrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseprice',
+            name='sketch',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=dict, verbose_name='Purchase price distribution'),
+        ),
+        migrations.RunPython(build_purchase_price_sketches, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,18 @@
-from django.db import models
-from django.db.models import Min, Max, Avg
+import threading
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.contrib.postgres.fields import JSONField
+from django.db import models, transaction
+from django.db.models import Min, Max, Avg, Sum, Count, F, ExpressionWrapper, Value, Q
+from django.db.models.functions import Least, Greatest, TruncMonth
 from django.utils.translation import gettext_lazy as _
 
 from device.constants import ProductLevel
 from price.constants import COST_TYPES, UNIT_COST
 from tracker.constants import CASE_STATUSES, NEW_CASE
+from tracker.managers import ItemRollupQuerySet, PurchasePriceQuerySet
+from tracker.sketch import QuantileSketch
 
 
 class RepCase(models.Model):
@@ -19,6 +27,150 @@ class RepCase(models.Model):
         return f'{self.get_status_display()} case at {self.client} on {self.procedure_date}'
 
 
+class PurchasePriceDelta(object):
+    """
+    Costs added to and removed from a purchase price since its last flush.
+    """
+    def __init__(self):
+        self.total = 0
+        self.count = 0
+        self.added_min = self.added_max = None
+        self.removed_min = self.removed_max = None
+        self.sketch = QuantileSketch()
+
+    def add(self, cost):
+        self.total += cost
+        self.count += 1
+        self.sketch.add(cost)
+        self.added_min = cost if self.added_min is None else min(self.added_min, cost)
+        self.added_max = cost if self.added_max is None else max(self.added_max, cost)
+
+    def remove(self, cost):
+        self.total -= cost
+        self.count -= 1
+        self.sketch.remove(cost)
+        self.removed_min = cost if self.removed_min is None else min(self.removed_min, cost)
+        self.removed_max = cost if self.removed_max is None else max(self.removed_max, cost)
+
+    def merge(self, other):
+        self.total += other.total
+        self.count += other.count
+        self.sketch.merge(other.sketch)
+        for bound, pick in (('added_min', min), ('added_max', max), ('removed_min', min), ('removed_max', max)):
+            values = [value for value in (getattr(self, bound), getattr(other, bound)) if value is not None]
+            setattr(self, bound, pick(values) if values else None)
+        return self
+
+
+class DeferredScope(object):
+    def __init__(self):
+        self.discarded = False
+
+    def discard(self):
+        """
+        Drop the updates queued in the scope, when the work they come from is rolled back.
+        """
+        self.discarded = True
+
+
+class DeferredQueue(threading.local):
+    """
+    Updates queued inside a deferred scope are kept apart until the scope ends. They are handed to the enclosing
+    scope, or applied when the outermost scope ends, in the transaction still open at that point.
+    A scope left with an exception, or discarded, drops them.
+    """
+    def __init__(self):
+        self.depth = 0
+        self.clear()
+
+    def clear(self):
+        raise NotImplementedError
+
+    def take(self):
+        raise NotImplementedError
+
+    def merge(self, state):
+        raise NotImplementedError
+
+    def flush(self):
+        raise NotImplementedError
+
+    @contextmanager
+    def deferred(self):
+        outer_state = self.take()
+        self.depth += 1
+        scope = DeferredScope()
+        try:
+            yield scope
+        except BaseException:
+            scope.discard()
+            raise
+        finally:
+            self.depth -= 1
+            scope_state = self.take()
+            self.merge(outer_state)
+            if not scope.discarded:
+                self.merge(scope_state)
+                if not self.depth:
+                    self.flush()
+
+
+class PurchasePriceQueue(DeferredQueue):
+    """
+    Purchase prices waiting for an update, by (category_id, client_id, year, level, cost_type) key.
+    Dirty keys are fully re-aggregated, cost deltas are applied incrementally.
+    The queue is flushed right away unless it is changed inside a deferred scope.
+    """
+    def clear(self):
+        self.keys = set()
+        self.deltas = {}
+
+    def take(self):
+        state = self.keys, self.deltas
+        self.clear()
+        return state
+
+    def merge(self, state):
+        keys, deltas = state
+        self.keys.update(keys)
+        for key, delta in deltas.items():
+            if key in self.deltas:
+                self.deltas[key].merge(delta)
+            else:
+                self.deltas[key] = delta
+
+    def add(self, *keys):
+        self.keys.update(keys)
+        if not self.depth:
+            self.flush()
+
+    def update_cost(self, removed=None, added=None):
+        if removed:
+            key, cost = removed
+            self.deltas.setdefault(key, PurchasePriceDelta()).remove(cost)
+        if added:
+            key, cost = added
+            self.deltas.setdefault(key, PurchasePriceDelta()).add(cost)
+        if not self.depth:
+            self.flush()
+
+    def flush(self):
+        keys, deltas = self.take()
+        updated_keys = keys.union(deltas)
+        for key in sorted(updated_keys):
+            category_id, client_id, year, level, cost_type = key
+            purchase_price, created = PurchasePrice.objects.get_or_create(
+                category_id=category_id,
+                client_id=client_id,
+                year=year,
+                level=level,
+                cost_type=cost_type,
+            )
+            if created or key in keys or not purchase_price.apply_delta(deltas[key]):
+                purchase_price.update_prices()
+        return len(updated_keys)
+
+
 class PurchasePrice(models.Model):
     category = models.ForeignKey('device.Category', on_delete=models.CASCADE)
     client = models.ForeignKey('hospital.Client', on_delete=models.CASCADE)
@@ -30,6 +182,11 @@ class PurchasePrice(models.Model):
     avg = models.DecimalField(_('Average purchase price'), max_digits=20, decimal_places=2, default=0)
     min = models.DecimalField(_('Lowest purchase price'), max_digits=20, decimal_places=2, null=True, blank=True)
     max = models.DecimalField(_('Highest purchase price'), max_digits=20, decimal_places=2, default=0)
+    total = models.DecimalField(_('Total purchase price'), max_digits=20, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(_('Purchased items'), default=0)
+    sketch = JSONField(_('Purchase price distribution'), default=dict, blank=True)
+
+    objects = PurchasePriceQuerySet.as_manager()
 
     class Meta:
         unique_together = ('category', 'client', 'year', 'level', 'cost_type')
@@ -38,27 +195,221 @@ class PurchasePrice(models.Model):
         return (f'{self.category} - {self.client} - {self.get_level_display()} '
                 f'- {self.get_cost_type_display()}: ${self.avg}')
 
+    queue = PurchasePriceQueue()
+
     @classmethod
     def update(cls, category, client, year, level, cost_type):
-        purchase_price = PurchasePrice.objects.get_or_create(
-            category=category,
-            client=client,
-            year=year,
-            level=level,
-            cost_type=cost_type,
-        )[0]
-        purchase_price.update_prices()
+        cls.mark_dirty((category.id, client.id, year, level, cost_type))
+
+    @classmethod
+    def mark_dirty(cls, *keys):
+        cls.queue.add(*keys)
+
+    @classmethod
+    def update_cost(cls, removed=None, added=None):
+        """
+        Move an item cost between purchase prices, removed and added are (key, cost) pairs or None.
+        """
+        if removed != added:
+            cls.queue.update_cost(removed, added)
+
+    @classmethod
+    def deferred(cls):
+        """
+        Coalesce purchase price updates until the end of the scope, dropped if the scope fails or is discarded.
+        """
+        return cls.queue.deferred()
+
+    @classmethod
+    def flush(cls):
+        return cls.queue.flush()
 
     def update_prices(self):
-        aggregated_price = self.client.items.filter(
+        purchased_items = self.client.items.filter(
             device__product__category=self.category,
             device__product__level=self.level,
             is_used=True, cost_type=self.cost_type,
             cost__gt=0,
             rep_case__procedure_date__year=self.year
-        ).aggregate(min=Min('cost'), max=Max('cost'), avg=Avg('cost'))
+        )
+        aggregated_price = purchased_items.aggregate(min=Min('cost'), max=Max('cost'), avg=Avg('cost'),
+                                                     total=Sum('cost'), count=Count('id'))
+        sketch = QuantileSketch()
+        for cost, count in purchased_items.values_list('cost').annotate(count=Count('id', distinct=True)).order_by():
+            sketch.add(cost, count)
 
         self.avg = aggregated_price.get('avg') or 0
         self.min = aggregated_price.get('min')
         self.max = aggregated_price.get('max') or 0
+        self.total = aggregated_price.get('total') or 0
+        self.count = aggregated_price.get('count') or 0
+        self.sketch = sketch.to_dict()
         self.save()
+
+    @property
+    def quantiles(self):
+        """
+        Purchase prices at APP quantiles, estimated from the sketch and bounded by the exact min and max.
+        """
+        quantiles = QuantileSketch.from_dict(self.sketch).quantiles()
+        return dict((name, cost if cost is None else min(max(cost, self.min), self.max))
+                    for name, cost in quantiles.items())
+
+    def apply_delta(self, delta):
+        """
+        Update running prices in place, returns False when a removed cost invalidates min or max, or when the
+        sketch no longer matches the purchased items.
+        """
+        if delta.removed_min is not None and (self.min is None or self.count + delta.count <= 0 or
+                                              delta.removed_min <= self.min or delta.removed_max >= self.max):
+            return False
+
+        with transaction.atomic():
+            locked_price = PurchasePrice.objects.select_for_update().only('count', 'sketch').get(pk=self.pk)
+            sketch = QuantileSketch.from_dict(locked_price.sketch)
+            if sketch.count != locked_price.count or not sketch.merge(delta.sketch).is_valid:
+                return False
+
+            price_field = models.DecimalField(max_digits=20, decimal_places=2)
+            total = F('total') + Value(delta.total, output_field=price_field)
+            count = F('count') + delta.count
+            prices = dict(total=total, count=count, avg=ExpressionWrapper(total / count, output_field=price_field),
+                          sketch=sketch.to_dict())
+            if delta.added_min is not None:
+                prices['min'] = Least('min', Value(delta.added_min, output_field=price_field))
+                prices['max'] = Greatest('max', Value(delta.added_max, output_field=price_field))
+            PurchasePrice.objects.filter(pk=self.pk).update(**prices)
+        return True
+
+
+class ItemRollupQueue(DeferredQueue):
+    """
+    Item rollups waiting for a recount, by (client_id, physician_id, category_id, manufacturer_id, level,
+    cost_type, month) key. The queue is flushed right away unless it is changed inside a deferred scope.
+    """
+    def clear(self):
+        self.keys = set()
+
+    def take(self):
+        keys = self.keys
+        self.clear()
+        return keys
+
+    def merge(self, keys):
+        self.keys.update(keys)
+
+    def add(self, *keys):
+        self.keys.update(keys)
+        if not self.depth:
+            self.flush()
+
+    def flush(self):
+        keys = self.take()
+        for key in sorted(keys, key=repr):
+            ItemRollup.recount(key)
+        return len(keys)
+
+
+class ItemRollup(models.Model):
+    """
+    Spend, saving and units of the items used at a client, by physician, category, manufacturer, product level,
+    cost type and month of the procedure.
+    """
+    client = models.ForeignKey('hospital.Client', on_delete=models.CASCADE)
+    physician = models.ForeignKey('hospital.Account', on_delete=models.CASCADE, null=True, blank=True)
+    category = models.ForeignKey('device.Category', on_delete=models.CASCADE)
+    manufacturer = models.ForeignKey('device.Manufacturer', on_delete=models.CASCADE, null=True, blank=True)
+    level = models.PositiveSmallIntegerField(_('Device level'), choices=ProductLevel.to_field_choices(),
+                                             default=ProductLevel.default().value)
+    cost_type = models.PositiveSmallIntegerField(_('Cost type'), choices=COST_TYPES, default=UNIT_COST)
+    month = models.DateField(_('Month of procedure'))
+    spend = models.DecimalField(_('Total cost'), max_digits=20, decimal_places=2, default=0)
+    saving = models.DecimalField(_('Total saving'), max_digits=20, decimal_places=2, default=0)
+    units = models.PositiveIntegerField(_('Used items'), default=0)
+    priced_spend = models.DecimalField(_('Total positive cost'), max_digits=20, decimal_places=2, default=0)
+    priced_units = models.PositiveIntegerField(_('Used items with a positive cost'), default=0)
+
+    objects = ItemRollupQuerySet.as_manager()
+    queue = ItemRollupQueue()
+
+    key_fields = ('client_id', 'physician_id', 'category_id', 'manufacturer_id', 'level', 'cost_type', 'month')
+    item_key_fields = ('rep_case__client_id', 'rep_case__physician_id', 'device__product__category_id',
+                       'device__product__manufacturer_id', 'device__product__level', 'cost_type', 'month')
+
+    class Meta:
+        unique_together = ('client', 'physician', 'category', 'manufacturer', 'level', 'cost_type', 'month')
+
+    def __str__(self):
+        return f'{self.category} - {self.client} - {self.month:%B %Y}: ${self.spend}'
+
+    @classmethod
+    def mark_dirty(cls, *keys):
+        cls.queue.add(*keys)
+
+    @classmethod
+    def deferred(cls):
+        """
+        Coalesce rollup recounts until the end of the scope, dropped if the scope fails or is discarded.
+        """
+        return cls.queue.deferred()
+
+    @classmethod
+    def flush(cls):
+        return cls.queue.flush()
+
+    @classmethod
+    def rolled_up_items(cls, items):
+        """
+        Used items annotated with the month of their procedure, grouped by rollup key.
+        """
+        return items.filter(rep_case__procedure_date__isnull=False).annotate(
+            month=TruncMonth('rep_case__procedure_date')
+        ).values(*cls.item_key_fields).order_by()
+
+    @classmethod
+    def totals(cls, items):
+        return items.annotate(
+            spend=Sum('cost'),
+            saving=Sum('saving'),
+            units=Count('id'),
+            priced_spend=Sum('cost', filter=Q(cost__gt=0)),
+            priced_units=Count('id', filter=Q(cost__gt=0)),
+        )
+
+    @classmethod
+    def recount(cls, key):
+        """
+        Recount the rollup of a key from its items, the rollup is removed once no item is left.
+        """
+        Item = apps.get_model('hospital', 'Item')
+        key_filter = dict(zip(cls.item_key_fields, key))
+        month = key_filter.pop('month')
+        items = Item.objects.filter(rep_case__procedure_date__year=month.year,
+                                    rep_case__procedure_date__month=month.month, **key_filter)
+        rows = list(cls.totals(cls.rolled_up_items(items)))
+        rollups = cls.objects.filter(**dict(zip(cls.key_fields, key)))
+        if not rows:
+            rollups.delete()
+        elif not rollups.update(**cls.get_totals(rows[0])):
+            cls.objects.create(**dict(zip(cls.key_fields, key)), **cls.get_totals(rows[0]))
+
+    @classmethod
+    def rebuild(cls, clients=None):
+        """
+        Replace rollups of the given clients, or of all clients, with one aggregate query over their items.
+        Returns the number of rollups created.
+        """
+        Item = apps.get_model('hospital', 'Item')
+        items = Item.objects.all() if clients is None else Item.objects.filter(rep_case__client__in=clients)
+        rollups = cls.objects.all() if clients is None else cls.objects.filter(client__in=clients)
+        with transaction.atomic():
+            rollups.delete()
+            created = cls.objects.bulk_create(
+                cls(**dict(zip(cls.key_fields, (row[field] for field in cls.item_key_fields))), **cls.get_totals(row))
+                for row in cls.totals(cls.rolled_up_items(items)).iterator()
+            )
+        return len(created)
+
+    @staticmethod
+    def get_totals(row):
+        return dict((field, row[field] or 0) for field in ('spend', 'saving', 'units', 'priced_spend', 'priced_units'))
@@ -2,17 +2,20 @@ from import_export import resources, fields
 
 from device.models import Category, ProductLevel
 from hospital.models import Client
+from neptune.resources import StreamingExportResourceMixin
 from price.models import COST_TYPES
 from tracker.models import PurchasePrice
 
 
-class PurchasePriceResource(resources.ModelResource):
+class PurchasePriceResource(StreamingExportResourceMixin, resources.ModelResource):
     specialty = fields.Field(attribute='category__specialty__name')
     category = fields.Field(attribute='category__name')
     client = fields.Field(attribute='client__name')
     level = fields.Field()
     cost_type = fields.Field()
 
+    export_select_related = ('category__specialty', 'client')
+
     class Meta:
         model = PurchasePrice
         fields = ('id', 'category', 'specialty', 'client', 'level', 'year', 'cost_type', 'avg', 'min', 'max')
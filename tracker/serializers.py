@@ -2,23 +2,41 @@ from django.db.models.fields.files import ImageFieldFile, ImageField
 from rest_framework import serializers
 
 from hospital.models import Item
+from neptune.serializers import FastSerializer, attribute, key, decimal_string
 from tracker.models import PurchasePrice
 
 
-class PurchasePriceSerializer(serializers.ModelSerializer):
+def format_percent(part, total):
+    percent = 0
+    if total:
+        percent = part * 100 / total
+    return f'{percent:.2f}'
+
+
+class QuantilesSerializer(serializers.Serializer):
+    p25 = serializers.DecimalField(source='quantiles.p25', decimal_places=2, max_digits=20)
+    median = serializers.DecimalField(source='quantiles.median', decimal_places=2, max_digits=20)
+    p75 = serializers.DecimalField(source='quantiles.p75', decimal_places=2, max_digits=20)
+
+
+class PurchasePriceSerializer(QuantilesSerializer, serializers.ModelSerializer):
     class Meta:
         model = PurchasePrice
-        fields = ('avg', 'min', 'max')
+        fields = ('avg', 'min', 'max', 'p25', 'median', 'p75')
 
 
-class ClientAPPSerializer(serializers.ModelSerializer):
+class ClientAPPSerializer(QuantilesSerializer, serializers.ModelSerializer):
     app = serializers.DecimalField(source='avg', decimal_places=2, max_digits=20)
     id = serializers.IntegerField(source='client.id')
     name = serializers.CharField(source='client.name')
 
     class Meta:
         model = PurchasePrice
-        fields = ('id', 'name', 'min', 'max', 'app')
+        fields = ('id', 'name', 'min', 'max', 'app', 'p25', 'median', 'p75')
+
+
+class BenchmarkSerializer(QuantilesSerializer):
+    count = serializers.IntegerField()
 
 
 class PhysicianAPPSerializer(serializers.Serializer):
@@ -69,6 +87,19 @@ class RepcaseItemSerializer(serializers.ModelSerializer):
                   'physician', 'manufacturer', 'category', 'product', 'model_number')
 
 
+class FastRepcaseItemSerializer(FastSerializer):
+    fields = (
+        ('id', attribute('id'), int),
+        ('identifier', attribute('identifier'), str),
+        ('purchase_type', lambda item: item.get_purchase_type_display(), str),
+        ('physician', attribute('rep_case.physician.user.name'), str),
+        ('manufacturer', attribute('device.product.manufacturer.display_name'), str),
+        ('category', attribute('device.product.category.name'), str),
+        ('product', attribute('device.product.name'), str),
+        ('model_number', attribute('device.product.model_number'), str),
+    )
+
+
 class SavingsSerializer(serializers.Serializer):
     month = serializers.IntegerField(source='month.month')
     savings = serializers.DecimalField(max_digits=20, decimal_places=2)
@@ -76,7 +107,13 @@ class SavingsSerializer(serializers.Serializer):
     percent = serializers.SerializerMethodField()
 
     def get_percent(self, obj):
-        percent = 0
-        if obj.get('spend'):
-            percent = obj.get('savings') * 100 / obj.get('spend')
-        return f'{percent:.2f}'
+        return format_percent(obj.get('savings'), obj.get('spend'))
+
+
+class FastSavingsSerializer(FastSerializer):
+    fields = (
+        ('month', lambda savings: savings['month'].month, int),
+        ('savings', key('savings'), decimal_string(20, 2)),
+        ('spend', key('spend'), decimal_string(20, 2)),
+        ('percent', lambda savings: format_percent(savings.get('savings'), savings.get('spend')), None),
+    )
@@ -0,0 +1,50 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from device.models import Product
+from hospital.models import Item
+from tracker.models import ItemRollup, PurchasePrice, RepCase
+
+
+def get_items(instance):
+    if isinstance(instance, RepCase):
+        return Item.objects.filter(rep_case=instance)
+    return Item.objects.filter(device__product=instance)
+
+
+def get_rollup_keys(instance):
+    return set(get_items(instance).rollup_keys())
+
+
+def get_app_keys(instance):
+    return set(get_items(instance).app_keys())
+
+
+@receiver(pre_save, sender=RepCase)
+@receiver(pre_save, sender=Product)
+@receiver(pre_delete, sender=RepCase)
+@receiver(pre_delete, sender=Product)
+def collect_item_keys(sender, instance, **kwargs):
+    instance.rollup_keys = get_rollup_keys(instance) if instance.pk else set()
+    instance.app_keys = get_app_keys(instance) if instance.pk else set()
+
+
+@receiver(post_save, sender=RepCase)
+@receiver(post_save, sender=Product)
+def update_item_keys(sender, instance, **kwargs):
+    original_rollup_keys = getattr(instance, 'rollup_keys', set())
+    rollup_keys = get_rollup_keys(instance)
+    if rollup_keys != original_rollup_keys:
+        ItemRollup.mark_dirty(*(rollup_keys | original_rollup_keys))
+
+    original_app_keys = getattr(instance, 'app_keys', set())
+    app_keys = get_app_keys(instance)
+    if app_keys != original_app_keys:
+        PurchasePrice.mark_dirty(*(app_keys | original_app_keys))
+
+
+@receiver(post_delete, sender=RepCase)
+@receiver(post_delete, sender=Product)
+def remove_item_keys(sender, instance, **kwargs):
+    ItemRollup.mark_dirty(*getattr(instance, 'rollup_keys', set()))
+    PurchasePrice.mark_dirty(*getattr(instance, 'app_keys', set()))
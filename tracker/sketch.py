@@ -0,0 +1,74 @@
+import math
+from collections import Counter
+from decimal import Decimal
+
+from tracker.constants import APP_QUANTILES, QUANTILE_SKETCH_ACCURACY
+
+
+class QuantileSketch(object):
+    """
+    Mergeable quantile sketch of positive costs, counted in logarithmic buckets.
+    Quantiles are within the relative accuracy of the exact ones, and costs can be removed as well as added.
+    """
+    def __init__(self, counts=None, accuracy=QUANTILE_SKETCH_ACCURACY):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.counts = Counter(counts or {})
+
+    @classmethod
+    def from_dict(cls, sketch):
+        if not sketch:
+            return cls()
+        return cls(dict((int(index), count) for index, count in sketch['counts'].items()), sketch['accuracy'])
+
+    def to_dict(self):
+        return {
+            'accuracy': self.accuracy,
+            'counts': dict((str(index), count) for index, count in sorted(self.counts.items()) if count),
+        }
+
+    @classmethod
+    def merged(cls, sketches):
+        merged_sketch = cls()
+        for sketch in sketches:
+            merged_sketch.merge(sketch)
+        return merged_sketch
+
+    @property
+    def count(self):
+        return sum(self.counts.values())
+
+    @property
+    def is_valid(self):
+        return all(count >= 0 for count in self.counts.values())
+
+    def bucket(self, cost):
+        return math.ceil(math.log(float(cost), self.gamma))
+
+    def add(self, cost, count=1):
+        if cost > 0:
+            self.counts[self.bucket(cost)] += count
+
+    def remove(self, cost):
+        self.add(cost, -1)
+
+    def merge(self, other):
+        if other.accuracy != self.accuracy:
+            raise ValueError(f'Cannot merge sketches of accuracy {other.accuracy} into {self.accuracy}')
+        self.counts.update(other.counts)
+        return self
+
+    def quantile(self, q):
+        """
+        Cost at the given quantile, between 0 and 1, None for an empty sketch.
+        """
+        rank = q * (self.count - 1)
+        seen = 0
+        for index, count in sorted(self.counts.items()):
+            seen += count
+            if count and seen > rank:
+                return round(Decimal(2 * self.gamma ** index / (self.gamma + 1)), 2)
+        return None
+
+    def quantiles(self, quantiles=APP_QUANTILES):
+        return dict((name, self.quantile(q)) for name, q in quantiles)
@@ -0,0 +1,22 @@
+from datetime import date
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from hospital.factories import ItemFactory
+from tracker.factories import RepCaseFactory
+from tracker.models import ItemRollup
+
+
+class RebuildItemRollupsCommandTestCase(TestCase):
+    def test_rebuild_item_rollups(self):
+        rep_case = RepCaseFactory(procedure_date=date(2018, 3, 4))
+        item = ItemFactory(rep_case=rep_case, cost=100)
+        ItemFactory(rep_case=RepCaseFactory(procedure_date=date(2018, 3, 5)), cost=200)
+        ItemRollup.objects.all().delete()
+
+        call_command('rebuild_item_rollups', '--client', str(rep_case.client_id))
+        self.assertEqual(list(ItemRollup.objects.values_list('client', 'spend')), [(rep_case.client_id, item.cost)])
+
+        call_command('rebuild_item_rollups')
+        self.assertEqual(ItemRollup.objects.count(), 2)
@@ -0,0 +1,72 @@
+from datetime import date
+from shutil import rmtree
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from factory.django import ImageField
+
+from device.factories import ManufacturerFactory, ProductFactory
+from hospital.constants import RolePriority
+from hospital.factories import AccountFactory, ClientFactory, DeviceFactory, ItemFactory, RoleFactory
+from hospital.models import Item
+from tracker.factories import RepCaseFactory
+from tracker.managers import period_window, physician_window
+from tracker.models import ItemRollup
+
+
+@override_settings(DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage')
+class ItemRollupQuerySetTestCase(TestCase):
+    def tearDown(self):
+        super().tearDown()
+        rmtree(settings.MEDIA_ROOT)
+
+    def setUp(self):
+        self.client_1 = ClientFactory()
+        physician_role = RoleFactory(priority=RolePriority.PHYSICIAN.value)
+        self.physician_1, self.physician_2 = AccountFactory.create_batch(2, client=self.client_1, role=physician_role)
+        manufacturer = ManufacturerFactory(image=ImageField(filename='biotronik.jpg'))
+        device_1 = DeviceFactory(client=self.client_1, product=ProductFactory(manufacturer=manufacturer))
+        device_2 = DeviceFactory(client=self.client_1)
+        RepCaseFactory(client=self.client_1, physician=self.physician_1, procedure_date=date(2018, 9, 10), items=[
+            ItemFactory(device=device_1, cost=120, saving=10),
+            ItemFactory(device=device_2, cost=0, saving=5),
+        ])
+        RepCaseFactory(client=self.client_1, physician=self.physician_2, procedure_date=date(2018, 10, 9), items=[
+            ItemFactory(device=device_1, cost=300, saving=25),
+            ItemFactory(device=device_2, cost=250),
+        ])
+        RepCaseFactory(client=self.client_1, physician=self.physician_1, procedure_date=date(2017, 5, 1),
+                       items=[ItemFactory(device=device_2, cost=90, saving=9)])
+        self.items = Item.objects.used_by_client(self.client_1)
+        self.rollups = ItemRollup.objects.used_by_client(self.client_1)
+
+    def test_answers_like_items(self):
+        self.assertCountEqual(self.rollups.used_in_period(2018).marketshare(),
+                              self.items.used_in_period(2018).marketshare())
+        self.assertCountEqual(self.rollups.physician_app(), self.items.physician_app())
+        self.assertCountEqual(self.rollups.used_in_period(2018, 9).saving_by_categories(),
+                              self.items.used_in_period(2018, 9).saving_by_categories())
+        self.assertCountEqual(self.rollups.savings_by_month(2018), self.items.savings_by_month(2018))
+
+    def test_priced_answers_like_items_with_positive_cost(self):
+        priced_items = self.items.filter(cost__gt=0)
+        self.assertCountEqual(self.rollups.marketshare(priced=True), priced_items.marketshare())
+        self.assertCountEqual(self.rollups.physician_app(priced=True), priced_items.physician_app())
+
+    def test_windows_answer_like_items(self):
+        with self.assertNumQueries(1):
+            marketshare = self.rollups.marketshare_windows({
+                'monthly': period_window(2018, 9),
+                'annual': period_window(2018),
+            })
+        self.assertCountEqual(marketshare['monthly'], self.items.used_in_period(2018, 9).marketshare())
+        self.assertCountEqual(marketshare['annual'], self.items.used_in_period(2018).marketshare())
+
+        with self.assertNumQueries(1):
+            savings = self.rollups.saving_by_categories_windows({
+                'client': period_window(2018),
+                'physician': physician_window(self.physician_1),
+            })
+        self.assertCountEqual(savings['client'], self.items.used_in_period(2018).saving_by_categories())
+        self.assertCountEqual(savings['physician'],
+                              self.items.used_by_physician(self.physician_1).saving_by_categories())
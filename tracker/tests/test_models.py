@@ -1,14 +1,18 @@
 from datetime import date
 
 from decimal import Decimal
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 
 from device.constants import ProductLevel
 from device.factories import CategoryFactory, ProductFactory
-from hospital.factories import ClientFactory, ItemFactory, DeviceFactory
-from price.constants import UNIT_COST
+from hospital.constants import RolePriority
+from hospital.factories import AccountFactory, ClientFactory, ItemFactory, DeviceFactory, RoleFactory
+from hospital.models import Item
+from price.constants import SYSTEM_COST, UNIT_COST
 from tracker.factories import RepCaseFactory, PurchasePriceFactory
-from tracker.models import PurchasePrice
+from tracker.models import ItemRollup, PurchasePrice
+from tracker.sketch import QuantileSketch
 
 
 class RepCaseTestCase(TestCase):
@@ -79,3 +83,226 @@ class PurchasePriceTestCase(TestCase):
         self.assertEqual(self.purchase_price.avg, item.cost)
         self.assertEqual(self.purchase_price.min, item.cost)
         self.assertEqual(self.purchase_price.max, item.cost)
+
+    def test_deferred_purchase_price_updates(self):
+        device = DeviceFactory(client=self.purchase_price.client,
+                               product=ProductFactory(category=self.purchase_price.category,
+                                                      level=self.purchase_price.level))
+        rep_case = RepCaseFactory(procedure_date=date(2018, 6, 1))
+        items = [ItemFactory(device=device, rep_case=rep_case, cost_type=self.purchase_price.cost_type, cost=cost)
+                 for cost in (100, 200, 300)]
+
+        with PurchasePrice.deferred():
+            for item in items:
+                item.is_used = True
+                item.save()
+            self.purchase_price.refresh_from_db()
+            self.assertEqual(self.purchase_price.avg, Decimal(1000))
+
+        self.assertEqual(PurchasePrice.flush(), 0)
+        self.purchase_price.refresh_from_db()
+        self.assertEqual(self.purchase_price.avg, Decimal(200))
+        self.assertEqual(self.purchase_price.min, Decimal(100))
+        self.assertEqual(self.purchase_price.max, Decimal(300))
+
+    def test_failed_or_discarded_scopes_drop_purchase_price_updates(self):
+        device = DeviceFactory(client=self.purchase_price.client,
+                               product=ProductFactory(category=self.purchase_price.category,
+                                                      level=self.purchase_price.level))
+        rep_case = RepCaseFactory(procedure_date=date(2018, 6, 1))
+        item = ItemFactory(device=device, rep_case=rep_case, cost_type=self.purchase_price.cost_type, cost=100)
+
+        with PurchasePrice.deferred():
+            with self.assertRaises(IntegrityError), transaction.atomic(), PurchasePrice.deferred():
+                item.is_used = True
+                item.save()
+                Item.objects.create(device=device, serial_number=item.serial_number)
+            with PurchasePrice.deferred() as purchase_prices:
+                sid = transaction.savepoint()
+                item = Item.objects.get(pk=item.pk)
+                item.is_used = True
+                item.save()
+                transaction.savepoint_rollback(sid)
+                purchase_prices.discard()
+
+        self.assertEqual(PurchasePrice.flush(), 0)
+        self.purchase_price.refresh_from_db()
+        self.assertEqual((self.purchase_price.count, self.purchase_price.avg), (0, Decimal(1000)))
+
+    def test_incremental_purchase_price_updates(self):
+        device = DeviceFactory(client=self.purchase_price.client,
+                               product=ProductFactory(category=self.purchase_price.category,
+                                                      level=self.purchase_price.level))
+        rep_case = RepCaseFactory(procedure_date=date(2018, 6, 1))
+        item_1, item_2, item_3 = [
+            ItemFactory(device=device, rep_case=rep_case, cost_type=self.purchase_price.cost_type, cost=cost)
+            for cost in (100, 300, 200)
+        ]
+
+        def assert_purchase_price(count, total, min_cost, max_cost):
+            self.purchase_price.refresh_from_db()
+            self.assertEqual(self.purchase_price.count, count)
+            self.assertEqual(self.purchase_price.total, total)
+            self.assertEqual(self.purchase_price.avg, round(Decimal(total) / count, 2))
+            self.assertEqual(self.purchase_price.min, min_cost)
+            self.assertEqual(self.purchase_price.max, max_cost)
+
+        for item in (item_1, item_2, item_3):
+            item.is_used = True
+            item.save()
+        assert_purchase_price(3, 600, 100, 300)
+
+        item_3.cost = Decimal(250)
+        item_3.save()
+        assert_purchase_price(3, 650, 100, 300)
+
+        item_2.delete()
+        assert_purchase_price(2, 350, 100, 250)
+
+        item_1.is_used = False
+        item_1.save()
+        assert_purchase_price(1, 250, 250, 250)
+
+    def test_product_changes_move_purchase_prices(self):
+        product = ProductFactory(category=self.purchase_price.category, level=self.purchase_price.level)
+        ItemFactory(device=DeviceFactory(client=self.purchase_price.client, product=product),
+                    rep_case=RepCaseFactory(procedure_date=date(2018, 6, 1)),
+                    cost_type=self.purchase_price.cost_type, cost=100, is_used=True)
+        product.level = ProductLevel.ADVANCED.value
+        product.save()
+        self.assertCountEqual(PurchasePrice.objects.values_list('level', 'count'),
+                              [(ProductLevel.ENTRY.value, 0), (ProductLevel.ADVANCED.value, 1)])
+
+    def test_incremental_purchase_price_sketch_updates(self):
+        device = DeviceFactory(client=self.purchase_price.client,
+                               product=ProductFactory(category=self.purchase_price.category,
+                                                      level=self.purchase_price.level))
+        rep_case = RepCaseFactory(procedure_date=date(2018, 6, 1))
+        items = [ItemFactory(device=device, rep_case=rep_case, cost_type=self.purchase_price.cost_type, cost=cost,
+                             is_used=True) for cost in (100, 300, 200, 400)]
+        items[1].cost = Decimal(250)
+        items[1].save()
+        items[2].delete()
+
+        self.purchase_price.refresh_from_db()
+        sketch = self.purchase_price.sketch
+        self.assertEqual(QuantileSketch.from_dict(sketch).count, 3)
+        self.assertDictEqual(self.purchase_price.quantiles,
+                             {'p25': Decimal('100.49'), 'median': Decimal('252.18'), 'p75': Decimal('252.18')})
+
+        self.purchase_price.update_prices()
+        self.assertDictEqual(self.purchase_price.sketch, sketch)
+
+    def test_sketch_mismatch_falls_back_to_update_prices(self):
+        device = DeviceFactory(client=self.purchase_price.client,
+                               product=ProductFactory(category=self.purchase_price.category,
+                                                      level=self.purchase_price.level))
+        rep_case = RepCaseFactory(procedure_date=date(2018, 6, 1))
+        ItemFactory(device=device, rep_case=rep_case, cost_type=self.purchase_price.cost_type, cost=100, is_used=True)
+        PurchasePrice.objects.filter(pk=self.purchase_price.pk).update(sketch={})
+
+        ItemFactory(device=device, rep_case=rep_case, cost_type=self.purchase_price.cost_type, cost=300, is_used=True)
+        self.purchase_price.refresh_from_db()
+        self.assertEqual(QuantileSketch.from_dict(self.purchase_price.sketch).count, 2)
+
+    def test_merged_sketch(self):
+        for client, costs in ((self.purchase_price.client, (100, 200)), (ClientFactory(), (300, 400, 500))):
+            device = DeviceFactory(client=client, product=ProductFactory(category=self.purchase_price.category,
+                                                                         level=self.purchase_price.level))
+            RepCaseFactory(procedure_date=date(2018, 6, 1), items=[
+                ItemFactory(device=device, cost_type=self.purchase_price.cost_type, cost=cost, is_used=True)
+                for cost in costs
+            ])
+
+        sketch = PurchasePrice.objects.filter(category=self.purchase_price.category, year=2018).merged_sketch()
+        self.assertEqual(sketch.count, 5)
+        self.assertAlmostEqual(sketch.quantile(0.5), Decimal(300), delta=3)
+
+
+class ItemRollupTestCase(TestCase):
+    def setUp(self):
+        self.client_1 = ClientFactory(name='EA')
+        self.physician = AccountFactory(client=self.client_1, role=RoleFactory(priority=RolePriority.PHYSICIAN.value))
+        self.product = ProductFactory(category=CategoryFactory(name='TAVR'), level=ProductLevel.ENTRY.value)
+        self.device = DeviceFactory(client=self.client_1, product=self.product)
+        self.rep_case = RepCaseFactory(client=self.client_1, physician=self.physician, procedure_date=date(2018, 6, 12))
+        self.key_fields = dict(client=self.client_1, physician=self.physician, category=self.product.category,
+                               manufacturer=self.product.manufacturer, level=self.product.level, cost_type=UNIT_COST)
+
+    def assert_rollups(self, *rollups):
+        self.assertCountEqual(
+            ItemRollup.objects.values_list('month', 'cost_type', 'units', 'spend', 'saving', 'priced_units',
+                                           'priced_spend'),
+            rollups
+        )
+
+    def test_to_string(self):
+        rollup = ItemRollup(month=date(2018, 6, 1), spend=Decimal(100), **self.key_fields)
+        self.assertEqual(str(rollup), 'TAVR - EA - June 2018: $100')
+
+    def test_incremental_item_rollup_updates(self):
+        item_1, item_2 = [ItemFactory(device=self.device, rep_case=self.rep_case, cost_type=UNIT_COST, cost=cost,
+                                      saving=10) for cost in (100, 0)]
+        self.assert_rollups((date(2018, 6, 1), UNIT_COST, 2, 100, 20, 1, 100))
+
+        item_2.cost = Decimal(300)
+        item_2.save()
+        self.assert_rollups((date(2018, 6, 1), UNIT_COST, 2, 400, 20, 2, 400))
+
+        item_1.cost_type = SYSTEM_COST
+        item_1.save()
+        self.assert_rollups((date(2018, 6, 1), UNIT_COST, 1, 300, 10, 1, 300),
+                            (date(2018, 6, 1), SYSTEM_COST, 1, 100, 10, 1, 100))
+
+        self.rep_case.procedure_date = date(2018, 7, 2)
+        self.rep_case.save()
+        self.assert_rollups((date(2018, 7, 1), UNIT_COST, 1, 300, 10, 1, 300),
+                            (date(2018, 7, 1), SYSTEM_COST, 1, 100, 10, 1, 100))
+
+        item_1.delete()
+        self.assert_rollups((date(2018, 7, 1), UNIT_COST, 1, 300, 10, 1, 300))
+
+        self.rep_case.delete()
+        self.assert_rollups()
+
+    def test_deferred_item_rollup_updates(self):
+        with ItemRollup.deferred():
+            ItemFactory.create_batch(3, device=self.device, rep_case=self.rep_case, cost_type=UNIT_COST, cost=100)
+            self.assert_rollups()
+
+        self.assertEqual(ItemRollup.flush(), 0)
+        self.assert_rollups((date(2018, 6, 1), UNIT_COST, 3, 300, 0, 3, 300))
+
+    def test_failed_or_discarded_scopes_drop_item_rollup_updates(self):
+        with ItemRollup.deferred():
+            with self.assertRaises(IntegrityError), transaction.atomic(), ItemRollup.deferred():
+                item = ItemFactory(device=self.device, rep_case=self.rep_case, cost_type=UNIT_COST, cost=100)
+                Item.objects.create(device=self.device, serial_number=item.serial_number)
+            with ItemRollup.deferred() as rollups:
+                sid = transaction.savepoint()
+                ItemFactory(device=self.device, rep_case=self.rep_case, cost_type=UNIT_COST, cost=100)
+                transaction.savepoint_rollback(sid)
+                rollups.discard()
+
+        self.assertEqual(ItemRollup.flush(), 0)
+        self.assert_rollups()
+
+    def test_product_changes_move_item_rollups(self):
+        ItemFactory(device=self.device, rep_case=self.rep_case, cost_type=UNIT_COST, cost=100)
+        self.product.level = ProductLevel.ADVANCED.value
+        self.product.save()
+        self.assertEqual(list(ItemRollup.objects.values_list('level', 'units')), [(ProductLevel.ADVANCED.value, 1)])
+
+    def test_rebuild(self):
+        ItemFactory.create_batch(2, device=self.device, rep_case=self.rep_case, cost_type=UNIT_COST, cost=100)
+        ItemFactory(device=self.device, rep_case=RepCaseFactory(procedure_date=date(2017, 1, 3)), cost=50)
+        ItemFactory(device=self.device, cost=70)
+        rollups = list(ItemRollup.objects.values_list(*ItemRollup.key_fields, 'units', 'spend').order_by('month'))
+        ItemRollup.objects.all().delete()
+
+        self.assertEqual(ItemRollup.rebuild(), 2)
+        self.assertEqual(
+            list(ItemRollup.objects.values_list(*ItemRollup.key_fields, 'units', 'spend').order_by('month')), rollups
+        )
+        self.assertEqual(ItemRollup.rebuild([self.client_1.id]), 1)
+        self.assertEqual(ItemRollup.objects.count(), 2)
@@ -7,6 +7,7 @@ from tablib import Dataset
 from device.factories import SpecialtyFactory, CategoryFactory
 from device.models import ProductLevel
 from hospital.factories import ClientFactory
+from tracker.factories import PurchasePriceFactory
 from neptune.settings.base import FIXTURE_DIR
 from price.models import UNIT_COST
 from tracker.models import PurchasePrice
@@ -32,3 +33,12 @@ class PurchasePriceResourceTestCase(TestCase):
         self.assertEqual(imported_purchase_price.level, ProductLevel.ENTRY.value)
         self.assertEqual(imported_purchase_price.cost_type, UNIT_COST)
         self.assertEqual(imported_purchase_price.avg, Decimal(123))
+
+    def test_iter_export(self):
+        PurchasePriceFactory.create_batch(3, category=self.category)
+        purchase_resource = PurchasePriceResource()
+        dataset = purchase_resource.export(PurchasePrice.objects.order_by('id'))
+
+        with self.assertNumQueries(1):
+            rows = list(purchase_resource.iter_export(PurchasePrice.objects.order_by('id')))
+        self.assertEqual(rows, [dataset.headers] + [list(row) for row in dataset])
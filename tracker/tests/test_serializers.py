@@ -0,0 +1,45 @@
+from datetime import date
+
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+
+from device.factories import ManufacturerFactory
+from hospital.constants import BULK_PURCHASE, CONSIGNMENT_PURCHASE
+from hospital.factories import ClientFactory, ItemFactory
+from hospital.models import Item
+from tracker.factories import RepCaseFactory
+from tracker.serializers import FastRepcaseItemSerializer, FastSavingsSerializer, RepcaseItemSerializer, \
+    SavingsSerializer
+
+
+class FastTrackerSerializersTestCase(TestCase):
+    def setUp(self):
+        self.client_1 = ClientFactory()
+        manufacturer = ManufacturerFactory(short_name=None)
+        items = [
+            ItemFactory(device__client=self.client_1, device__product__manufacturer=manufacturer,
+                        purchase_type=BULK_PURCHASE, is_used=True, cost=1000.25, saving=100.125),
+            ItemFactory(device__client=self.client_1, purchase_type=CONSIGNMENT_PURCHASE, is_used=True, cost=99.99,
+                        saving=0),
+        ]
+        RepCaseFactory(client=self.client_1, items=items[:1], procedure_date=date(2018, 5, 1))
+        RepCaseFactory(client=self.client_1, items=items[1:], procedure_date=date(2018, 6, 30))
+        ItemFactory(device__client=self.client_1, is_used=True, cost=0, saving=0,
+                    rep_case=RepCaseFactory(client=self.client_1, procedure_date=date(2018, 7, 2)))
+
+    def assertSameData(self, data, fast_data):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast_data), renderer.render(data))
+
+    def test_same_data_as_repcase_item_serializer(self):
+        items = self.client_1.items.order_by('id').select_related(
+            'rep_case__physician__user', 'device__product__manufacturer', 'device__product__category'
+        )
+        self.assertSameData(RepcaseItemSerializer(items, many=True).data,
+                            FastRepcaseItemSerializer(items, many=True).data)
+
+    def test_same_data_as_savings_serializer(self):
+        savings = list(Item.objects.used_by_client(self.client_1).savings_by_month(2018).order_by('month'))
+        self.assertEqual(len(savings), 3)
+        self.assertSameData(SavingsSerializer(savings, many=True).data,
+                            FastSavingsSerializer(savings, many=True).data)
@@ -0,0 +1,52 @@
+from decimal import Decimal
+from random import Random
+
+from django.test import SimpleTestCase
+
+from tracker.sketch import QuantileSketch
+
+
+class QuantileSketchTestCase(SimpleTestCase):
+    def setUp(self):
+        random = Random(42)
+        self.costs = sorted(Decimal(random.randint(5000, 500000)) / 100 for _ in range(1000))
+
+    def assert_quantiles(self, sketch, costs):
+        for q in (0.25, 0.5, 0.75):
+            exact = costs[int(q * (len(costs) - 1))]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), exact * Decimal('0.011'))
+
+    def test_quantiles_within_accuracy(self):
+        sketch = QuantileSketch()
+        for cost in self.costs:
+            sketch.add(cost)
+        self.assertEqual(sketch.count, 1000)
+        self.assert_quantiles(sketch, self.costs)
+        self.assertEqual(sketch.quantiles().keys(), {'p25', 'median', 'p75'})
+
+    def test_empty_sketch(self):
+        sketch = QuantileSketch.from_dict({})
+        self.assertEqual(sketch.count, 0)
+        self.assertIsNone(sketch.quantile(0.5))
+        sketch.add(Decimal(0))
+        self.assertEqual(sketch.count, 0)
+
+    def test_merge_and_remove(self):
+        sketch_1, sketch_2 = QuantileSketch(), QuantileSketch()
+        for index, cost in enumerate(self.costs):
+            (sketch_1 if index % 2 else sketch_2).add(cost)
+        merged_sketch = QuantileSketch.merged([sketch_1, QuantileSketch.from_dict(sketch_2.to_dict())])
+        self.assertEqual(merged_sketch.to_dict(), QuantileSketch.merged([sketch_2, sketch_1]).to_dict())
+        self.assert_quantiles(merged_sketch, self.costs)
+
+        for cost in self.costs[:500]:
+            merged_sketch.remove(cost)
+        self.assertTrue(merged_sketch.is_valid)
+        self.assert_quantiles(merged_sketch, self.costs[500:])
+
+        merged_sketch.remove(self.costs[0])
+        self.assertFalse(merged_sketch.is_valid)
+
+    def test_merge_requires_same_accuracy(self):
+        with self.assertRaises(ValueError):
+            QuantileSketch().merge(QuantileSketch(accuracy=0.02))
@@ -43,14 +43,31 @@ class PurchasePriceViewTestCase(APIViewTestCase):
     def test_get_method_return_purchased_unit_cost_aggregation(self):
         response = self.authorized_client.get(self.path)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertDictEqual(response.data, {'min': '1000.00', 'max': '1200.00', 'avg': '1100.00'})
+        self.assertDictEqual(response.data, {'min': '1000.00', 'max': '1200.00', 'avg': '1100.00',
+                                             'p25': None, 'median': None, 'p75': None})
 
     def test_get_method_return_purchased_system_cost_aggregation(self):
         path = reverse('api:hospital:tracker:app:purchase_price',
                        args=(self.client_1.id, self.category.id, 'advanced', 'system_cost'))
         response = self.authorized_client.get(path)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertDictEqual(response.data, {'min': '1200.00', 'max': '1400.00', 'avg': '1300.00'})
+        self.assertDictEqual(response.data, {'min': '1200.00', 'max': '1400.00', 'avg': '1300.00',
+                                             'p25': None, 'median': None, 'p75': None})
+
+    def test_get_method_return_benchmark_across_clients(self):
+        for client, cost in ((self.client_1, 1000), (ClientFactory(), 2000), (ClientFactory(), 3000)):
+            device = DeviceFactory(client=client, product=ProductFactory(category=self.category,
+                                                                         level=ProductLevel.ENTRY.value))
+            RepCaseFactory(procedure_date=datetime.utcnow().date(), items=[
+                ItemFactory(device=device, cost_type=UNIT_COST, cost=cost, is_used=True)
+            ])
+
+        response = self.authorized_client.get(self.path, {'benchmark': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertAlmostEqual(Decimal(response.data['median']), Decimal(1000), delta=10)
+        self.assertEqual(response.data['benchmark']['count'], 3)
+        self.assertAlmostEqual(Decimal(response.data['benchmark']['median']), Decimal(2000), delta=20)
+        self.assertNotIn('benchmark', self.authorized_client.get(self.path).data)
 
     def test_get_method_return_404_error(self):
         path = reverse('api:hospital:tracker:app:purchase_price',
@@ -67,13 +84,15 @@ class PurchasePriceViewTestCase(APIViewTestCase):
                        args=(self.client_1.id, self.category.id, 'advanced', 'unit_cost'))
         response = self.authorized_client.get(path)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertCountEqual(response.data, {'min': None, 'max': 0, 'avg': 0})
+        self.assertCountEqual(response.data, {'min': None, 'max': 0, 'avg': 0,
+                                              'p25': None, 'median': None, 'p75': None})
 
         path = reverse('api:hospital:tracker:app:purchase_price',
                        args=(self.client_1.id, self.category.id, 'entry', 'system_cost'))
         response = self.authorized_client.get(path)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertCountEqual(response.data, {'min': None, 'max': 0, 'avg': 0})
+        self.assertCountEqual(response.data, {'min': None, 'max': 0, 'avg': 0,
+                                              'p25': None, 'median': None, 'p75': None})
 
         entry = ProductLevel.ENTRY.value
         item_1 = ItemFactory(cost_type=SYSTEM_COST, cost=100, is_used=True,
@@ -90,7 +109,10 @@ class PurchasePriceViewTestCase(APIViewTestCase):
         self.assertCountEqual(response.data, {
             'min': '100.00',
             'max': '200.00',
-            'avg': '151.50'
+            'avg': '151.50',
+            'p25': '100.00',
+            'median': '100.00',
+            'p75': '203.00',
         })
 
 
@@ -161,7 +183,8 @@ class PhysicianAPPViewTestCase(APIViewTestCase):
         response = self.authorized_client.get(self.path)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertDictEqual(response.data, {
-            'client': {'id': self.client_1.id, 'name': self.client_1.name, 'min': None, 'max': '0.00', 'app': '0.00'},
+            'client': {'id': self.client_1.id, 'name': self.client_1.name, 'min': None, 'max': '0.00', 'app': '0.00',
+                       'p25': None, 'median': None, 'p75': None},
             'physician': None,
             'manufacturers': []
         })
@@ -209,6 +232,9 @@ class PhysicianAPPViewTestCase(APIViewTestCase):
                 'min': '90.00',
                 'max': '350.00',
                 'app': '180.00',
+                'p25': '90.00',
+                'median': '100.49',
+                'p75': '100.49',
             },
             'physician': {
                 'id': self.physician.id,
@@ -274,6 +300,14 @@ class PhysicianSavingViewTestCase(APIViewTestCase):
             'physician': Decimal('550.00'),
         })
 
+    def test_return_saving_in_one_query(self):
+        self.authorized_client.get(self.path)
+
+        with self.assertNumQueries(1):
+            response = self.authorized_client.get(self.path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[1]['client'], Decimal('550.00'))
+
     def test_return_empty_saving_with_procedure_date_in_previous_year(self):
         path = reverse('api:hospital:tracker:saving_by_date', args=(self.client_1.id, '2016-12'))
         response = self.authorized_client.get(path)
@@ -1,22 +1,22 @@
 from calendar import month_name
 from datetime import datetime
 
-from django.db.models import Sum
-from knox.auth import TokenAuthentication
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from api.authentication import CachedTokenAuthentication
 from device.constants import ProductLevel
 from device.models import Category
 from device.serializers import CategorySerializer
-from hospital.models import Client, Item
-from hospital.permissions import IsClientPhysician
+from hospital.models import Client
+from hospital.permissions import AuthorizationContext, IsClientPhysician
 from price.models import SYSTEM_COST, UNIT_COST
-from tracker.models import PurchasePrice
-from tracker.serializers import PurchasePriceSerializer, ClientAPPSerializer, PhysicianAPPSerializer, \
-    ManufacturerAPPSerializer, SavingSerializer
+from tracker.managers import period_window, physician_window
+from tracker.models import ItemRollup, PurchasePrice
+from tracker.serializers import BenchmarkSerializer, PurchasePriceSerializer, ClientAPPSerializer, \
+    PhysicianAPPSerializer, ManufacturerAPPSerializer, SavingSerializer
 
 
 class PurchasePriceMixin(object):
@@ -36,16 +36,25 @@ class PurchasePriceMixin(object):
 
 
 class PurchasePriceView(PurchasePriceMixin, APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated, IsClientPhysician)
 
     def get(self, request, client_id, category_id, level, cost):
+        """
+        Purchase prices of the current year, with ?benchmark=1 along with their quantiles across all clients
+        """
         purchase_price = self.get_purchase_price(client_id, category_id, level, cost)
-        return Response(PurchasePriceSerializer(purchase_price).data)
+        data = PurchasePriceSerializer(purchase_price).data
+        if request.query_params.get('benchmark'):
+            sketch = PurchasePrice.objects.filter(category=purchase_price.category, level=purchase_price.level,
+                                                  cost_type=purchase_price.cost_type,
+                                                  year=purchase_price.year).merged_sketch()
+            data['benchmark'] = BenchmarkSerializer(sketch).data
+        return Response(data)
 
 
 class PhysicianAPPView(PurchasePriceMixin, APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated, IsClientPhysician)
 
     def get(self, request, client_id, category_id, level, cost):
@@ -53,38 +62,36 @@ class PhysicianAPPView(PurchasePriceMixin, APIView):
         Get current physician APP analysis at a client, and break down by manufactures
         """
         purchase_price = self.get_purchase_price(client_id, category_id, level, cost)
-        physician = purchase_price.client.account_set.get(user=request.user)
-        items = Item.objects.filter(
-            device__product__category=purchase_price.category,
-            device__product__level=purchase_price.level,
+        physician = AuthorizationContext.for_user(request.user).get_account_or_404(client_id)
+        rollups = ItemRollup.objects.filter(
+            category=purchase_price.category,
+            level=purchase_price.level,
             cost_type=purchase_price.cost_type,
-            cost__gt=0
         ).used_by_physician(physician).used_in_period(purchase_price.year)
 
         try:
-            physician_app = PhysicianAPPSerializer(items.physician_app()[0]).data
+            physician_app = PhysicianAPPSerializer(rollups.physician_app(priced=True)[0]).data
         except IndexError:
             physician_app = None
 
         return Response({
             'client': ClientAPPSerializer(purchase_price).data,
             'physician': physician_app,
-            'manufacturers': ManufacturerAPPSerializer(items.marketshare(), many=True).data,
+            'manufacturers': ManufacturerAPPSerializer(rollups.marketshare(priced=True), many=True).data,
         })
 
 
 class PhysicianCategoryListView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated, IsClientPhysician)
 
     def get(self, request, client_id):
         """
         Get a list of categories of devices used by current physician at the client
         """
-        client = get_object_or_404(Client, pk=client_id)
-        physician = client.account_set.get(user=request.user)
+        physician = AuthorizationContext.for_user(request.user).get_account_or_404(client_id)
         categories = Category.objects.filter(
-            product__device__client=client,
+            product__device__client_id=client_id,
             product__device__item__is_used=True,
             product__device__item__rep_case__physician=physician
         ).distinct()
@@ -92,7 +99,7 @@ class PhysicianCategoryListView(APIView):
 
 
 class PhysicianSavingView(APIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated, IsClientPhysician)
 
     def get(self, request, client_id, procedure_date=''):
@@ -106,19 +113,27 @@ class PhysicianSavingView(APIView):
 
         month = procedure_time.month
         year = procedure_time.year
-        client = get_object_or_404(Client, pk=client_id)
-        physician = get_object_or_404(request.user.account_set, client=client)
-        client_annual_items = Item.objects.used_by_client(client).used_in_period(year)
-        client_monthly_items = client_annual_items.used_in_period(year, month)
-        physician_annual_items = client_annual_items.used_by_physician(physician)
+        physician = AuthorizationContext.for_user(request.user).get_account_or_404(client_id)
+        savings = ItemRollup.objects.used_by_client(client_id).used_in_period(year).saving_by_categories_windows({
+            'client_monthly': period_window(year, month),
+            'physician_monthly': period_window(year, month) & physician_window(physician),
+            'client_annual': period_window(year),
+            'physician_annual': physician_window(physician),
+        })
 
         return Response([{
             'name': f'{month_name[month]} {year} savings',
-            'client': client_monthly_items.aggregate(saving=Sum('saving'))['saving'],
-            'physician': client_monthly_items.used_by_physician(physician).aggregate(saving=Sum('saving'))['saving'],
+            'client': self.total_saving(savings['client_monthly']),
+            'physician': self.total_saving(savings['physician_monthly']),
         }, {
             'name': f'{year} savings',
-            'client': client_annual_items.aggregate(saving=Sum('saving'))['saving'],
-            'physician': physician_annual_items.aggregate(saving=Sum('saving'))['saving'],
-            'categories': SavingSerializer(physician_annual_items.saving_by_categories(), many=True).data
+            'client': self.total_saving(savings['client_annual']),
+            'physician': self.total_saving(savings['physician_annual']),
+            'categories': SavingSerializer(savings['physician_annual'], many=True).data
         }])
+
+    @staticmethod
+    def total_saving(category_savings):
+        savings = [category_saving['saving'] for category_saving in category_savings
+                   if category_saving['saving'] is not None]
+        return sum(savings) if savings else None